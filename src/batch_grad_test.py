@@ -1,24 +1,14 @@
 # batch_grad_test.py
-import os, re, json, csv, argparse, time, shutil, hashlib, datetime
+import os, re, sys, json, csv, argparse, time, shutil, hashlib, datetime
 from pathlib import Path
 from typing import List, Dict
 
 from PIL import Image
 from tqdm import tqdm
 
-# ---- Optional engines (use Vertex by default) ----
-try:
-    from vertexai import init as vertex_init
-    from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
-except Exception:
-    GenerativeModel = None
-
-try:
-    from google import genai
-    from google.genai import types as gtypes
-except Exception:
-    genai = None
-    gtypes = None
+# ---- Engines (shared with the web backend: pooled clients, retries, timing) ----
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "webapp" / "backend"))
+from app.engines import ENGINE_NAMES, ImagePart, RetryPolicy, create_engine
 
 CONTROL_SUFFIX = (
     "Use the provided 'Design Board' image ONLY as a reference for gown/hood/cap style and colors; "
@@ -63,61 +53,18 @@ def board_meta(p: Path):
     return uni, lvl
 
 # -------------- Engines --------------
-def ensure_vertex():
-    if GenerativeModel is None:
-        raise RuntimeError("Vertex AI not installed. pip install google-cloud-aiplatform vertexai")
-
-def ensure_genai():
-    if genai is None or gtypes is None:
-        raise RuntimeError("google-genai not installed. pip install google-genai")
-
-def mime_for(p: Path) -> str:
-    ext = p.suffix.lower()
-    if ext == ".png": return "image/png"
-    if ext == ".webp": return "image/webp"
-    return "image/jpeg"
-
-def call_vertex(project: str, location: str, model_name: str, selfie: Path, board: Path, prompt: str) -> bytes:
-    ensure_vertex()
-    vertex_init(project=project, location=location)
-    model = GenerativeModel(model_name)
-    parts = [
-        Part.from_data(mime_type=mime_for(selfie), data=selfie.read_bytes()),
-        Part.from_data(mime_type=mime_for(board),  data=board.read_bytes()),
-        prompt
-    ]
-    resp = model.generate_content(
-        parts,
-        generation_config=GenerationConfig(
-            response_modalities=["IMAGE"],
-            # temperature etc. can be added here to sweep
-        )
-    )
-    for cand in resp.candidates:
-        for prt in cand.content.parts:
-            if getattr(prt, "inline_data", None) and getattr(prt.inline_data, "data", None):
-                return prt.inline_data.data
-    raise RuntimeError("Vertex returned no image data")
-
-def call_genai(api_key: str, model: str, selfie: Path, board: Path, prompt: str) -> bytes:
-    ensure_genai()
-    client = genai.Client(api_key=api_key)
-    def part(p: Path):
-        return gtypes.Part.from_bytes(data=p.read_bytes(), mime_type=mime_for(p))
-    contents = [part(selfie), part(board), prompt]
-    resp = client.models.generate_content(
-        model=model,
-        contents=contents,
-        config=gtypes.GenerateContentConfig(response_modalities=["Image"])
-    )
-    cand = resp.candidates[0]
-    for prt in cand.content.parts:
-        inline = getattr(prt, "inline_data", None)
-        if inline and getattr(inline, "data", None):
-            return inline.data
-    if hasattr(resp, "binary") and resp.binary:
-        return resp.binary
-    raise RuntimeError("GenAI returned no image data")
+def make_engine(args):
+    if args.engine == "vertex":
+        if not args.vertex_project:
+            raise SystemExit("Vertex mode needs --vertex_project")
+        return create_engine("vertex", project=args.vertex_project, location=args.vertex_location,
+                             model="gemini-2.5-flash-image")
+    if args.engine == "genai":
+        api_key = os.getenv("GEMINI_API_KEY") or ""
+        if not api_key:
+            raise SystemExit("Set GEMINI_API_KEY for genai engine")
+        return create_engine("genai", api_key=api_key, model=args.genai_model)
+    return create_engine("stub")
 
 # -------------- Runner --------------
 def main():
@@ -126,7 +73,7 @@ def main():
     ap.add_argument("--prompts_file",  default="prompts.json")
     ap.add_argument("--boards_glob",   default="templates/*/*/board.png",
                     help="glob to find design boards (University/Level/board.png)")
-    ap.add_argument("--engine", choices=["vertex","genai"], default="vertex")
+    ap.add_argument("--engine", choices=list(ENGINE_NAMES), default="vertex")
     ap.add_argument("--vertex_project", default="", help="GCP project (Vertex)")
     ap.add_argument("--vertex_location", default="us-central1", help="GCP region (Vertex)")
     ap.add_argument("--genai_model", default="gemini-2.5-flash-image", help="Public Gemini model (if using genai)")
@@ -134,7 +81,10 @@ def main():
     ap.add_argument("--limit_portraits", type=int, default=0)
     ap.add_argument("--limit_prompts",  type=int, default=0)
     ap.add_argument("--limit_boards",   type=int, default=0)
+    ap.add_argument("--max_attempts",   type=int, default=4, help="attempts per image (transient errors)")
     args = ap.parse_args()
+    engine = make_engine(args)
+    policy = RetryPolicy(max_attempts=args.max_attempts)
 
     # Load prompts (enhanced)
     prompts = load_prompts(Path(args.prompts_file))
@@ -160,6 +110,7 @@ def main():
     # Iterate
     for board in tqdm(boards, desc="Boards"):
         uni, lvl = board_meta(board)
+        board_part = ImagePart.from_path(board)  # read once per board
         for selfie in tqdm(portraits, desc=f"{uni}__{lvl}", leave=False):
             # per-portrait folder under this board
             portrait_key = selfie.stem
@@ -180,23 +131,20 @@ def main():
                 meta = {
                     "university": uni, "level": lvl, "portrait": selfie.name,
                     "prompt_id": pid, "engine": args.engine,
-                    "model": args.genai_model if args.engine=="genai" else "gemini-2.5-flash-image",
+                    "model": engine.model,
                     "vertex_project": args.vertex_project, "vertex_location": args.vertex_location
                 }
                 (out_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
 
                 # Generate
                 try:
-                    if args.engine == "vertex":
-                        if not args.vertex_project:
-                            raise RuntimeError("Vertex mode needs --vertex_project")
-                        img_bytes = call_vertex(args.vertex_project, args.vertex_location,
-                                                "gemini-2.5-flash-image", selfie, board, prompt_text)
-                    else:
-                        api_key = os.getenv("GEMINI_API_KEY") or ""
-                        if not api_key:
-                            raise RuntimeError("Set GEMINI_API_KEY for genai engine")
-                        img_bytes = call_genai(api_key, args.genai_model, selfie, board, prompt_text)
+                    stats = {}
+                    started = time.monotonic()
+                    img_bytes = engine.generate_with_retries(
+                        [ImagePart.from_path(selfie), board_part, prompt_text],
+                        policy, stats=stats)
+                    meta.update(stats, seconds=round(time.monotonic() - started, 3))
+                    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
 
                     out_path = out_dir / "output.png"
                     out_path.write_bytes(img_bytes)
@@ -210,6 +158,9 @@ def main():
 
                 time.sleep(0.1)
     manifest.close()
+    timings = engine.timings.summary()
+    (run_dir / "engine_timings.json").write_text(json.dumps({"engine": args.engine, "model": engine.model, **timings}, indent=2), encoding="utf-8")
     print(f"\nDone. Review: {run_dir}\nCSV: {run_dir/'manifest.csv'}")
+    print(f"Engine {args.engine} ({engine.model}): {timings}")
 if __name__ == "__main__":
     main()
@@ -1,24 +1,13 @@
-import os, re, argparse, time, csv
+import os, re, sys, argparse, time, csv
 from pathlib import Path
 from typing import Optional, List
 
 from PIL import Image
 from tqdm import tqdm
 
-# ---- Public Gemini client (optional) ----
-try:
-    from google import genai
-    from google.genai import types as gtypes
-except Exception:
-    genai = None
-    gtypes = None
-
-# ---- Vertex AI (recommended) ----
-try:
-    from vertexai import init as vertex_init
-    from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
-except Exception:
-    GenerativeModel = None
+# ---- Engines (shared with the web backend: pooled clients, retries, timing) ----
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "webapp" / "backend"))
+from app.engines import ENGINE_NAMES, ImagePart, RetryPolicy, create_engine
 
 PROMPT_TEMPLATE = """You are a graphic designer. From the provided graduation photo(s), create ONE composite image (PNG, white background) formatted as a clean moodboard that contains only:
 - GOWN (robe) — isolated, background removed
@@ -68,97 +57,45 @@ def pick_sources(level_dir: Path) -> List[Path]:
         sources.append(set1)
     return sources
 
-# ------------------ google-genai path ------------------
-def genai_client():
-    if genai is None:
-        raise RuntimeError("google-genai is not installed. Try: pip install google-genai")
-    key = os.getenv("GEMINI_API_KEY")
-    if not key:
-        raise RuntimeError("Set GEMINI_API_KEY in your environment")
-    return genai.Client(api_key=key)
-
-def genai_part(p: Path):
-    if gtypes is None:
-        raise RuntimeError("google-genai types not available")
-    mime = "image/jpeg"
-    if p.suffix.lower() == ".png": mime = "image/png"
-    elif p.suffix.lower() == ".webp": mime = "image/webp"
-    return gtypes.Part.from_bytes(data=p.read_bytes(), mime_type=mime)
-
-def genai_make_board(client, model: str, images: List[Path], prompt: str) -> bytes:
-    contents = [genai_part(p) for p in images] + [prompt]
-    resp = client.models.generate_content(
-        model=model,
-        contents=contents,
-        config=gtypes.GenerateContentConfig(response_modalities=["Image"])
-    )
-    cand = resp.candidates[0]
-    for part in cand.content.parts:
-        inline = getattr(part, "inline_data", None)
-        if inline and getattr(inline, "data", None):
-            return inline.data
-    if hasattr(resp, "binary") and resp.binary:
-        return resp.binary
-    t = getattr(resp, "text", "") or ""
-    raise RuntimeError("No image bytes returned. " + (t[:200] + ("..." if len(t) > 200 else "")))
-
-# ------------------ Vertex AI path (recommended) ------------------
-def vertex_make_board(project: str, location: str, model_name: str, images: List[Path], prompt: str) -> bytes:
-    if GenerativeModel is None:
-        raise RuntimeError("vertexai is not installed. Try: pip install google-cloud-aiplatform vertexai")
-    vertex_init(project=project, location=location)
-    model = GenerativeModel(model_name)
-
-    parts = []
-    for p in images:
-        mime = "image/jpeg"
-        if p.suffix.lower() == ".png": mime = "image/png"
-        elif p.suffix.lower() == ".webp": mime = "image/webp"
-        parts.append(Part.from_data(mime_type=mime, data=p.read_bytes()))
-
-    resp = model.generate_content(
-        parts + [prompt],
-        generation_config=GenerationConfig(
-            response_mime_type=None,
-            response_modalities=["IMAGE"],
-        )
-    )
-    out_bytes = None
-    for cand in resp.candidates:
-        for prt in cand.content.parts:
-            if getattr(prt, "inline_data", None) and getattr(prt.inline_data, "data", None):
-                out_bytes = prt.inline_data.data
-                break
-        if out_bytes:
-            break
-    if not out_bytes:
-        t = getattr(resp, "text", "") or ""
-        raise RuntimeError("Vertex did not return image bytes. " + (t[:200] + ("..." if len(t) > 200 else "")))
-    return out_bytes
+# ------------------ engines ------------------
+def make_engine(args):
+    if args.engine == "vertex":
+        if not args.vertex_project:
+            raise RuntimeError("Vertex mode requires --vertex_project (and optionally --vertex_location)")
+        return create_engine("vertex", project=args.vertex_project, location=args.vertex_location,
+                             model=args.model)
+    if args.engine == "genai":
+        key = os.getenv("GEMINI_API_KEY")
+        if not key:
+            raise RuntimeError("Set GEMINI_API_KEY in your environment")
+        return create_engine("genai", api_key=key, model=args.model)
+    return create_engine("stub", size=(1600, 900))
+
+def make_board(engine, images: List[Path], prompt: str, policy: RetryPolicy) -> bytes:
+    contents = [ImagePart.from_path(p) for p in images] + [prompt]
+    return engine.generate_with_retries(contents, policy)
 
 # ------------------ pipeline ------------------
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in_root", default="output", help="Scraper output root")
     ap.add_argument("--out_root", default="templates", help="Where to write moodboards")
-    ap.add_argument("--engine", choices=["vertex","genai"], default="genai",
-                    help="'vertex' (recommended) or 'genai' (may be blocked in some regions)")
+    ap.add_argument("--engine", choices=list(ENGINE_NAMES), default="genai",
+                    help="'vertex' (recommended), 'genai' (may be blocked in some regions) or 'stub' (offline)")
     ap.add_argument("--model", default="gemini-2.5-flash-image", help="Model name")
     ap.add_argument("--vertex_project", default="", help="GCP project (Vertex mode)")
     ap.add_argument("--vertex_location", default="us-central1", help="GCP region (Vertex mode)")
     ap.add_argument("--only_uni", default="", help="Process only this university folder name")
     ap.add_argument("--only_level", choices=["Masters","Bachelors",""], default="", help="Process only this level")
     ap.add_argument("--pause", type=float, default=0.2)
+    ap.add_argument("--max_attempts", type=int, default=4, help="Attempts per board (transient errors)")
     args = ap.parse_args()
 
     in_root = Path(args.in_root)
     out_root = Path(args.out_root); out_root.mkdir(parents=True, exist_ok=True)
 
-    if args.engine == "genai":
-        client = genai_client()
-    else:
-        if not args.vertex_project:
-            raise RuntimeError("Vertex mode requires --vertex_project (and optionally --vertex_location)")
+    engine = make_engine(args)
+    policy = RetryPolicy(max_attempts=args.max_attempts)
 
     uni_dirs = [d for d in sorted(in_root.iterdir()) if d.is_dir()]
     if args.only_uni:
@@ -192,21 +129,7 @@ def main():
                 prompt = build_prompt(uni_dir.name, level)
 
                 try:
-                    if args.engine == "vertex":
-                        img_bytes = vertex_make_board(
-                            project=args.vertex_project,
-                            location=args.vertex_location,
-                            model_name=args.model,
-                            images=sources,
-                            prompt=prompt
-                        )
-                    else:
-                        img_bytes = genai_make_board(
-                            client=client,
-                            model=args.model,
-                            images=sources,
-                            prompt=prompt
-                        )
+                    img_bytes = make_board(engine, sources, prompt, policy)
                     out_png.write_bytes(img_bytes)
                     Image.open(out_png).load()  # sanity check
                     w.writerow([uni_dir.name, level, ";".join([p.name for p in sources]), str(out_png)])
@@ -216,6 +139,7 @@ def main():
                 time.sleep(args.pause)
 
     print(f"\nDone. Moodboards saved under: {out_root}\nManifest: {man_path}")
+    print(f"Engine {args.engine} ({engine.model}): {engine.timings.summary()}")
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,13 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.core.security import decode_access_token
+from app.core.security import decode_access_token, decode_stream_token
 from app.db.database import get_db
 from app.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 
 async def get_current_user(
@@ -62,3 +64,69 @@ async def get_current_active_user(
             detail="Inactive user"
         )
     return current_user
+
+
+async def get_current_superuser(
+    current_user: User = Depends(get_current_active_user)
+) -> User:
+    """Get the current user, who must be a superuser."""
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Superuser access required"
+        )
+    return current_user
+
+
+def _user_id_from_token(token: Optional[str]) -> int:
+    """User id (sub claim) of a valid access token."""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    payload = decode_access_token(token) if token else None
+    if payload is None:
+        raise credentials_exception
+
+    try:
+        return int(payload.get("sub"))
+    except (ValueError, TypeError):
+        raise credentials_exception
+
+
+async def get_current_user_id(
+    token: str = Depends(oauth2_scheme)
+) -> int:
+    """
+    Get the current user's id from the access token alone, without a
+    database lookup. For hot read-only endpoints: a user deactivated after
+    the token was issued keeps access until the token expires.
+    """
+    return _user_id_from_token(token)
+
+
+async def get_stream_user_id(
+    job_id: int,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    stream_token: Optional[str] = Query(None)
+) -> int:
+    """
+    Get the user id for a job's event stream: from the access token in the
+    Authorization header, or - for the browser's EventSource, which cannot
+    send headers - from a stream token for that job in the stream_token
+    query parameter. Stream tokens are short-lived and scoped to one job,
+    so the access token never has to go in a URL.
+    """
+    if token:
+        return _user_id_from_token(token)
+
+    user_id = decode_stream_token(stream_token, job_id) if stream_token else None
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
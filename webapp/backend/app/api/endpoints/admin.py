@@ -1,13 +1,18 @@
 """
 Admin endpoints for testing and account management
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.models.user import User
 from app.models.generation_job import GenerationJob
-from app.api.deps import get_current_active_user
-from pydantic import BaseModel
+from app.models.dead_letter import DeadLetter, DeadLetterStatus
+from app.api.deps import get_current_active_user, get_current_superuser
+from app.core.config import settings
+from app.services import dead_letters, stage_timings
+from app.tasks.queues import queue_depths
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -87,3 +92,102 @@ def reset_account_for_testing(
         new_state=new_state,
         generation_history=generation_history,
     )
+
+
+@router.get("/queues")
+def get_queue_depths(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    Messages waiting in each Celery queue, with the queue's priority and
+    worker pool settings. A growing waiting_per_worker means that pool
+    needs more workers.
+    """
+    return {"queues": queue_depths()}
+
+
+@router.get("/stage-timings")
+def get_stage_timings(
+    hours: int = Query(1, ge=1, le=settings.STAGE_TIMINGS_RETENTION_HOURS),
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    p50/p95/p99 of each image pipeline stage (download, build_request,
+    gemini, watermark, encode, upload, db_commit) over the last `hours`
+    hours, per stage and per stage, model and tier. Percentiles are
+    estimated from histogram buckets.
+    """
+    return stage_timings.report(hours)
+
+
+class ReplayDeadLettersRequest(BaseModel):
+    limit: int = Field(100, ge=1, le=10000)
+    concurrency: Optional[int] = Field(None, ge=1)  # Default DEAD_LETTER_REPLAY_CONCURRENCY
+    rate_per_minute: Optional[float] = Field(None, gt=0)  # Default DEAD_LETTER_REPLAY_RATE_PER_MINUTE
+    error_type: Optional[str] = None
+    letter_ids: Optional[List[int]] = None
+    dry_run: bool = False
+
+
+@router.get("/dead-letters")
+def list_dead_letters(
+    status_filter: Optional[DeadLetterStatus] = Query(DeadLetterStatus.PENDING, alias="status"),
+    error_type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_superuser),
+    db: Session = Depends(get_db)
+):
+    """
+    Images that failed for a retryable cause: counts per status and error
+    type, and the oldest letters matching the filters.
+    """
+    query = db.query(DeadLetter)
+    if status_filter is not None:
+        query = query.filter(DeadLetter.status == status_filter)
+    if error_type:
+        query = query.filter(DeadLetter.error_type == error_type)
+
+    items = [
+        {
+            "id": letter.id,
+            "image_id": letter.image_id,
+            "job_id": letter.job_id,
+            "user_id": letter.user_id,
+            "status": letter.status.value,
+            "fingerprint": letter.fingerprint,
+            "model": letter.model,
+            "tier": letter.tier,
+            "error_type": letter.error_type,
+            "error_message": letter.error_message,
+            "attempts": letter.attempts,
+            "failure_count": letter.failure_count,
+            "replay_count": letter.replay_count,
+            "created_at": letter.created_at,
+            "replayed_at": letter.replayed_at,
+        }
+        for letter in query.order_by(DeadLetter.created_at, DeadLetter.id).limit(limit)
+    ]
+    return {"counts": dead_letters.summary(db), "items": items}
+
+
+@router.post("/dead-letters/replay")
+def replay_dead_letters(
+    request: ReplayDeadLettersRequest,
+    current_user: User = Depends(get_current_superuser),
+    db: Session = Depends(get_db)
+):
+    """
+    Replay pending dead letters in bulk, e.g. after a Gemini outage. Runs
+    on a maintenance worker with bounded concurrency and dispatch rate;
+    poll the returned task, or GET /dead-letters, for progress.
+    """
+    from app.tasks.maintenance_tasks import replay_dead_letters as replay, replay_dead_letters_task
+
+    if request.dry_run:
+        return replay(db, request.limit, error_type=request.error_type,
+                      letter_ids=request.letter_ids, dry_run=True)
+
+    task = replay_dead_letters_task.delay(
+        request.limit, request.concurrency, request.rate_per_minute, request.error_type, request.letter_ids
+    )
+    return {"status": "queued", "task_id": task.id}
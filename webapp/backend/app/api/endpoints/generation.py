@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from pathlib import Path
 from datetime import datetime
 import uuid
-import shutil
 from typing import List
 
-from app.api.deps import get_current_active_user
+from app.api.deps import get_current_active_user, get_current_user_id, get_stream_user_id
+from app.core.security import create_stream_token
 from app.db.database import get_db
 from app.models import User, GenerationJob, GeneratedImage, CreditTransaction, TransactionType, JobStatus
 from app.schemas.generation import (
@@ -16,19 +17,42 @@ from app.schemas.generation import (
     GenerationJobResponse,
     JobStatusResponse
 )
+from app.services.board_catalog import board_catalog
+from app.services.circuit_breaker import gemini_circuit_breaker
 from app.services.generation_service import generation_service
+from app.services.image_preprocessing import ImagePreprocessingService
+from app.services.job_events import job_events, job_state
+from app.services.job_progress import reset_image_outcome
 from app.services.storage_service import storage_service
 from app.tasks.generation_tasks import process_single_generation, process_batch_generation
+from app.tasks.queues import tier_queue_options
 from app.core.config import settings
 
 router = APIRouter()
 
 
 @router.get("/universities")
-async def list_universities():
-    """List all available universities and degree levels."""
-    universities = generation_service.list_available_universities()
-    return {"universities": universities}
+async def list_universities(request: Request):
+    """
+    List all available universities and degree levels.
+
+    Served from the in-memory board catalog with an ETag, so clients and
+    the CDN can revalidate with If-None-Match and get a 304.
+    """
+    # Off the event loop, in case the catalog was not loaded at startup
+    catalog = await run_in_threadpool(board_catalog.snapshot)
+    etag = catalog.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.UNIVERSITIES_CACHE_MAX_AGE_SECONDS}"
+    }
+
+    # If-None-Match may list several tags, possibly weak (W/"...")
+    client_tags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in client_tags or "*" in client_tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return JSONResponse({"universities": catalog.universities}, headers=headers)
 
 
 @router.post("/single", response_model=GenerationJobResponse)
@@ -62,20 +86,9 @@ async def create_single_generation(
     file_ext = Path(file.filename).suffix
     unique_filename = f"{uuid.uuid4()}{file_ext}"
 
-    # Save to temporary location first
-    temp_dir = Path("/tmp/uploads") / str(current_user.id)
-    temp_dir.mkdir(parents=True, exist_ok=True)
-    temp_file_path = temp_dir / unique_filename
-
-    with temp_file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
     # Upload to storage (R2 or local)
     object_key = f"uploads/{current_user.id}/{unique_filename}"
-    storage_url = storage_service.upload_file(temp_file_path, object_key)
-
-    # Clean up temp file
-    temp_file_path.unlink(missing_ok=True)
+    storage_url = storage_service.upload_bytes(file.file, object_key)
 
     # Create job
     job = GenerationJob(
@@ -115,6 +128,7 @@ async def create_single_generation(
 
     db.commit()
     db.refresh(job)
+    job_events.publish(job)
 
     # Queue background task
     task = process_single_generation.delay(job.id)
@@ -165,24 +179,13 @@ async def create_batch_generation(
     db.flush()
 
     # Save uploaded files and create image entries
-    temp_dir = Path("/tmp/uploads") / str(current_user.id)
-    temp_dir.mkdir(parents=True, exist_ok=True)
-
     for file in files:
         file_ext = Path(file.filename).suffix
         unique_filename = f"{uuid.uuid4()}{file_ext}"
-        temp_file_path = temp_dir / unique_filename
-
-        # Save to temporary location
-        with temp_file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
 
         # Upload to storage (R2 or local)
         object_key = f"uploads/{current_user.id}/{unique_filename}"
-        storage_url = storage_service.upload_file(temp_file_path, object_key)
-
-        # Clean up temp file
-        temp_file_path.unlink(missing_ok=True)
+        storage_url = storage_service.upload_bytes(file.file, object_key)
 
         generated_image = GeneratedImage(
             job_id=job.id,
@@ -208,6 +211,7 @@ async def create_batch_generation(
 
     db.commit()
     db.refresh(job)
+    job_events.publish(job)
 
     # Queue background task
     task = process_batch_generation.delay(job.id)
@@ -252,42 +256,105 @@ async def get_job(
     return job
 
 
+async def _get_job_state(job_id: int, user_id: int, db: Session) -> dict:
+    """
+    A job's progress state from Redis, falling back to (and seeding Redis
+    from) the database. Raises 404 unless the job belongs to the user.
+    """
+    state = await job_events.read_state(job_id)
+    if state is None:
+        job = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.user_id == user_id
+        ).first()
+        if job:
+            state = job_state(job)
+            await job_events.seed_state(state)
+
+    if state is None or state["user_id"] != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return state
+
+
 @router.get("/jobs/{job_id}/status", response_model=JobStatusResponse)
 async def get_job_status(
     job_id: int,
-    current_user: User = Depends(get_current_active_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Get job status (for polling)."""
-    job = db.query(GenerationJob).filter(
-        GenerationJob.id == job_id,
-        GenerationJob.user_id == current_user.id
-    ).first()
+    """
+    Get job status (for polling).
 
-    if not job:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Job not found"
-        )
+    Answered from the progress state workers publish to Redis; the
+    database is only read for jobs Redis does not know (yet).
+    """
+    state = await _get_job_state(job_id, user_id, db)
 
     progress = 0.0
-    if job.total_images > 0:
-        progress = job.completed_images / job.total_images
+    if state["total_images"] > 0:
+        progress = state["completed_images"] / state["total_images"]
 
     message = None
-    if job.status == JobStatus.FAILED:
-        message = job.error_message
+    if state["status"] == JobStatus.FAILED.value:
+        message = state["error_message"] or None
 
     return JobStatusResponse(
-        job_id=job.id,
-        status=job.status,
+        job_id=state["job_id"],
+        status=state["status"],
         progress=progress,
-        completed_images=job.completed_images,
-        total_images=job.total_images,
+        completed_images=state["completed_images"],
+        total_images=state["total_images"],
         message=message
     )
 
 
+@router.post("/jobs/{job_id}/events/token")
+async def create_job_events_token(
+    job_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Issue a stream token for the job's event stream, to pass as
+    ?stream_token= (EventSource cannot set headers). It is valid for
+    JOB_EVENTS_TOKEN_EXPIRE_SECONDS and only for this job; fetch a new one
+    whenever the stream has to be reopened.
+    """
+    await _get_job_state(job_id, user_id, db)
+    return {
+        "stream_token": create_stream_token(user_id, job_id),
+        "expires_in": settings.JOB_EVENTS_TOKEN_EXPIRE_SECONDS
+    }
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: int,
+    request: Request,
+    user_id: int = Depends(get_stream_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream job progress as Server-Sent Events (use instead of polling).
+
+    Sends the current state, then an event per change - each with the ids
+    of the images that just finished - until the job completes or fails.
+    Authenticated by the access token header or, from a browser, by a
+    stream token from POST /jobs/{job_id}/events/token as ?stream_token=.
+    """
+    state = await _get_job_state(job_id, user_id, db)
+    db.close()  # Not needed while streaming
+
+    return StreamingResponse(
+        job_events.stream(state, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/results/{image_id}")
 async def download_result(
     image_id: int,
@@ -439,6 +506,15 @@ async def generate_with_tier(
             detail="Free tier already used. Please purchase premium tier to continue."
         )
 
+    # Fail fast while Gemini is down, before the tier is used up
+    retry_after = gemini_circuit_breaker.retry_after()
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Photo generation is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
     # Check if board exists
     board_path = generation_service.get_board_path(university, degree_level)
     if not board_path:
@@ -447,23 +523,24 @@ async def generate_with_tier(
             detail=f"Design board not found for {university} - {degree_level}"
         )
 
-    # Save uploaded file
-    file_ext = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-
-    temp_dir = Path("/tmp/uploads") / str(current_user.id)
-    temp_dir.mkdir(parents=True, exist_ok=True)
-    temp_file_path = temp_dir / unique_filename
+    # Normalise the upload once (orientation, metadata, size); every prompt,
+    # retry and regeneration of this job reuses the stored result. The image
+    # pass is CPU-bound, so it runs off the event loop
+    data = await file.read()
+    try:
+        normalized_bytes = await run_in_threadpool(ImagePreprocessingService.normalize_selfie, data)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
-    with temp_file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save uploaded file
+    unique_filename = f"{uuid.uuid4()}{ImagePreprocessingService.OUTPUT_EXTENSION}"
 
     # Upload to storage
     object_key = f"uploads/{current_user.id}/{unique_filename}"
-    storage_url = storage_service.upload_file(temp_file_path, object_key)
-
-    # Clean up temp file
-    temp_file_path.unlink(missing_ok=True)
+    storage_url = storage_service.upload_bytes(normalized_bytes, object_key)
 
     # Get prompts for tier
     prompts = generation_service.get_prompts_for_tier(tier, university, degree_level)
@@ -503,10 +580,12 @@ async def generate_with_tier(
 
     db.commit()
     db.refresh(job)
+    job_events.publish(job)
 
     # Queue background task
-    from app.tasks.generation_tasks import process_tier_generation
-    task = process_tier_generation.delay(job.id)
+    from app.tasks.generation_tasks import process_tier_generation, process_tier_generation_async
+    task_function = process_tier_generation_async if settings.GENERATION_ASYNC_ENABLED else process_tier_generation
+    task = task_function.apply_async((job.id,), **tier_queue_options(tier))
     job.celery_task_id = task.id
     db.commit()
 
@@ -588,22 +667,10 @@ async def retry_image_generation(
             detail="Job not found"
         )
 
-    # Reset image status
-    image.success = None  # Mark as pending
-    image.error_message = None
-    image.output_image_path = None
-    image.output_image_path_unwatermarked = None
-    image.processed_at = None
-
-    # Update job counters
-    if job.failed_images > 0:
-        job.failed_images -= 1
-
-    # If job was failed or completed, set back to processing
-    if job.status in [JobStatus.FAILED, JobStatus.COMPLETED]:
-        job.status = JobStatus.PROCESSING
-
+    # Reset image status (and the job's counters and status)
+    reset_image_outcome(db, image, job)
     db.commit()
+    job_events.publish(job)
 
     # Re-queue the single image generation task
     from app.tasks.generation_tasks import retry_single_image
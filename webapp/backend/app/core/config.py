@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional, Tuple
 
 
 class Settings(BaseSettings):
@@ -15,9 +15,145 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
     # Google Gemini
-    GEMINI_API_KEY: str
+    GEMINI_API_KEY: str = ""  # required when GENERATION_ENGINE=genai
     GEMINI_MODEL: str = "gemini-2.0-flash-exp"
 
+    # Generation engine: "genai" (Gemini API), "vertex" (Vertex AI) or "stub" (local, no network)
+    GENERATION_ENGINE: str = "genai"
+    VERTEX_PROJECT: str = ""
+    VERTEX_LOCATION: str = "us-central1"
+
+    # Stub engine for load testing (synthetic images, simulated latency and failures)
+    STUB_ENGINE_IMAGE_SIZE: str = "1024x1024"
+    STUB_ENGINE_LATENCY_DISTRIBUTION: str = "lognormal"  # fixed, uniform or lognormal
+    STUB_ENGINE_LATENCY_SECONDS: float = 8.0  # mean
+    STUB_ENGINE_LATENCY_STDDEV_SECONDS: float = 4.0
+    STUB_ENGINE_ERROR_RATE: float = 0.0  # share of calls failing with a retryable error
+    STUB_ENGINE_SEED: Optional[int] = None
+
+    # Cluster-wide Gemini rate limit (shared by all workers through REDIS_URL)
+    GEMINI_RATE_LIMIT_ENABLED: bool = True
+    GEMINI_RATE_LIMIT_RPM: int = 60
+    GEMINI_RATE_LIMIT_BURST: int = 10
+    GEMINI_MAX_IN_FLIGHT: int = 16
+    GEMINI_RATE_LIMIT_LEASE_SECONDS: int = 180  # in-flight slot expires if a worker dies holding it
+    GEMINI_RATE_LIMIT_MAX_WAIT_SECONDS: int = 300
+
+    # In-place retries for transient Gemini errors (429, 5xx, timeouts, empty responses)
+    GEMINI_RETRY_MAX_ATTEMPTS: int = 4  # per image, including the first call
+    GEMINI_RETRY_BASE_DELAY_SECONDS: float = 2.0
+    GEMINI_RETRY_MAX_DELAY_SECONDS: float = 30.0
+    GEMINI_RETRY_BUDGET_PER_JOB: int = 6  # retries shared by all images of a job
+
+    # Gemini circuit breaker (state shared through REDIS_URL)
+    GEMINI_BREAKER_ENABLED: bool = True
+    GEMINI_BREAKER_ERROR_RATE: float = 0.5  # open when this share of calls fails...
+    GEMINI_BREAKER_MIN_REQUESTS: int = 10  # ...out of at least this many...
+    GEMINI_BREAKER_WINDOW_SECONDS: int = 60  # ...within this window
+    GEMINI_BREAKER_OPEN_SECONDS: int = 60  # fail fast this long before probing
+    GEMINI_BREAKER_PROBE_TIMEOUT_SECONDS: int = 120
+
+    # Hedged Gemini requests (a second identical request for slow calls)
+    GEMINI_HEDGE_ENABLED: bool = False
+    GEMINI_HEDGE_PERCENTILE: float = 95.0  # hedge calls slower than this latency percentile
+    GEMINI_HEDGE_MAX_PER_MINUTE: int = 10  # cluster-wide cap on hedge requests
+    GEMINI_HEDGE_MIN_SAMPLES: int = 20  # latencies needed before hedging starts
+    GEMINI_HEDGE_WINDOW: int = 200  # recent latencies kept per worker process
+
+    # Content-addressed generation result cache (pointers in Redis, images in storage)
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    RESULT_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+
+    # Run each image of a tier job as its own task (chord); False = whole job in one task
+    TIER_JOB_CHORD_ENABLED: bool = True
+
+    # Job progress writes: image outcomes finishing within this window (or this many)
+    # are committed in one transaction with one counter update
+    JOB_PROGRESS_FLUSH_SECONDS: float = 2.0
+    JOB_PROGRESS_FLUSH_IMAGES: int = 5
+
+    # Job progress events: workers publish each job's state to a Redis hash (read by the
+    # status endpoint, kept this long after the last update) and a pub/sub channel
+    # (streamed by the SSE endpoint, with a keepalive comment every KEEPALIVE seconds and
+    # reconnects forced after STREAM_MAX seconds). Browsers connect with a job-scoped
+    # stream token, valid for TOKEN_EXPIRE seconds
+    JOB_EVENTS_STATE_TTL_SECONDS: int = 86400
+    JOB_EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    JOB_EVENTS_STREAM_MAX_SECONDS: int = 600
+    JOB_EVENTS_TOKEN_EXPIRE_SECONDS: int = 60
+
+    # Per-stage image timings: hourly histograms in Redis (GET /api/admin/stage-timings),
+    # kept this many hours
+    STAGE_TIMINGS_RETENTION_HOURS: int = 48
+
+    # Celery queues (premium, free, retry, maintenance), each with its own worker pool
+    # (python -m app.tasks.worker <queue>): message priority (Redis: 0 = highest),
+    # worker processes and prefetch multiplier
+    CELERY_PREMIUM_QUEUE_PRIORITY: int = 0
+    CELERY_PREMIUM_WORKER_CONCURRENCY: int = 4
+    CELERY_PREMIUM_WORKER_PREFETCH: int = 1
+    CELERY_FREE_QUEUE_PRIORITY: int = 6
+    CELERY_FREE_WORKER_CONCURRENCY: int = 2
+    CELERY_FREE_WORKER_PREFETCH: int = 1
+    CELERY_RETRY_QUEUE_PRIORITY: int = 3
+    CELERY_RETRY_WORKER_CONCURRENCY: int = 1
+    CELERY_RETRY_WORKER_PREFETCH: int = 1
+    CELERY_MAINTENANCE_QUEUE_PRIORITY: int = 9
+    CELERY_MAINTENANCE_WORKER_CONCURRENCY: int = 1
+    CELERY_MAINTENANCE_WORKER_PREFETCH: int = 4
+
+    # Generation tasks are acknowledged when they finish (acks_late); an unacknowledged task is
+    # redelivered after this long, so it must exceed the longest task and countdown
+    CELERY_VISIBILITY_TIMEOUT_SECONDS: int = 3600
+
+    # Stale-job reaper (Celery beat): PROCESSING jobs with no heartbeat for THRESHOLD and no
+    # task on any worker or in a queue get their unfinished images requeued, at most
+    # MAX_REQUEUES times
+    STALE_JOB_REAPER_INTERVAL_SECONDS: int = 300
+    STALE_JOB_THRESHOLD_SECONDS: int = 900
+    STALE_JOB_MAX_REQUEUES: int = 3
+    STALE_JOB_INSPECT_TIMEOUT_SECONDS: float = 5.0
+
+    # Dead letters: images that failed for a retryable cause, replayed in bulk by admins
+    # (scripts/replay_dead_letters.py, POST /api/admin/dead-letters/replay). At most
+    # MAX_REPLAYS per image; replays in flight, dispatches per minute; MAX_SECONDS bounds
+    # one replay task and must stay below CELERY_VISIBILITY_TIMEOUT_SECONDS
+    DEAD_LETTER_MAX_REPLAYS: int = 3
+    DEAD_LETTER_REPLAY_CONCURRENCY: int = 10
+    DEAD_LETTER_REPLAY_RATE_PER_MINUTE: float = 30.0
+    DEAD_LETTER_REPLAY_MAX_SECONDS: int = 1800
+
+    # Tier generation concurrency when TIER_JOB_CHORD_ENABLED is off (prompts of one job sent at once; 1 = sequential)
+    FREE_TIER_GENERATION_CONCURRENCY: int = 5
+    PREMIUM_TIER_GENERATION_CONCURRENCY: int = 5
+
+    # Async generation (google-genai aio client on one event loop per worker process);
+    # only used when TIER_JOB_CHORD_ENABLED is off, chord members hold one image each
+    GENERATION_ASYNC_ENABLED: bool = False
+    GEMINI_ASYNC_MAX_IN_FLIGHT: int = 32
+
+    # Design-board Part cache (per worker process)
+    BOARD_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    BOARD_CACHE_WARM_COUNT: int = 20  # most-used boards preloaded when a worker starts
+
+    # Storage download cache (per worker process, keyed by object key + ETag; 0 disables)
+    STORAGE_OBJECT_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+
+    # Selfie normalisation at upload time
+    SELFIE_MAX_LONG_EDGE: int = 1536
+    SELFIE_JPEG_QUALITY: int = 90
+
+    # University/board catalog (in memory, rebuilt when templates/ changes)
+    BOARD_CATALOG_REFRESH_SECONDS: int = 30  # how often to check templates/ for changes
+    UNIVERSITIES_CACHE_MAX_AGE_SECONDS: int = 300  # Cache-Control max-age for GET /universities
+
+    # Compact board variants to prefer over board.png, in order ("" = always use the PNG)
+    BOARD_VARIANT_PREFERENCE: str = "webp,jpg"
+
+    # Post-purchase unwatermarking (legacy images without an unwatermarked original)
+    UNWATERMARK_REGENERATION_BATCH_SIZE: int = 5
+
     # Stripe
     STRIPE_SECRET_KEY: str
     STRIPE_PUBLISHABLE_KEY: str
@@ -75,6 +211,30 @@ class Settings(BaseSettings):
     def allowed_origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
 
+    @property
+    def board_variant_extensions(self) -> List[str]:
+        return [f".{ext.strip().lstrip('.')}" for ext in self.BOARD_VARIANT_PREFERENCE.split(",") if ext.strip()]
+
+    @property
+    def stub_engine_image_size(self) -> Tuple[int, int]:
+        width, _, height = self.STUB_ENGINE_IMAGE_SIZE.lower().partition("x")
+        return int(width), int(height or width)
+
+    def generation_concurrency_for_tier(self, tier: str) -> int:
+        """Max number of prompts of a single tier job generated in parallel."""
+        if tier == "premium":
+            return max(1, self.PREMIUM_TIER_GENERATION_CONCURRENCY)
+        return max(1, self.FREE_TIER_GENERATION_CONCURRENCY)
+
+    def celery_queue_config(self, queue: str) -> dict:
+        """Priority, worker concurrency and prefetch multiplier of a Celery queue."""
+        prefix = f"CELERY_{queue.upper()}"
+        return {
+            "priority": getattr(self, f"{prefix}_QUEUE_PRIORITY"),
+            "concurrency": max(1, getattr(self, f"{prefix}_WORKER_CONCURRENCY")),
+            "prefetch": max(1, getattr(self, f"{prefix}_WORKER_PREFETCH")),
+        }
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,54 @@
+"""
+Shared Redis connection (the same REDIS_URL Celery uses)
+"""
+import os
+import threading
+from typing import Optional
+
+import redis
+import redis.asyncio
+
+from app.core.config import settings
+
+_lock = threading.Lock()
+_client: Optional[redis.Redis] = None
+_client_pid: Optional[int] = None
+_async_client: Optional[redis.asyncio.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    Return this process's Redis client.
+
+    Built lazily and rebuilt after a fork, so Celery prefork children never
+    share sockets with the parent.
+    """
+    global _client, _client_pid
+
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = redis.Redis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=5,
+                socket_connect_timeout=5,
+                health_check_interval=30,
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Return the asyncio Redis client, for the API's event loop (pub/sub
+    subscriptions held open by streaming endpoints).
+    """
+    global _async_client
+
+    with _lock:
+        if _async_client is None:
+            _async_client = redis.asyncio.Redis.from_url(
+                settings.REDIS_URL,
+                socket_connect_timeout=5,
+                health_check_interval=30,
+            )
+        return _async_client
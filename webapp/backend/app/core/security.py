@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
@@ -37,7 +37,38 @@ def decode_access_token(token: str) -> Optional[dict]:
         print(f"[DEBUG] Decoding token: {token[:50]}...")
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         print(f"[DEBUG] Token decoded successfully. Payload: {payload}")
-        return payload
     except JWTError as e:
         print(f"[DEBUG] Token decode failed: {e}")
         return None
+    # Scoped tokens (e.g. stream tokens) never pass as access tokens
+    if "type" in payload:
+        return None
+    return payload
+
+
+STREAM_TOKEN_TYPE = "job_events"
+
+
+def create_stream_token(user_id: int, job_id: int) -> str:
+    """
+    Create a short-lived token for one job's event stream. It goes in the
+    stream URL (EventSource cannot send headers), so unlike the access
+    token it may end up in access logs and browser history.
+    """
+    expire = datetime.now(timezone.utc) + timedelta(seconds=settings.JOB_EVENTS_TOKEN_EXPIRE_SECONDS)
+    payload = {"sub": str(user_id), "job": job_id, "type": STREAM_TOKEN_TYPE, "exp": expire}
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def decode_stream_token(token: str, job_id: int) -> Optional[int]:
+    """User id of a valid stream token for the job, or None."""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != STREAM_TOKEN_TYPE or payload.get("job") != job_id:
+        return None
+    try:
+        return int(payload.get("sub"))
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,69 @@
+# Generation engines shared by the web app and the research scripts in src/
+from app.engines.base import (
+    Contents,
+    EngineTimings,
+    GenerationEngine,
+    ImagePart,
+    extract_image,
+    mime_for,
+)
+from app.engines.retry import (
+    EmptyResponseError,
+    FatalGenerationError,
+    GenerationError,
+    RetryableGenerationError,
+    RetryBudget,
+    RetryPolicy,
+    SafetyBlockedError,
+    call_with_retries,
+    call_with_retries_async,
+    is_retryable,
+)
+
+
+def create_engine(name: str, **options) -> GenerationEngine:
+    """
+    Build an engine by name.
+
+    Args:
+        name: "genai", "vertex" or "stub"
+        **options: Passed to the engine (api_key, project, location, model, ...)
+
+    Returns:
+        GenerationEngine
+    """
+    # Imported here so a missing SDK only matters for the engine that needs it
+    if name == "genai":
+        from app.engines.genai_engine import GenAIEngine
+        return GenAIEngine(**options)
+    if name == "vertex":
+        from app.engines.vertex_engine import VertexEngine
+        return VertexEngine(**options)
+    if name == "stub":
+        from app.engines.stub_engine import StubEngine
+        return StubEngine(**options)
+    raise ValueError(f"Unknown generation engine: {name}")
+
+
+ENGINE_NAMES = ("genai", "vertex", "stub")
+
+__all__ = [
+    "Contents",
+    "EngineTimings",
+    "GenerationEngine",
+    "ImagePart",
+    "extract_image",
+    "mime_for",
+    "EmptyResponseError",
+    "FatalGenerationError",
+    "GenerationError",
+    "RetryableGenerationError",
+    "RetryBudget",
+    "RetryPolicy",
+    "SafetyBlockedError",
+    "call_with_retries",
+    "call_with_retries_async",
+    "is_retryable",
+    "create_engine",
+    "ENGINE_NAMES",
+]
@@ -0,0 +1,201 @@
+"""
+Generation engine interface.
+
+An engine turns a list of contents (ImageParts and prompt strings) into the
+bytes of one generated image. Engines own their client, the conversion to
+the SDK's native parts and the response extraction; timing is recorded for
+every call, and retries are available through generate_with_retries().
+
+Engines do not read app settings, so the research scripts in src/ use the
+same code as the web app.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+from app.engines.retry import (
+    BLOCKED_FINISH_REASONS,
+    EmptyResponseError,
+    RetryBudget,
+    RetryPolicy,
+    SafetyBlockedError,
+    call_with_retries,
+    call_with_retries_async,
+)
+
+
+def mime_for(path: Path) -> str:
+    """Get MIME type for image file."""
+    ext = Path(path).suffix.lower()
+    if ext == ".png":
+        return "image/png"
+    if ext == ".webp":
+        return "image/webp"
+    return "image/jpeg"
+
+
+@dataclass(frozen=True)
+class ImagePart:
+    """An input image, independent of any SDK."""
+
+    data: bytes
+    mime_type: str
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path]) -> "ImagePart":
+        path = Path(path)
+        return cls(data=path.read_bytes(), mime_type=mime_for(path))
+
+
+Contents = Sequence[Union[ImagePart, str]]
+
+
+def extract_image(resp) -> bytes:
+    """
+    Extract image bytes from a Gemini response (google-genai and Vertex AI
+    responses have the same shape).
+
+    Raises:
+        SafetyBlockedError: The request was refused (not retryable)
+        EmptyResponseError: No candidates or no image data (retryable)
+    """
+    if not getattr(resp, "candidates", None):
+        block_reason = getattr(getattr(resp, "prompt_feedback", None), "block_reason", None)
+        if block_reason:
+            raise SafetyBlockedError(f"Gemini blocked the request: {block_reason}")
+        raise EmptyResponseError("Gemini API returned no candidates")
+
+    cand = resp.candidates[0]
+    finish_reason = str(getattr(cand, "finish_reason", "") or "")
+    if any(reason in finish_reason for reason in BLOCKED_FINISH_REASONS):
+        raise SafetyBlockedError(f"Gemini blocked the request: {finish_reason}")
+
+    parts = getattr(getattr(cand, "content", None), "parts", None) or []
+    for prt in parts:
+        inline = getattr(prt, "inline_data", None)
+        if inline and getattr(inline, "data", None):
+            return inline.data
+
+    if hasattr(resp, "binary") and resp.binary:
+        return resp.binary
+
+    text = ""
+    try:
+        text = getattr(resp, "text", "") or ""
+    except Exception:
+        pass
+    raise EmptyResponseError("Gemini API returned no image data" + (f": {text[:200]}" if text else ""))
+
+
+class EngineTimings:
+    """Latencies of an engine's recent calls. Thread-safe."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self._samples.append(seconds)
+            else:
+                self.errors += 1
+
+    def summary(self) -> dict:
+        """Call counts and latency percentiles of successful calls."""
+        with self._lock:
+            samples = sorted(self._samples)
+            calls, errors = self.calls, self.errors
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))], 3)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "mean": round(sum(samples) / len(samples), 3) if samples else None,
+            "p50": pct(50),
+            "p95": pct(95),
+            "p99": pct(99),
+            "max": round(samples[-1], 3) if samples else None,
+        }
+
+
+class GenerationEngine:
+    """Base class for generation engines."""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+        self.timings = EngineTimings()
+
+    def _generate(self, contents: list) -> bytes:
+        raise NotImplementedError
+
+    async def _generate_async(self, contents: list) -> bytes:
+        # Engines without a native async client run the sync call in a thread
+        return await asyncio.to_thread(self._generate, contents)
+
+    def generate(self, contents: Contents) -> bytes:
+        """
+        One call, no retries.
+
+        Args:
+            contents: ImageParts and prompt strings, in request order
+
+        Returns:
+            bytes: Generated image data
+        """
+        started = time.monotonic()
+        try:
+            image_bytes = self._generate(list(contents))
+        except Exception:
+            self.timings.record(time.monotonic() - started, ok=False)
+            raise
+        self.timings.record(time.monotonic() - started, ok=True)
+        return image_bytes
+
+    async def generate_async(self, contents: Contents) -> bytes:
+        """Async version of generate()."""
+        started = time.monotonic()
+        try:
+            image_bytes = await self._generate_async(list(contents))
+        except Exception:
+            self.timings.record(time.monotonic() - started, ok=False)
+            raise
+        self.timings.record(time.monotonic() - started, ok=True)
+        return image_bytes
+
+    def generate_with_retries(
+        self,
+        contents: Contents,
+        policy: RetryPolicy = RetryPolicy(),
+        budget: Optional[RetryBudget] = None,
+        stats: Optional[dict] = None
+    ) -> bytes:
+        """generate() with retries of transient errors."""
+        return call_with_retries(lambda: self.generate(contents), policy, budget, stats)
+
+    async def generate_with_retries_async(
+        self,
+        contents: Contents,
+        policy: RetryPolicy = RetryPolicy(),
+        budget: Optional[RetryBudget] = None,
+        stats: Optional[dict] = None
+    ) -> bytes:
+        """Async version of generate_with_retries()."""
+        return await call_with_retries_async(lambda: self.generate_async(contents), policy, budget, stats)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(model={self.model!r})"
@@ -0,0 +1,79 @@
+"""
+Public Gemini API engine (google-genai).
+"""
+import os
+import threading
+
+from app.engines.base import GenerationEngine, ImagePart, extract_image
+
+try:
+    from google import genai
+    from google.genai import types as gtypes
+except Exception:
+    genai = None
+    gtypes = None
+
+# One client per API key and process: clients hold connection pools, and
+# forked workers must not share the parent's sockets
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_genai_client(api_key: str):
+    """Return this process's pooled google-genai client for an API key."""
+    if genai is None or gtypes is None:
+        raise RuntimeError("google-genai not installed. pip install google-genai")
+
+    key = (os.getpid(), api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            _clients[key] = client
+        return client
+
+
+class GenAIEngine(GenerationEngine):
+    """Gemini through the public API (GEMINI_API_KEY)."""
+
+    name = "genai"
+
+    def __init__(self, api_key: str, model: str = "gemini-2.5-flash-image"):
+        if genai is None or gtypes is None:
+            raise RuntimeError("google-genai not installed. pip install google-genai")
+        if not api_key:
+            raise RuntimeError("Set GEMINI_API_KEY for the genai engine")
+        super().__init__(model)
+        self.api_key = api_key
+
+    @property
+    def client(self):
+        return get_genai_client(self.api_key)
+
+    @staticmethod
+    def _native(contents: list) -> list:
+        return [
+            gtypes.Part.from_bytes(data=item.data, mime_type=item.mime_type)
+            if isinstance(item, ImagePart) else item
+            for item in contents
+        ]
+
+    @staticmethod
+    def _config():
+        return gtypes.GenerateContentConfig(response_modalities=["Image"])
+
+    def _generate(self, contents: list) -> bytes:
+        resp = self.client.models.generate_content(
+            model=self.model,
+            contents=self._native(contents),
+            config=self._config()
+        )
+        return extract_image(resp)
+
+    async def _generate_async(self, contents: list) -> bytes:
+        resp = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=self._native(contents),
+            config=self._config()
+        )
+        return extract_image(resp)
@@ -0,0 +1,216 @@
+"""
+Error classification and retry policy for model calls.
+
+Transient failures (429, 5xx, timeouts, empty responses) are retried in
+place with exponential backoff and full jitter, optionally under a retry
+budget shared by several calls. Everything else (safety blocks, bad
+requests) fails immediately.
+"""
+import asyncio
+import functools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+
+class GenerationError(RuntimeError):
+    """Base class for classified generation failures."""
+
+
+class RetryableGenerationError(GenerationError):
+    """Transient failure worth retrying."""
+
+
+class FatalGenerationError(GenerationError):
+    """Failure that will not go away by retrying the same request."""
+
+
+class EmptyResponseError(RetryableGenerationError):
+    """The model answered without candidates or image data."""
+
+
+class SafetyBlockedError(FatalGenerationError):
+    """The model refused the request on safety grounds."""
+
+
+# Candidate finish reasons that mean the request was refused
+BLOCKED_FINISH_REASONS = ("SAFETY", "PROHIBITED_CONTENT", "BLOCKLIST", "SPII", "IMAGE_SAFETY", "RECITATION")
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+@functools.lru_cache(maxsize=None)
+def _sdk_error_types() -> tuple:
+    """
+    (API errors carrying a status code, transport errors) of the installed
+    SDKs. Imported on first use: the SDKs are slow to import, and processes
+    that never call a model should not pay for them.
+    """
+    api_errors = []
+    transport_errors = []
+    try:
+        from google.genai import errors as genai_errors
+        api_errors.append(genai_errors.APIError)
+    except Exception:
+        pass
+    try:
+        # Vertex AI errors
+        from google.api_core import exceptions as api_core_errors
+        api_errors.append(api_core_errors.GoogleAPICallError)
+    except Exception:
+        pass
+    try:
+        import httpx
+        transport_errors.extend([httpx.TimeoutException, httpx.TransportError])
+    except Exception:
+        pass
+    return tuple(api_errors), tuple(transport_errors)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Classify an exception raised by a model call."""
+    if isinstance(error, RetryableGenerationError):
+        return True
+    if isinstance(error, FatalGenerationError):
+        return False
+
+    api_errors, transport_errors = _sdk_error_types()
+    if api_errors and isinstance(error, api_errors):
+        code = getattr(error, "code", None)
+        return code in RETRYABLE_STATUS_CODES or (code is not None and code >= 500)
+
+    if transport_errors and isinstance(error, transport_errors):
+        return True
+
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and how long to retry one call."""
+
+    max_attempts: int = 4  # including the first call
+    base_delay: float = 2.0
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt` (1-based), full jitter."""
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, cap)
+
+
+class RetryBudget:
+    """
+    Retries shared by several calls (e.g. every image of one job), so a
+    failing backend cannot multiply the number of calls without limit.
+    Thread-safe.
+    """
+
+    def __init__(self, max_retries: int):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; False if it is exhausted."""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+class _Attempts:
+    """Bookkeeping shared by the sync and async retry loops."""
+
+    def __init__(self, policy: RetryPolicy, budget: Optional[RetryBudget], stats: Optional[dict]):
+        self.policy = policy
+        self.budget = budget
+        self.stats = stats
+        self.attempt = 0
+        self.first_failure = None
+        self.last_error = None
+
+    def should_retry(self, error: Exception) -> bool:
+        if not is_retryable(error) or self.attempt >= self.policy.max_attempts:
+            return False
+        if self.budget is not None and not self.budget.try_spend():
+            return False
+        self.first_failure = self.first_failure or time.monotonic()
+        self.last_error = error
+        return True
+
+    def record(self) -> None:
+        """Fill the caller's stats dict with attempt counts and retry time."""
+        if self.stats is None:
+            return
+        self.stats["attempts"] = self.attempt
+        self.stats["retry_seconds"] = (
+            round(time.monotonic() - self.first_failure, 3) if self.first_failure else 0.0
+        )
+        if self.last_error is not None:
+            self.stats["last_retry_error"] = f"{type(self.last_error).__name__}: {self.last_error}"[:500]
+
+
+def call_with_retries(
+    fn: Callable[[], bytes],
+    policy: RetryPolicy = RetryPolicy(),
+    budget: Optional[RetryBudget] = None,
+    stats: Optional[dict] = None,
+    on_retry: Optional[Callable[[int, Exception, float], None]] = None
+) -> bytes:
+    """
+    Call fn until it succeeds, retrying retryable errors.
+
+    Args:
+        fn: The call to make
+        policy: Attempts and backoff
+        budget: Retries shared with other calls (optional)
+        stats: Dict filled with attempts / retry_seconds (optional)
+        on_retry: Called with (attempt, error, delay) before each wait (optional)
+
+    Returns:
+        Whatever fn returned
+    """
+    attempts = _Attempts(policy, budget, stats)
+    while True:
+        attempts.attempt += 1
+        try:
+            result = fn()
+            attempts.record()
+            return result
+        except Exception as e:
+            if not attempts.should_retry(e):
+                attempts.record()
+                raise
+            delay = policy.delay(attempts.attempt)
+            if on_retry is not None:
+                on_retry(attempts.attempt, e, delay)
+            time.sleep(delay)
+
+
+async def call_with_retries_async(
+    fn: Callable[[], Awaitable[bytes]],
+    policy: RetryPolicy = RetryPolicy(),
+    budget: Optional[RetryBudget] = None,
+    stats: Optional[dict] = None,
+    on_retry: Optional[Callable[[int, Exception, float], None]] = None
+) -> bytes:
+    """Async version of call_with_retries; fn returns an awaitable."""
+    attempts = _Attempts(policy, budget, stats)
+    while True:
+        attempts.attempt += 1
+        try:
+            result = await fn()
+            attempts.record()
+            return result
+        except Exception as e:
+            if not attempts.should_retry(e):
+                attempts.record()
+                raise
+            delay = policy.delay(attempts.attempt)
+            if on_retry is not None:
+                on_retry(attempts.attempt, e, delay)
+            await asyncio.sleep(delay)
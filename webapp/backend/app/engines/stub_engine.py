@@ -0,0 +1,127 @@
+"""
+Local stub engine: no network, no quota.
+
+Returns a synthetic PNG after a simulated latency, and fails a configurable
+share of calls with a retryable error. The image is picked by a hash of the
+request, so identical requests get identical images; with a seed the
+latencies and failures are reproducible too. Used for load testing the
+pipeline (GENERATION_ENGINE=stub) and as a baseline when benchmarking
+engines.
+"""
+import asyncio
+import hashlib
+import io
+import math
+import random
+import threading
+import time
+
+from PIL import Image
+
+from app.engines.base import GenerationEngine, ImagePart
+from app.engines.retry import RetryableGenerationError
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class StubEngine(GenerationEngine):
+    """Engine that fabricates an image locally."""
+
+    name = "stub"
+    VARIANTS = 8  # distinct images returned, picked by a hash of the request
+
+    def __init__(
+        self,
+        model: str = "stub",
+        latency: float = 0.0,
+        latency_stddev: float = 0.0,
+        latency_distribution: str = "fixed",
+        error_rate: float = 0.0,
+        size: tuple = (1024, 1024),
+        seed: int = None
+    ):
+        """
+        Args:
+            model: Model name reported by the engine
+            latency: Mean simulated latency in seconds
+            latency_stddev: Spread of the latency (uniform and lognormal)
+            latency_distribution: "fixed", "uniform" or "lognormal"
+            error_rate: Share of calls (0-1) that fail with a retryable error
+            size: (width, height) of the returned image
+            seed: Seed for latencies and failures (optional)
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        super().__init__(model)
+        self.latency = latency
+        self.latency_stddev = latency_stddev
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.size = size
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._variants = {}
+        self._variants_lock = threading.Lock()
+
+    def _sample(self) -> tuple:
+        """Draw (latency, fails) for one call."""
+        with self._random_lock:
+            fails = self._random.random() < self.error_rate
+            if self.latency <= 0:
+                return 0.0, fails
+            if self.latency_distribution == "uniform":
+                latency = self._random.uniform(self.latency - self.latency_stddev,
+                                               self.latency + self.latency_stddev)
+            elif self.latency_distribution == "lognormal" and self.latency_stddev > 0:
+                # Parameters chosen so the samples have the requested mean and stddev
+                sigma2 = math.log(1 + (self.latency_stddev / self.latency) ** 2)
+                latency = self._random.lognormvariate(math.log(self.latency) - sigma2 / 2, math.sqrt(sigma2))
+            else:
+                latency = self.latency
+        return max(0.0, latency), fails
+
+    def _render(self, contents: list) -> bytes:
+        digest = hashlib.sha256()
+        for item in contents:
+            digest.update(item.data if isinstance(item, ImagePart) else str(item).encode("utf-8"))
+        variant = digest.digest()[0] % self.VARIANTS
+
+        # Encoding a photo-sized PNG costs real CPU, which would skew the
+        # simulated latency under load, so each variant is rendered once
+        with self._variants_lock:
+            image_bytes = self._variants.get(variant)
+            if image_bytes is None:
+                image_bytes = self._render_variant(variant)
+                self._variants[variant] = image_bytes
+        return image_bytes
+
+    def _render_variant(self, variant: int) -> bytes:
+        # Upscaled noise tile: compresses about as well as a real photo, so
+        # storage and watermarking see realistic sizes
+        width, height = self.size
+        tile_size = (max(1, width // 8), max(1, height // 8))
+        tile_bytes = random.Random(variant).randbytes(tile_size[0] * tile_size[1] * 3)
+        image = Image.frombytes("RGB", tile_size, tile_bytes).resize(self.size, Image.BILINEAR)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def _generate(self, contents: list) -> bytes:
+        started = time.monotonic()
+        latency, fails = self._sample()
+        image_bytes = None if fails else self._render(contents)
+        # Rendering counts towards the simulated latency
+        time.sleep(max(0.0, latency - (time.monotonic() - started)))
+        if fails:
+            raise RetryableGenerationError("Stub engine: simulated transient failure")
+        return image_bytes
+
+    async def _generate_async(self, contents: list) -> bytes:
+        started = time.monotonic()
+        latency, fails = self._sample()
+        image_bytes = None if fails else await asyncio.to_thread(self._render, contents)
+        await asyncio.sleep(max(0.0, latency - (time.monotonic() - started)))
+        if fails:
+            raise RetryableGenerationError("Stub engine: simulated transient failure")
+        return image_bytes
@@ -0,0 +1,77 @@
+"""
+Vertex AI engine (google-cloud-aiplatform).
+"""
+import os
+import threading
+
+from app.engines.base import GenerationEngine, ImagePart, extract_image
+
+try:
+    from vertexai import init as vertex_init
+    from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
+except Exception:
+    GenerativeModel = None
+
+# vertexai.init() is global; run it once per (process, project, location)
+# and reuse model objects instead of rebuilding them for every call
+_initialized = set()
+_models = {}
+_lock = threading.Lock()
+
+
+def get_vertex_model(project: str, location: str, model_name: str):
+    """Return this process's pooled Vertex AI model."""
+    if GenerativeModel is None:
+        raise RuntimeError("Vertex AI not installed. pip install google-cloud-aiplatform vertexai")
+
+    pid = os.getpid()
+    with _lock:
+        if (pid, project, location) not in _initialized:
+            vertex_init(project=project, location=location)
+            _initialized.add((pid, project, location))
+
+        key = (pid, project, location, model_name)
+        model = _models.get(key)
+        if model is None:
+            model = GenerativeModel(model_name)
+            _models[key] = model
+        return model
+
+
+class VertexEngine(GenerationEngine):
+    """Gemini through Vertex AI (application default credentials)."""
+
+    name = "vertex"
+
+    def __init__(self, project: str, location: str = "us-central1", model: str = "gemini-2.5-flash-image"):
+        if GenerativeModel is None:
+            raise RuntimeError("Vertex AI not installed. pip install google-cloud-aiplatform vertexai")
+        if not project:
+            raise RuntimeError("The vertex engine needs a GCP project")
+        super().__init__(model)
+        self.project = project
+        self.location = location
+
+    @property
+    def client(self):
+        return get_vertex_model(self.project, self.location, self.model)
+
+    @staticmethod
+    def _native(contents: list) -> list:
+        return [
+            Part.from_data(mime_type=item.mime_type, data=item.data)
+            if isinstance(item, ImagePart) else item
+            for item in contents
+        ]
+
+    @staticmethod
+    def _config():
+        return GenerationConfig(response_modalities=["IMAGE"])
+
+    def _generate(self, contents: list) -> bytes:
+        resp = self.client.generate_content(self._native(contents), generation_config=self._config())
+        return extract_image(resp)
+
+    async def _generate_async(self, contents: list) -> bytes:
+        resp = await self.client.generate_content_async(self._native(contents), generation_config=self._config())
+        return extract_image(resp)
@@ -1,9 +1,12 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
 from app.api.endpoints import auth, users, generation, payments, oauth, referrals, admin
 from app.db.database import Base, engine
+from app.services.board_catalog import board_catalog
 # from app.db.migrations import run_migrations  # Disabled: migrations run in start.sh
 import os
 
@@ -20,10 +23,19 @@ import os
 # except Exception as e:
 #     print(f"Migration warning: {e}")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reading and hashing every board takes a while; do it before serving
+    await run_in_threadpool(board_catalog.load)
+    yield
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    description="API for GradGen - AI-powered graduation portrait generation"
+    description="API for GradGen - AI-powered graduation portrait generation",
+    lifespan=lifespan
 )
 
 # CORS middleware
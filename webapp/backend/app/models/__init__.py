@@ -6,6 +6,7 @@ from app.models.payment import Payment, PaymentStatus
 from app.models.email_verification import EmailVerificationToken
 from app.models.promo_code import PromoCode
 from app.models.referral import Referral, ReferralStatus
+from app.models.dead_letter import DeadLetter, DeadLetterStatus
 
 __all__ = [
     "User",
@@ -20,4 +21,6 @@ __all__ = [
     "PromoCode",
     "Referral",
     "ReferralStatus",
+    "DeadLetter",
+    "DeadLetterStatus",
 ]
@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.database import Base
+import enum
+
+
+class DeadLetterStatus(str, enum.Enum):
+    PENDING = "pending"  # Waiting to be replayed
+    REPLAYING = "replaying"  # Replay queued or running
+    REPLAYED = "replayed"  # Replay succeeded
+    EXHAUSTED = "exhausted"  # Failed for good (fatal error, or out of replays)
+
+
+class DeadLetter(Base):
+    """An image that failed for a retryable cause, kept so it can be replayed in bulk"""
+    __tablename__ = "dead_letters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    image_id = Column(Integer, ForeignKey("generated_images.id"), unique=True, nullable=False)  # One per image
+    job_id = Column(Integer, ForeignKey("generation_jobs.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(Enum(DeadLetterStatus), default=DeadLetterStatus.PENDING, index=True)
+
+    # The request: result-cache fingerprint (sha256 of selfie, board, prompt, model) and its inputs
+    fingerprint = Column(String(64), index=True)
+    model = Column(String)
+    tier = Column(String)
+    input_image_path = Column(String, nullable=False)
+    board_image_path = Column(String)
+    prompt_text = Column(Text)
+
+    # The failure
+    error_type = Column(String, index=True)  # Exception class, e.g. "ServerError"
+    error_message = Column(Text)
+    attempts = Column(Integer, default=0)  # Gemini calls made by the failed run
+    failure_count = Column(Integer, default=1)
+    replay_count = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    replayed_at = Column(DateTime(timezone=True))
+
+    # Relationships
+    image = relationship("GeneratedImage")
@@ -0,0 +1,188 @@
+"""
+In-memory catalog of universities and their design boards.
+
+Built once per process from templates/ and rebuilt only when the templates
+change, instead of walking the directory tree on every /universities
+request and stat-ing files on every /generate-tier. Each board carries its
+size and content hash, and the catalog has an ETag for HTTP caching.
+
+Change detection is cheap: every BOARD_CATALOG_REFRESH_SECONDS the mtimes
+of templates/, the university directories and the board manifests
+(moodboards_manifest.csv, board_variants.csv - rewritten whenever boards
+are built) are compared with those the catalog was built from.
+
+Building reads and hashes every board, so it never runs on a request:
+the API loads the catalog at startup, and later rebuilds happen on a
+background thread while callers keep getting the previous snapshot.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_ROOT = Path(__file__).parent.parent.parent / "templates"
+MANIFEST_FILES = ("moodboards_manifest.csv", "board_variants.csv")
+
+
+@dataclass(frozen=True)
+class BoardEntry:
+    """The board served for one university and degree level."""
+
+    university: str
+    degree_level: str
+    path: Path  # compact variant if built, else board.png
+    size: int
+    sha256: str
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    boards: Dict[Tuple[str, str], BoardEntry]
+    universities: List[dict]
+    etag: str
+    signature: tuple
+
+
+class BoardCatalog:
+    """Process-wide, lazily built board catalog. Thread-safe."""
+
+    def __init__(self, templates_root: Path = TEMPLATES_ROOT):
+        self.templates_root = templates_root
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _signature(self) -> tuple:
+        """Mtimes that change when boards are added, removed or rebuilt."""
+        if not self.templates_root.exists():
+            return ()
+        stamps = [self.templates_root.stat().st_mtime_ns]
+        for name in MANIFEST_FILES:
+            manifest = self.templates_root / name
+            stamps.append(manifest.stat().st_mtime_ns if manifest.exists() else 0)
+        for uni_dir in sorted(self.templates_root.iterdir()):
+            if uni_dir.is_dir():
+                stamps.append((uni_dir.name, uni_dir.stat().st_mtime_ns))
+        return tuple(stamps)
+
+    def _find_board(self, level_dir: Path) -> Optional[Path]:
+        # Prefer the compact variants written by scripts/build_compact_boards.py
+        for ext in settings.board_variant_extensions:
+            variant_path = level_dir / f"board{ext}"
+            if variant_path.exists():
+                return variant_path
+
+        board_path = level_dir / "board.png"
+        if board_path.exists():
+            return board_path
+
+        return None
+
+    def _build(self, signature: tuple) -> CatalogSnapshot:
+        started = time.monotonic()
+        boards = {}
+        universities = []
+
+        if self.templates_root.exists():
+            for uni_dir in sorted(self.templates_root.iterdir()):
+                if not uni_dir.is_dir():
+                    continue
+
+                levels = []
+                for level_dir in sorted(uni_dir.iterdir()):
+                    if not level_dir.is_dir():
+                        continue
+                    board_path = self._find_board(level_dir)
+                    if board_path is None:
+                        continue
+
+                    data = board_path.read_bytes()
+                    boards[(uni_dir.name, level_dir.name)] = BoardEntry(
+                        university=uni_dir.name,
+                        degree_level=level_dir.name,
+                        path=board_path,
+                        size=len(data),
+                        sha256=hashlib.sha256(data).hexdigest(),
+                    )
+                    levels.append(level_dir.name)
+
+                if levels:
+                    universities.append({
+                        "name": uni_dir.name,
+                        "degree_levels": levels
+                    })
+
+        # The ETag covers the listing and the board contents
+        digest = hashlib.sha256(json.dumps(universities, sort_keys=True).encode("utf-8"))
+        for key in sorted(boards):
+            digest.update(boards[key].sha256.encode("ascii"))
+        etag = f'"{digest.hexdigest()[:32]}"'
+
+        logger.info(f"Board catalog built: {len(boards)} boards, {len(universities)} universities "
+                    f"in {time.monotonic() - started:.2f}s")
+        return CatalogSnapshot(boards=boards, universities=universities, etag=etag, signature=signature)
+
+    def load(self) -> CatalogSnapshot:
+        """Build the catalog if it has not been built yet (blocking)."""
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._build(self._signature())
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _refresh(self) -> None:
+        """Rebuild the catalog if the templates changed. Runs on a background thread."""
+        try:
+            signature = self._signature()
+            if self._snapshot.signature != signature:
+                self._snapshot = self._build(signature)
+        except Exception as e:
+            logger.warning(f"Board catalog refresh failed, keeping the previous one: {e}")
+        finally:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                self._refreshing = False
+
+    def _refresh_due(self) -> bool:
+        return time.monotonic() - self._checked_at >= settings.BOARD_CATALOG_REFRESH_SECONDS
+
+    def snapshot(self) -> CatalogSnapshot:
+        """
+        Current catalog. Every BOARD_CATALOG_REFRESH_SECONDS a background
+        refresh is started; the snapshot returned meanwhile may be one
+        rebuild behind. Only the very first call (if load() was not called
+        at startup) builds in the caller's thread.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.load()
+
+        if self._refresh_due():
+            with self._lock:
+                if not self._refreshing and self._refresh_due():
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, name="board-catalog-refresh", daemon=True).start()
+        return snapshot
+
+    def get(self, university: str, degree_level: str) -> Optional[BoardEntry]:
+        """Board entry for a university and degree level, or None."""
+        return self.snapshot().boards.get((university, degree_level))
+
+    def universities(self) -> List[dict]:
+        """Universities and their degree levels, sorted by name."""
+        return self.snapshot().universities
+
+    def etag(self) -> str:
+        return self.snapshot().etag
+
+
+board_catalog = BoardCatalog()
@@ -0,0 +1,184 @@
+"""
+Circuit breaker for the Gemini backend, shared by the API and all workers
+through Redis.
+
+- closed: calls go through; outcomes are counted in a rolling window
+- open: once the error rate over the window crosses the threshold, calls
+  fail fast for GEMINI_BREAKER_OPEN_SECONDS (the API answers 503 and
+  queued jobs are parked)
+- half-open: after the cool-down a single probe call is let through; its
+  success closes the breaker, its failure opens it again
+"""
+import logging
+import random
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.services.gemini_retry import GenerationError, is_retryable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(GenerationError):
+    """Raised instead of calling Gemini while the breaker is open."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Gemini is temporarily unavailable, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class GeminiCircuitBreaker:
+    """Redis-backed circuit breaker for Gemini calls."""
+
+    KEY_PREFIX = "gradgen:gemini:breaker"
+    BUCKET_SECONDS = 10
+
+    @property
+    def enabled(self) -> bool:
+        return settings.GEMINI_BREAKER_ENABLED
+
+    def _key(self, name: str) -> str:
+        return f"{self.KEY_PREFIX}:{name}"
+
+    def _window_keys(self) -> list:
+        now_bucket = int(time.time()) // self.BUCKET_SECONDS
+        n_buckets = max(1, settings.GEMINI_BREAKER_WINDOW_SECONDS // self.BUCKET_SECONDS)
+        return [self._key(f"window:{bucket}") for bucket in range(now_bucket - n_buckets + 1, now_bucket + 1)]
+
+    def _window_counts(self, client) -> tuple:
+        """Successes and failures over the rolling window."""
+        pipe = client.pipeline()
+        for key in self._window_keys():
+            pipe.hmget(key, "ok", "fail")
+        ok = fail = 0
+        for bucket_ok, bucket_fail in pipe.execute():
+            ok += int(bucket_ok or 0)
+            fail += int(bucket_fail or 0)
+        return ok, fail
+
+    def _count(self, client, field: str) -> None:
+        bucket = int(time.time()) // self.BUCKET_SECONDS
+        key = self._key(f"window:{bucket}")
+        pipe = client.pipeline()
+        pipe.hincrby(key, field, 1)
+        pipe.expire(key, settings.GEMINI_BREAKER_WINDOW_SECONDS + self.BUCKET_SECONDS)
+        pipe.execute()
+
+    def _open(self, client, reason: str) -> None:
+        client.set(self._key("open_until"), time.time() + settings.GEMINI_BREAKER_OPEN_SECONDS)
+        client.delete(self._key("probe"))
+        logger.error(f"Gemini circuit breaker OPEN for {settings.GEMINI_BREAKER_OPEN_SECONDS}s: {reason}")
+
+    def retry_after(self) -> Optional[int]:
+        """
+        Seconds until the breaker lets calls through again, or None if it
+        is closed (or half-open and ready for a probe).
+        """
+        if not self.enabled:
+            return None
+        try:
+            open_until = get_redis().get(self._key("open_until"))
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable, treating as closed: {e}")
+            return None
+
+        if open_until is None:
+            return None
+        remaining = float(open_until) - time.time()
+        return int(remaining) + 1 if remaining > 0 else None
+
+    def before_call(self) -> bool:
+        """
+        Check the breaker before a Gemini call.
+
+        Returns:
+            True if this call is the half-open probe
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        if not self.enabled:
+            return False
+        try:
+            client = get_redis()
+            open_until = client.get(self._key("open_until"))
+            if open_until is None:
+                return False
+
+            remaining = float(open_until) - time.time()
+            if remaining > 0:
+                raise CircuitOpenError(int(remaining) + 1)
+
+            # Half-open: only one caller gets to probe
+            if client.set(self._key("probe"), "1", nx=True, ex=settings.GEMINI_BREAKER_PROBE_TIMEOUT_SECONDS):
+                logger.info("Gemini circuit breaker HALF-OPEN, sending probe")
+                return True
+            raise CircuitOpenError(settings.GEMINI_BREAKER_PROBE_TIMEOUT_SECONDS)
+
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable, treating as closed: {e}")
+            return False
+
+    def release_probe(self) -> None:
+        """
+        Give the half-open probe back without an outcome, when the probe call
+        never reached Gemini (e.g. no rate-limit slot), so another caller
+        can probe right away instead of after the probe timeout.
+        """
+        if not self.enabled:
+            return
+        try:
+            get_redis().delete(self._key("probe"))
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable: {e}")
+
+    def record_success(self, probe: bool = False) -> None:
+        """Count a successful call; a successful probe closes the breaker."""
+        if not self.enabled:
+            return
+        try:
+            client = get_redis()
+            if probe:
+                # Start the window afresh so pre-outage failures don't re-open it
+                client.delete(self._key("open_until"), self._key("probe"), *self._window_keys())
+                logger.info("Gemini circuit breaker CLOSED")
+            self._count(client, "ok")
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable: {e}")
+
+    def record_failure(self, error: Exception, probe: bool = False) -> None:
+        """
+        Count a failed call. Only errors that point at the backend (the
+        retryable kind) count; a failed probe re-opens the breaker.
+        """
+        if not self.enabled or not is_retryable(error):
+            if probe:
+                # The probe reached Gemini, so the backend is answering
+                self.record_success(probe=True)
+            return
+        try:
+            client = get_redis()
+            if probe:
+                self._open(client, f"probe failed: {error}")
+                return
+
+            self._count(client, "fail")
+            ok, fail = self._window_counts(client)
+            total = ok + fail
+            if total >= settings.GEMINI_BREAKER_MIN_REQUESTS and fail / total >= settings.GEMINI_BREAKER_ERROR_RATE:
+                if client.get(self._key("open_until")) is None:
+                    self._open(client, f"{fail}/{total} calls failed in the last "
+                                       f"{settings.GEMINI_BREAKER_WINDOW_SECONDS}s")
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable: {e}")
+
+    def park_countdown(self, retry_after: int) -> int:
+        """Delay for a parked job, jittered so parked jobs don't resume at once."""
+        return retry_after + random.randint(0, max(1, settings.GEMINI_BREAKER_OPEN_SECONDS // 2))
+
+
+gemini_circuit_breaker = GeminiCircuitBreaker()
@@ -0,0 +1,112 @@
+"""
+Dead-letter store for images that failed for a retryable cause.
+
+When an image fails because Gemini was overloaded, timing out, behind an
+open circuit breaker or out of rate-limit capacity - after the in-place
+retries gave up - a DeadLetter row records the request (fingerprint,
+inputs, model, tier) and the failure. Admins replay them in bulk once the
+cause is gone (scripts/replay_dead_letters.py or POST
+/api/admin/dead-letters/replay) instead of users retrying photos one by
+one. Fatal failures (safety blocks, bad requests) are not dead-lettered.
+
+record_image_outcome is called where an image's outcome is claimed, in the
+same transaction, so the store follows every run of the image: a success
+marks its letter replayed, another retryable failure puts it back in the
+queue until DEAD_LETTER_MAX_REPLAYS replays were spent.
+"""
+import logging
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import DeadLetter, DeadLetterStatus, GeneratedImage, GenerationJob
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.gemini_retry import is_retryable
+from app.services.rate_limiter import RateLimitTimeout
+
+logger = logging.getLogger(__name__)
+
+
+def is_replayable(error: Optional[BaseException]) -> bool:
+    """True if generating the same request again later may succeed."""
+    if error is None:
+        return False
+    # No rate-limit slot in time is overload too, the case replays exist for
+    return isinstance(error, (CircuitOpenError, RateLimitTimeout)) or is_retryable(error)
+
+
+def record_image_outcome(db: Session, image: GeneratedImage, job: GenerationJob,
+                         error: Optional[BaseException], stats: dict, model: str, tier: str) -> Optional[DeadLetter]:
+    """
+    Update the dead-letter store with an image's outcome. Runs in the
+    session's current transaction; the caller commits.
+
+    Args:
+        db: Session
+        image: Image whose outcome was just claimed
+        job: The image's job
+        error: What the image failed with (None if it succeeded)
+        stats: The run's generation stats (fingerprint, attempts)
+        model: Model the request was sent to
+        tier: The job's tier
+
+    Returns:
+        The image's dead letter, if it has one
+    """
+    if image.success:
+        db.execute(
+            update(DeadLetter)
+            .where(
+                DeadLetter.image_id == image.id,
+                DeadLetter.status.in_((DeadLetterStatus.PENDING, DeadLetterStatus.REPLAYING))
+            )
+            .values(status=DeadLetterStatus.REPLAYED, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        return None
+
+    letter = db.query(DeadLetter).filter(DeadLetter.image_id == image.id).first()
+    if not is_replayable(error):
+        if letter is not None and letter.status != DeadLetterStatus.EXHAUSTED:
+            letter.status = DeadLetterStatus.EXHAUSTED
+            letter.error_type = type(error).__name__ if error else None
+            letter.error_message = image.error_message
+        return letter
+
+    if letter is None:
+        letter = DeadLetter(image_id=image.id, job_id=job.id, user_id=job.user_id, failure_count=0, replay_count=0)
+        db.add(letter)
+
+    letter.fingerprint = stats.get("fingerprint") or letter.fingerprint
+    letter.model = model
+    letter.tier = tier
+    letter.input_image_path = image.input_image_path
+    letter.board_image_path = image.board_image_path
+    letter.prompt_text = image.prompt_text
+    letter.error_type = type(error).__name__
+    letter.error_message = image.error_message
+    letter.attempts = stats.get("attempts", 0)
+    letter.failure_count += 1
+    if letter.replay_count >= settings.DEAD_LETTER_MAX_REPLAYS:
+        letter.status = DeadLetterStatus.EXHAUSTED
+    else:
+        letter.status = DeadLetterStatus.PENDING
+
+    logger.info(f"Image {image.id} dead-lettered ({letter.error_type}, {letter.status.value})")
+    return letter
+
+
+def summary(db: Session) -> dict:
+    """Dead letters per status, and per error type within each status."""
+    rows = db.query(DeadLetter.status, DeadLetter.error_type, func.count(DeadLetter.id)).group_by(
+        DeadLetter.status, DeadLetter.error_type
+    ).all()
+
+    counts = {}
+    for status, error_type, count in rows:
+        entry = counts.setdefault(status.value, {"total": 0, "by_error_type": {}})
+        entry["total"] += count
+        entry["by_error_type"][error_type or "unknown"] = count
+    return counts
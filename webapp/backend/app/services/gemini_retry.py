@@ -0,0 +1,70 @@
+"""
+Retry policy for Gemini calls, configured from settings.
+
+The error classification and retry loop live in app.engines.retry (shared
+with the research scripts); this module binds them to the GEMINI_RETRY_*
+settings.
+"""
+import logging
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.engines.retry import (  # noqa: F401 - re-exported
+    BLOCKED_FINISH_REASONS,
+    RETRYABLE_STATUS_CODES,
+    EmptyResponseError,
+    FatalGenerationError,
+    GenerationError,
+    RetryableGenerationError,
+    RetryPolicy,
+    SafetyBlockedError,
+    is_retryable,
+)
+from app.engines.retry import RetryBudget as _RetryBudget
+
+logger = logging.getLogger(__name__)
+
+
+def retry_policy() -> RetryPolicy:
+    """Per-call retry policy from settings."""
+    return RetryPolicy(
+        max_attempts=settings.GEMINI_RETRY_MAX_ATTEMPTS,
+        base_delay=settings.GEMINI_RETRY_BASE_DELAY_SECONDS,
+        max_delay=settings.GEMINI_RETRY_MAX_DELAY_SECONDS,
+    )
+
+
+class RetryBudget(_RetryBudget):
+    """Per-job retry budget, GEMINI_RETRY_BUDGET_PER_JOB by default."""
+
+    def __init__(self, max_retries: int = None):
+        super().__init__(settings.GEMINI_RETRY_BUDGET_PER_JOB if max_retries is None else max_retries)
+
+
+class JobRetryBudget(RetryBudget):
+    """
+    GEMINI_RETRY_BUDGET_PER_JOB shared through Redis by every task of one
+    job, so the images of a chord draw from a single budget whichever
+    worker runs them. If Redis is unreachable the task falls back to the
+    whole budget in-process.
+    """
+
+    KEY = "gradgen:job:{job_id}:retries"
+    KEY_TTL_SECONDS = 24 * 3600
+
+    def __init__(self, job_id: int, max_retries: int = None):
+        super().__init__(max_retries)
+        self.key = self.KEY.format(job_id=job_id)
+
+    def try_spend(self) -> bool:
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            pipe.incr(self.key)
+            pipe.expire(self.key, self.KEY_TTL_SECONDS)
+            spent, _ = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not reach the shared retry budget, using a local one: {e}")
+            return super().try_spend()
+        return spent <= self.max_retries
@@ -1,7 +1,13 @@
 import os
 import json
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Iterable, Union
 from PIL import Image
 from app.core.config import settings
 from app.core.prompts import (
@@ -10,14 +16,24 @@ from app.core.prompts import (
     get_prompt_by_id,
     format_prompt
 )
+from app.engines import (
+    GenerationEngine,
+    ImagePart,
+    call_with_retries,
+    call_with_retries_async,
+    create_engine,
+    mime_for,
+)
+from app.services.board_catalog import board_catalog
+from app.services.circuit_breaker import gemini_circuit_breaker
+from app.services.gemini_retry import RetryBudget, retry_policy
+from app.services.hedging import gemini_hedger
+from app.services.rate_limiter import gemini_rate_limiter
+from app.services.result_cache import generation_result_cache
+from app.services.stage_timings import StageTimer, timed
 from app.services.watermark_service import add_watermark_to_image
 
-try:
-    from google import genai
-    from google.genai import types as gtypes
-except Exception:
-    genai = None
-    gtypes = None
+logger = logging.getLogger(__name__)
 
 CONTROL_SUFFIX = (
     "Use the provided 'Design Board' image ONLY as a reference for gown/hood/cap style and colors; "
@@ -27,15 +43,143 @@ CONTROL_SUFFIX = (
 )
 
 
+class BoardPartCache:
+    """
+    Process-wide LRU cache of prepared design-board Parts.
+
+    Entries are keyed by (path, mtime) so a rebuilt board is picked up
+    automatically, and the cache is bounded by the total size of the cached
+    board bytes. Safe to use from multiple threads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (part, size)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: Path, mime_type: str):
+        """Return the Part for a board, reading it from disk on a miss."""
+        key = (str(path), path.stat().st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        data = path.read_bytes()
+        part = ImagePart(data=data, mime_type=mime_type)
+        self._put(key, part, len(data))
+        return part
+
+    def _put(self, key: tuple, part, size: int) -> None:
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            # Drop stale entries for the same path (board was rebuilt)
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self.total_bytes -= self._entries.pop(stale)[1]
+
+            self._entries[key] = (part, size)
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
 class GenerationService:
     """Service for generating graduation portraits using Google Gemini."""
 
     def __init__(self):
-        if genai is None or gtypes is None:
-            raise RuntimeError("google-genai not installed. pip install google-genai")
-        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        self.model = settings.GEMINI_MODEL
-        self.prompts = self._load_prompts()
+        # The engine and prompts are built on first use (or by warm_up()):
+        # the web process imports this module but rarely calls Gemini
+        self._engine = None
+        self._engine_pid = None
+        self._engine_lock = threading.Lock()
+        self._prompts = None
+        self.board_cache = BoardPartCache(max_bytes=settings.BOARD_CACHE_MAX_BYTES)
+        self._hedge_pool = None
+        self._hedge_pool_lock = threading.Lock()
+
+    @property
+    def engine(self) -> GenerationEngine:
+        """This process's generation engine, built on first use."""
+        with self._engine_lock:
+            if self._engine is None or self._engine_pid != os.getpid():
+                self._engine = self._create_engine()
+                self._engine_pid = os.getpid()
+            return self._engine
+
+    @property
+    def model(self) -> str:
+        return self.engine.model
+
+    @property
+    def prompts(self) -> dict:
+        if self._prompts is None:
+            self._prompts = self._load_prompts()
+        return self._prompts
+
+    def warm_up(self) -> None:
+        """
+        Build the engine, its client and the prompts now instead of on the
+        first request. Called when a worker process starts.
+        """
+        started = time.monotonic()
+        engine = self.engine
+        # Reading the lazy properties builds them; engines without a client skip it
+        _ = getattr(engine, "client", None)
+        _ = self.prompts
+        logger.info(f"Generation service warmed up in {time.monotonic() - started:.2f}s ({engine!r})")
+
+    @staticmethod
+    def _create_engine() -> GenerationEngine:
+        """Build the engine selected by GENERATION_ENGINE."""
+        if settings.GENERATION_ENGINE == "vertex":
+            return create_engine(
+                "vertex",
+                project=settings.VERTEX_PROJECT,
+                location=settings.VERTEX_LOCATION,
+                model=settings.GEMINI_MODEL
+            )
+        if settings.GENERATION_ENGINE == "stub":
+            logger.warning("Using the stub generation engine: images are synthetic")
+            return create_engine(
+                "stub",
+                latency=settings.STUB_ENGINE_LATENCY_SECONDS,
+                latency_stddev=settings.STUB_ENGINE_LATENCY_STDDEV_SECONDS,
+                latency_distribution=settings.STUB_ENGINE_LATENCY_DISTRIBUTION,
+                error_rate=settings.STUB_ENGINE_ERROR_RATE,
+                size=settings.stub_engine_image_size,
+                seed=settings.STUB_ENGINE_SEED
+            )
+        return create_engine("genai", api_key=settings.GEMINI_API_KEY, model=settings.GEMINI_MODEL)
 
     def _load_prompts(self) -> dict:
         """Load prompts from prompts.json."""
@@ -65,68 +209,327 @@ class GenerationService:
 
         return enhanced
 
-    def _mime_for(self, path: Path) -> str:
-        """Get MIME type for image file."""
-        ext = path.suffix.lower()
-        if ext == ".png":
-            return "image/png"
-        if ext == ".webp":
-            return "image/webp"
-        return "image/jpeg"
+    def _resolve_prompt(self, prompt_id: str, custom_prompt: Optional[str]) -> str:
+        """Resolve the prompt text for a request."""
+        if custom_prompt:
+            return custom_prompt
+        if prompt_id not in self.prompts:
+            raise ValueError(f"Unknown prompt ID: {prompt_id}")
+        return self.prompts[prompt_id]
+
+    def _build_contents(self, selfie: Union[Path, ImagePart], board_path: Path, prompt: str) -> list:
+        """Build the Gemini request contents (selfie, design board, prompt)."""
+        selfie_part = selfie if isinstance(selfie, ImagePart) else ImagePart.from_path(selfie)
+        # Boards are shared by every request for a university, so reuse them
+        board_part = self.board_cache.get(board_path, mime_for(board_path))
+
+        return [selfie_part, board_part, prompt]
+
+    def warm_board_cache(self, board_paths: Iterable[Path]) -> int:
+        """
+        Preload design boards into the Part cache.
+
+        Args:
+            board_paths: Boards to load, most important first
+
+        Returns:
+            Number of boards loaded
+        """
+        loaded = 0
+        for board_path in board_paths:
+            board_path = Path(board_path)
+            if not board_path.exists():
+                continue
+            try:
+                self.board_cache.get(board_path, mime_for(board_path))
+                loaded += 1
+            except Exception as e:
+                logger.warning(f"Failed to preload board {board_path}: {e}")
+        return loaded
+
+    def _result_fingerprint(self, contents: list, prompt: str, scope: str = "") -> str:
+        """Result-cache key for a built request (selfie part, board part, prompt)."""
+        selfie_part, board_part = contents[0], contents[1]
+        return generation_result_cache.fingerprint(
+            selfie_part.data, board_part.data, prompt, self.model, scope
+        )
+
+    def _record_fingerprint(self, contents: list, prompt: str, stats: Optional[dict],
+                            use_result_cache: bool, scope: str = "") -> Optional[str]:
+        """
+        Fingerprint of the request when the result cache or the caller's
+        stats need it; stats keep it so a failed request can be dead-lettered.
+        """
+        if not use_result_cache and stats is None:
+            return None
+        fingerprint = self._result_fingerprint(contents, prompt, scope)
+        if stats is not None:
+            stats["fingerprint"] = fingerprint
+        return fingerprint
+
+    @staticmethod
+    def _log_retry(attempt: int, error: Exception, delay: float) -> None:
+        logger.warning(f"Gemini attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+
+    @staticmethod
+    def _record_cache_hit(stats: Optional[dict], fingerprint: str) -> None:
+        if stats is None:
+            return
+        stats["attempts"] = 0
+        stats["retry_seconds"] = 0.0
+        stats["result_cache"] = fingerprint
+
+    def _call_gemini(self, contents: list, slot_acquired: Optional[threading.Event] = None) -> bytes:
+        """
+        One Gemini call through the engine: fails fast while the circuit
+        breaker is open, waits for a cluster-wide rate-limit slot, and
+        reports the outcome back to the breaker. The recorded latency (and
+        slot_acquired, if given) start once the slot is held, so time spent
+        queued behind the limiter does not count.
+
+        A half-open probe that never gets a slot (RateLimitTimeout) is
+        released without an outcome, so the breaker does not stay stuck
+        half-open until the probe key expires.
+        """
+        probe = gemini_circuit_breaker.before_call()
+        called = False
+        try:
+            with gemini_rate_limiter.slot():
+                called = True
+                started = time.monotonic()
+                if slot_acquired is not None:
+                    slot_acquired.set()
+                try:
+                    image_bytes = self.engine.generate(contents)
+                except Exception as e:
+                    gemini_circuit_breaker.record_failure(e, probe=probe)
+                    raise
+        finally:
+            if probe and not called:
+                gemini_circuit_breaker.release_probe()
+        gemini_circuit_breaker.record_success(probe=probe)
+        gemini_hedger.record_latency(time.monotonic() - started)
+        return image_bytes
+
+    async def _call_gemini_async(self, contents: list, slot_acquired: Optional[asyncio.Event] = None) -> bytes:
+        """Async version of _call_gemini."""
+        probe = await asyncio.to_thread(gemini_circuit_breaker.before_call)
+        called = False
+        try:
+            async with gemini_rate_limiter.slot_async():
+                called = True
+                started = time.monotonic()
+                if slot_acquired is not None:
+                    slot_acquired.set()
+                try:
+                    image_bytes = await self.engine.generate_async(contents)
+                except Exception as e:
+                    await asyncio.to_thread(gemini_circuit_breaker.record_failure, e, probe)
+                    raise
+        finally:
+            if probe and not called:
+                # Not awaited off-loop: this also runs when the call is cancelled
+                gemini_circuit_breaker.release_probe()
+        await asyncio.to_thread(gemini_circuit_breaker.record_success, probe)
+        gemini_hedger.record_latency(time.monotonic() - started)
+        return image_bytes
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        """Threads for hedged calls, created on first use in each worker process."""
+        with self._hedge_pool_lock:
+            if self._hedge_pool is None:
+                # The rate limiter caps real work at GEMINI_MAX_IN_FLIGHT calls,
+                # so one primary and one hedge per slot is enough
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=settings.GEMINI_MAX_IN_FLIGHT * 2, thread_name_prefix="gemini-hedge"
+                )
+            return self._hedge_pool
+
+    @staticmethod
+    def _record_hedge(stats: Optional[dict], hedge_won: bool) -> None:
+        gemini_hedger.record_outcome(hedge_won)
+        if stats is not None:
+            stats["hedges"] = stats.get("hedges", 0) + 1
+            stats["hedge_won"] = hedge_won
+
+    def _call_gemini_hedged(self, contents: list, stats: Optional[dict] = None) -> bytes:
+        """
+        _call_gemini with an optional hedge: if the call has not answered
+        within the hedge delay of getting its rate-limit slot (and the
+        per-minute cap allows it), an identical request is sent and the
+        first success wins. A call still queued behind the limiter is never
+        hedged. The slower call cannot be interrupted; it finishes in the
+        background and its result is discarded.
+        """
+        delay = gemini_hedger.hedge_delay()
+        if delay is None:
+            return self._call_gemini(contents)
+
+        pool = self._get_hedge_pool()
+        slot_acquired = threading.Event()
+        primary = pool.submit(self._call_gemini, contents, slot_acquired)
+        # Also wakes up if the call fails before getting a slot
+        primary.add_done_callback(lambda _: slot_acquired.set())
+        slot_acquired.wait()
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        if not gemini_hedger.try_hedge():
+            return primary.result()
+
+        logger.info(f"Gemini call slower than {delay:.1f}s, sending hedge request")
+        hedge = pool.submit(self._call_gemini, contents)
+        pending = {primary, hedge}
+        errors = {}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._record_hedge(stats, hedge_won=future is hedge)
+                    return future.result()
+                errors[future] = future.exception()
+
+        self._record_hedge(stats, hedge_won=False)
+        raise errors[primary]
+
+    async def _call_gemini_hedged_async(self, contents: list, stats: Optional[dict] = None) -> bytes:
+        """Async version of _call_gemini_hedged; the slower call is cancelled."""
+        delay = gemini_hedger.hedge_delay()
+        if delay is None:
+            return await self._call_gemini_async(contents)
+
+        slot_acquired = asyncio.Event()
+        primary = asyncio.ensure_future(self._call_gemini_async(contents, slot_acquired))
+        waiting_for_slot = asyncio.ensure_future(slot_acquired.wait())
+        try:
+            await asyncio.wait({primary, waiting_for_slot}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiting_for_slot.cancel()
+        if primary.done():
+            return primary.result()
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        if not await asyncio.to_thread(gemini_hedger.try_hedge):
+            return await primary
+
+        logger.info(f"Gemini call slower than {delay:.1f}s, sending hedge request")
+        hedge = asyncio.ensure_future(self._call_gemini_async(contents))
+        pending = {primary, hedge}
+        errors = {}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._record_hedge(stats, hedge_won=task is hedge)
+                        return task.result()
+                    errors[task] = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self._record_hedge(stats, hedge_won=False)
+        raise errors[primary]
 
     def generate_portrait(
         self,
-        selfie_path: Path,
+        selfie_path: Union[Path, ImagePart],
         board_path: Path,
         prompt_id: str = "P2",
-        custom_prompt: str = None
+        custom_prompt: str = None,
+        retry_budget: Optional[RetryBudget] = None,
+        stats: Optional[dict] = None,
+        use_result_cache: bool = False,
+        result_cache_scope: str = "",
+        timer: Optional[StageTimer] = None
     ) -> bytes:
         """
         Generate a graduation portrait using Gemini.
 
+        Retryable errors (429, 5xx, timeouts, empty responses) are retried
+        in place with exponential backoff and jitter, up to
+        GEMINI_RETRY_MAX_ATTEMPTS and the optional shared retry budget.
+        With GEMINI_HEDGE_ENABLED, slow calls are hedged with a second
+        identical request.
+
         Args:
-            selfie_path: Path to the input portrait photo
+            selfie_path: Path to the input portrait photo, or the photo
+                already in memory as an ImagePart
             board_path: Path to the design board (gown reference)
             prompt_id: Prompt ID to use (default P2)
             custom_prompt: Override prompt text (optional)
+            retry_budget: Retries shared with the other calls of the same job (optional)
+            stats: Dict filled with attempts / retry_seconds / hedges and the
+                request fingerprint (optional)
+            use_result_cache: Answer identical earlier requests from the
+                result cache (optional). Results are not cached here: callers
+                put them when they could not store them themselves
+            result_cache_scope: Only share cached results with requests of
+                the same scope, e.g. later runs of one image (optional)
+            timer: Times the build_request and gemini stages (optional)
 
         Returns:
             bytes: Generated image data
         """
-        if custom_prompt:
-            prompt = custom_prompt
-        elif prompt_id not in self.prompts:
-            raise ValueError(f"Unknown prompt ID: {prompt_id}")
-        else:
-            prompt = self.prompts[prompt_id]
-
-        # Create parts for Gemini
-        def part(p: Path):
-            return gtypes.Part.from_bytes(
-                data=p.read_bytes(),
-                mime_type=self._mime_for(p)
+        prompt = self._resolve_prompt(prompt_id, custom_prompt)
+        with timed(timer, "build_request"):
+            contents = self._build_contents(selfie_path, board_path, prompt)
+
+        fingerprint = self._record_fingerprint(contents, prompt, stats, use_result_cache, result_cache_scope)
+        if use_result_cache:
+            cached = generation_result_cache.get(fingerprint)
+            if cached is not None:
+                self._record_cache_hit(stats, fingerprint)
+                return cached
+
+        # Retries and hedges included
+        with timed(timer, "gemini"):
+            image_bytes = call_with_retries(
+                lambda: self._call_gemini_hedged(contents, stats),
+                retry_policy(), retry_budget, stats, on_retry=self._log_retry
             )
+        return image_bytes
 
-        contents = [part(selfie_path), part(board_path), prompt]
-
-        # Call Gemini API
-        resp = self.client.models.generate_content(
-            model=self.model,
-            contents=contents,
-            config=gtypes.GenerateContentConfig(response_modalities=["Image"])
-        )
-
-        # Extract image data
-        cand = resp.candidates[0]
-        for prt in cand.content.parts:
-            inline = getattr(prt, "inline_data", None)
-            if inline and getattr(inline, "data", None):
-                return inline.data
-
-        if hasattr(resp, "binary") and resp.binary:
-            return resp.binary
-
-        raise RuntimeError("Gemini API returned no image data")
+    async def generate_portrait_async(
+        self,
+        selfie_path: Union[Path, ImagePart],
+        board_path: Path,
+        prompt_id: str = "P2",
+        custom_prompt: str = None,
+        retry_budget: Optional[RetryBudget] = None,
+        stats: Optional[dict] = None,
+        use_result_cache: bool = False,
+        result_cache_scope: str = "",
+        timer: Optional[StageTimer] = None
+    ) -> bytes:
+        """
+        Async version of generate_portrait built on the engine's async
+        client. Returns the same image bytes and follows the same retry
+        policy.
+        """
+        prompt = self._resolve_prompt(prompt_id, custom_prompt)
+        # File reads happen off the event loop
+        with timed(timer, "build_request"):
+            contents = await asyncio.to_thread(self._build_contents, selfie_path, board_path, prompt)
+
+        fingerprint = self._record_fingerprint(contents, prompt, stats, use_result_cache, result_cache_scope)
+        if use_result_cache:
+            cached = await asyncio.to_thread(generation_result_cache.get, fingerprint)
+            if cached is not None:
+                self._record_cache_hit(stats, fingerprint)
+                return cached
+
+        with timed(timer, "gemini"):
+            image_bytes = await call_with_retries_async(
+                lambda: self._call_gemini_hedged_async(contents, stats),
+                retry_policy(), retry_budget, stats, on_retry=self._log_retry
+            )
+        return image_bytes
 
     def get_board_path(self, university: str, degree_level: str) -> Optional[Path]:
         """
@@ -137,40 +540,15 @@ class GenerationService:
             degree_level: Degree level (e.g., "Bachelors", "Masters", "PhD")
 
         Returns:
-            Path to board.png or None if not found
+            Path to the board (compact variant if built, else board.png)
+            or None if not found
         """
-        templates_root = Path(__file__).parent.parent.parent / "templates"
-        board_path = templates_root / university / degree_level / "board.png"
-
-        if board_path.exists():
-            return board_path
-
-        return None
+        entry = board_catalog.get(university, degree_level)
+        return entry.path if entry else None
 
     def list_available_universities(self) -> list[dict]:
         """List all available universities and their degree levels."""
-        templates_root = Path(__file__).parent.parent.parent / "templates"
-
-        if not templates_root.exists():
-            return []
-
-        universities = []
-        for uni_dir in sorted(templates_root.iterdir()):
-            if not uni_dir.is_dir():
-                continue
-
-            levels = []
-            for level_dir in sorted(uni_dir.iterdir()):
-                if level_dir.is_dir() and (level_dir / "board.png").exists():
-                    levels.append(level_dir.name)
-
-            if levels:
-                universities.append({
-                    "name": uni_dir.name,
-                    "degree_levels": levels
-                })
-
-        return universities
+        return board_catalog.universities()
 
     def get_prompts_for_tier(self, tier: str, university: str = "", degree_level: str = "") -> Dict:
         """
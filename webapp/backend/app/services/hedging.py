@@ -0,0 +1,124 @@
+"""
+Hedged Gemini requests.
+
+When a call has not answered by the GEMINI_HEDGE_PERCENTILE latency of
+recent calls, a second identical request is sent and whichever finishes
+first wins. Both the latencies and the hedge delay are measured from the
+moment the call holds its rate-limit slot: a call only queued behind a
+saturated limiter is not slow, and hedging it would add load where there
+is none to spare. Latencies are tracked per worker process; the number of
+hedges is capped cluster-wide per minute through Redis so quota use stays
+predictable.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies. Thread-safe."""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency at the given percentile, or None without enough samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < settings.GEMINI_HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(pct / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class GeminiHedger:
+    """Decides when to hedge a Gemini call and enforces the hedge cap."""
+
+    KEY_PREFIX = "gradgen:gemini:hedge"
+
+    def __init__(self):
+        self.latencies = LatencyTracker(window=settings.GEMINI_HEDGE_WINDOW)
+        self._lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.hedges_capped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.GEMINI_HEDGE_ENABLED
+
+    def record_latency(self, seconds: float) -> None:
+        """Record the latency of a successful call."""
+        self.latencies.record(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait for a call before hedging it.
+
+        Returns:
+            None if hedging is disabled or there is not enough latency data
+        """
+        if not self.enabled:
+            return None
+        return self.latencies.percentile(settings.GEMINI_HEDGE_PERCENTILE)
+
+    def try_hedge(self) -> bool:
+        """
+        Take one hedge from this minute's cluster-wide allowance.
+        Fails closed: no hedges while Redis is unreachable.
+        """
+        minute = int(time.time()) // 60
+        key = f"{self.KEY_PREFIX}:count:{minute}"
+        try:
+            client = get_redis()
+            pipe = client.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 120)
+            count, _ = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Hedge budget unavailable, not hedging: {e}")
+            return False
+
+        with self._lock:
+            if count > settings.GEMINI_HEDGE_MAX_PER_MINUTE:
+                self.hedges_capped += 1
+                return False
+            self.hedges_sent += 1
+            return True
+
+    def record_outcome(self, hedge_won: bool) -> None:
+        if hedge_won:
+            with self._lock:
+                self.hedges_won += 1
+
+    def stats(self) -> dict:
+        """Hedging counters for this worker process."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "samples": len(self.latencies),
+                "hedge_after_seconds": self.hedge_delay(),
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "hedges_capped": self.hedges_capped,
+            }
+
+
+gemini_hedger = GeminiHedger()
@@ -0,0 +1,86 @@
+"""
+Pre-processing for uploaded selfies before they are stored and sent to Gemini
+"""
+
+from PIL import Image, ImageOps
+from io import BytesIO
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePreprocessingService:
+    """Service for right-sizing uploaded photos"""
+
+    OUTPUT_FORMAT = "JPEG"
+    OUTPUT_EXTENSION = ".jpg"
+
+    @classmethod
+    def normalize_selfie(
+        cls,
+        image_bytes: bytes,
+        max_long_edge: int = None,
+        quality: int = None,
+    ) -> bytes:
+        """
+        Normalise an uploaded photo once, so every prompt, retry and
+        regeneration of the job reuses the same small request payload.
+
+        - Applies EXIF orientation, then drops all metadata
+        - Downscales to max_long_edge (JPEG draft mode decodes at reduced
+          scale, so big phone photos are never fully decoded)
+        - Re-encodes as RGB JPEG
+
+        Args:
+            image_bytes: Uploaded image data
+            max_long_edge: Override SELFIE_MAX_LONG_EDGE
+            quality: Override SELFIE_JPEG_QUALITY
+
+        Returns:
+            Normalised JPEG bytes
+
+        Raises:
+            ValueError: If the data is not a readable image
+        """
+        max_long_edge = max_long_edge or settings.SELFIE_MAX_LONG_EDGE
+        quality = quality or settings.SELFIE_JPEG_QUALITY
+
+        try:
+            image = Image.open(BytesIO(image_bytes))
+
+            # Let the JPEG decoder skip detail we are about to throw away.
+            # draft() keeps the result >= the requested size, so resize after.
+            if image.format == "JPEG":
+                width, height = image.size
+                scale = max_long_edge / max(width, height)
+                if scale < 1:
+                    image.draft("RGB", (int(width * scale) + 1, int(height * scale) + 1))
+
+            image = ImageOps.exif_transpose(image)
+
+            if max(image.size) > max_long_edge:
+                image.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS)
+
+            # Flatten transparency onto white, JPEG has no alpha
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[3])
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            # Save without exif/icc so no metadata is carried over
+            output = BytesIO()
+            image.save(output, format=cls.OUTPUT_FORMAT, quality=quality, optimize=True)
+
+        except Exception as e:
+            raise ValueError(f"Invalid image upload: {str(e)}")
+
+        normalized = output.getvalue()
+        logger.info(
+            f"Normalised selfie {len(image_bytes)} -> {len(normalized)} bytes, size {image.size}"
+        )
+        return normalized
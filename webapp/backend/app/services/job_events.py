@@ -0,0 +1,171 @@
+"""
+Job progress events, pushed through Redis instead of polled from Postgres.
+
+Whenever a job's state changes, the worker (or endpoint) that committed the
+change publishes it: the state is written to a Redis hash, which the status
+endpoint answers from, and sent on the job's pub/sub channel, which the SSE
+endpoint streams to the browser. Publishing never fails the caller - if
+Redis is down the status endpoint falls back to the database.
+
+Events are published after the commit, from a fresh read of the job row.
+Two chord members finishing together may publish out of order, showing a
+count one image behind for a moment; the finalizing publish is always last.
+"""
+import json
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_async_redis, get_redis
+from app.models import GeneratedImage, GenerationJob, JobStatus
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "gradgen:job:{job_id}:state"
+CHANNEL = "gradgen:job:{job_id}:events"
+
+TERMINAL_STATUSES = {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+_INT_FIELDS = ("job_id", "user_id", "completed_images", "failed_images", "total_images")
+
+
+def job_state(job: GenerationJob) -> dict:
+    """A job's state as stored in Redis and sent to the browser."""
+    return {
+        "job_id": job.id,
+        "user_id": job.user_id,
+        "status": JobStatus(job.status).value,
+        "completed_images": job.completed_images or 0,
+        "failed_images": job.failed_images or 0,
+        "total_images": job.total_images or 0,
+        "error_message": job.error_message or "",
+    }
+
+
+def _decode_state(raw: dict) -> Optional[dict]:
+    if not raw:
+        return None
+    state = {key.decode(): value.decode() for key, value in raw.items()}
+    for field in _INT_FIELDS:
+        state[field] = int(state[field])
+    return state
+
+
+def _event(state: dict, images: Iterable[GeneratedImage] = ()) -> dict:
+    """Browser payload: the state without the owner, plus the images that just finished."""
+    event = {key: value for key, value in state.items() if key != "user_id"}
+    event["progress"] = state["completed_images"] / state["total_images"] if state["total_images"] else 0.0
+    event["images"] = [{"id": image.id, "success": image.success} for image in images]
+    return event
+
+
+def _sse(event: dict) -> str:
+    return f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+
+class JobEventService:
+    """Publishes job states to Redis and streams them back out."""
+
+    def publish(self, job: GenerationJob, images: Iterable[GeneratedImage] = ()) -> None:
+        """
+        Store and broadcast the job's current state. Call after committing;
+        reading the expired job reloads it from the database.
+
+        Args:
+            job: Job whose state changed
+            images: Images whose outcome was recorded in this change
+        """
+        try:
+            state = job_state(job)
+            payload = json.dumps(_event(state, images))
+        except Exception as e:
+            logger.warning(f"Could not build progress event for job {job.id}: {e}")
+            return
+
+        key = STATE_KEY.format(job_id=state["job_id"])
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            pipe.hset(key, mapping={field: str(value) for field, value in state.items()})
+            pipe.expire(key, settings.JOB_EVENTS_STATE_TTL_SECONDS)
+            pipe.publish(CHANNEL.format(job_id=state["job_id"]), payload)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish progress of job {state['job_id']}: {e}")
+
+    async def read_state(self, job_id: int) -> Optional[dict]:
+        """The job's last published state, or None if there is none (or Redis is down)."""
+        try:
+            return _decode_state(await get_async_redis().hgetall(STATE_KEY.format(job_id=job_id)))
+        except redis.RedisError as e:
+            logger.warning(f"Could not read progress of job {job_id}: {e}")
+            return None
+
+    async def seed_state(self, state: dict) -> None:
+        """
+        Store a state read from the database, unless a worker published one
+        in the meantime (which is at least as fresh).
+        """
+        key = STATE_KEY.format(job_id=state["job_id"])
+        try:
+            async with get_async_redis().pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                if await pipe.exists(key):
+                    return
+                pipe.multi()
+                pipe.hset(key, mapping={field: str(value) for field, value in state.items()})
+                pipe.expire(key, settings.JOB_EVENTS_STATE_TTL_SECONDS)
+                await pipe.execute()
+        except redis.WatchError:
+            pass
+        except redis.RedisError as e:
+            logger.warning(f"Could not store progress of job {state['job_id']}: {e}")
+
+    async def stream(self, state: dict, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+        """
+        Server-Sent Events for one job: its current state, then every
+        published change until the job finishes, the client goes away or
+        JOB_EVENTS_STREAM_MAX_SECONDS pass (EventSource then reconnects).
+
+        Args:
+            state: The job's state, already checked to belong to the client
+            is_disconnected: Request.is_disconnected of the streaming request
+        """
+        job_id = state["job_id"]
+        deadline = time.monotonic() + settings.JOB_EVENTS_STREAM_MAX_SECONDS
+        pubsub = get_async_redis().pubsub()
+        try:
+            # Subscribe before sending the snapshot, so no change falls in between
+            await pubsub.subscribe(CHANNEL.format(job_id=job_id))
+            state = await self.read_state(job_id) or state
+            yield _sse(_event(state))
+            if JobStatus(state["status"]) in TERMINAL_STATUSES:
+                return
+
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=settings.JOB_EVENTS_KEEPALIVE_SECONDS
+                )
+                if await is_disconnected():
+                    return
+                if message is None:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+
+                event = json.loads(message["data"])
+                yield _sse(event)
+                if JobStatus(event["status"]) in TERMINAL_STATUSES:
+                    return
+
+        except redis.RedisError as e:
+            logger.warning(f"Progress stream of job {job_id} lost Redis: {e}")
+        finally:
+            await pubsub.aclose()
+
+
+# Singleton instance
+job_events = JobEventService()
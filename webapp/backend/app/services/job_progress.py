@@ -0,0 +1,225 @@
+"""
+Job progress counters, updated in SQL.
+
+completed_images / failed_images are incremented with
+`UPDATE ... SET completed_images = completed_images + 1 RETURNING ...`, so
+images finishing in parallel (threads of one task, or chord members on
+different workers) never overwrite each other's counts. JobProgressWriter
+coalesces the outcomes of images finishing close together into one
+transaction, and finalize_job_status derives a finished job's status from
+its counters in a single statement.
+
+claim_image_outcome makes recording an image idempotent when the same
+image runs twice (a redelivered or requeued task racing the original), and
+touch_job is the heartbeat the stale-job reaper looks at.
+"""
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import String, case, cast, func, null, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import GeneratedImage, GenerationJob, JobStatus
+
+
+class JobCounters(NamedTuple):
+    completed_images: int
+    failed_images: int
+    total_images: int
+
+    @property
+    def processed(self) -> int:
+        return self.completed_images + self.failed_images
+
+    @property
+    def finished(self) -> bool:
+        return self.processed >= self.total_images
+
+
+def _add(column, delta: int):
+    """column + delta, floored at zero when subtracting."""
+    if delta >= 0:
+        return column + delta
+    return case((column + delta < 0, 0), else_=column + delta)
+
+
+def increment_job_counters(db: Session, job_id: int, completed: int = 0, failed: int = 0) -> Optional[JobCounters]:
+    """
+    Atomically add to a job's counters (negative values subtract, never
+    below zero). Runs in the session's current transaction; the caller
+    commits.
+
+    Args:
+        db: Session
+        job_id: Job to update
+        completed: Added to completed_images
+        failed: Added to failed_images
+
+    Returns:
+        The counters after the update, or None if the job does not exist
+    """
+    row = db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == job_id)
+        .values(
+            completed_images=_add(GenerationJob.completed_images, completed),
+            failed_images=_add(GenerationJob.failed_images, failed),
+        )
+        .returning(GenerationJob.completed_images, GenerationJob.failed_images, GenerationJob.total_images)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return JobCounters(*row) if row else None
+
+
+def claim_image_outcome(db: Session, image_id: int, succeeded: bool) -> bool:
+    """
+    Mark an image succeeded or failed, unless an outcome is already
+    recorded. Runs in the session's current transaction; the caller
+    commits, and only counts the image if this returns True.
+
+    Returns:
+        True if this call recorded the outcome
+    """
+    result = db.execute(
+        update(GeneratedImage)
+        .where(GeneratedImage.id == image_id, GeneratedImage.success.is_(None))
+        .values(success=succeeded)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def reset_image_outcome(db: Session, image: GeneratedImage, job: GenerationJob) -> None:
+    """
+    Clear an image's outcome before it is generated again: its previous
+    outcome is taken out of the job's counters, and a finished job goes back
+    to PROCESSING. Runs in the session's current transaction; the caller
+    commits.
+    """
+    increment_job_counters(
+        db, job.id,
+        completed=-1 if image.success is True else 0,
+        failed=-1 if image.success is False else 0
+    )
+
+    image.success = None  # Mark as pending
+    image.error_message = None
+    image.output_image_path = None
+    image.output_image_path_unwatermarked = None
+    image.processed_at = None
+
+    if job.status in (JobStatus.FAILED, JobStatus.COMPLETED):
+        job.status = JobStatus.PROCESSING
+
+
+def touch_job(db: Session, job_id: int) -> None:
+    """Bump the job's updated_at (its heartbeat) and commit."""
+    db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == job_id)
+        .values(updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def finalize_job_status(db: Session, job_id: int, only_if_finished: bool = False) -> Optional[JobStatus]:
+    """
+    Set a job's final status, error message and completion time from its
+    counters, in one statement. Runs in the session's current transaction;
+    the caller commits.
+
+    Args:
+        db: Session
+        job_id: Job to finalize
+        only_if_finished: Leave the job alone unless every image has an
+            outcome (used after retrying a single image)
+
+    Returns:
+        The new status, or None if the job was not updated
+    """
+    job = GenerationJob.__table__.c
+    failed_message = cast(job.failed_images, String).concat(" images failed")
+
+    statement = (
+        update(GenerationJob)
+        .where(GenerationJob.id == job_id)
+        .values(
+            status=cast(case(
+                (job.completed_images > 0, JobStatus.COMPLETED.name),  # Partial success too
+                else_=JobStatus.FAILED.name
+            ), job.status.type),
+            error_message=case(
+                (job.completed_images >= job.total_images, null()),
+                (job.completed_images > 0, failed_message),
+                else_="All images failed to generate"
+            ),
+            completed_at=func.now(),
+        )
+        .returning(GenerationJob.status)
+        .execution_options(synchronize_session=False)
+    )
+    if only_if_finished:
+        statement = statement.where(job.completed_images + job.failed_images >= job.total_images)
+
+    row = db.execute(statement).first()
+    return row[0] if row else None
+
+
+class JobProgressWriter:
+    """
+    Collects image outcomes of one job and writes them in batches: the
+    image rows (changed on the session by the caller) and one counter
+    update are committed together when the batch is flushed.
+
+    Image rows are the checkpoints a redelivered task resumes from, so a
+    batch is due JOB_PROGRESS_FLUSH_SECONDS after its first outcome, or
+    once it holds JOB_PROGRESS_FLUSH_IMAGES outcomes. Callers wait for
+    results with a timeout of seconds_until_due() and call flush_if_due().
+    Not thread-safe: use it from the thread that owns the session.
+    """
+
+    def __init__(self, db: Session, job_id: int, flush_seconds: float = None, flush_images: int = None):
+        self.db = db
+        self.job_id = job_id
+        self.flush_seconds = settings.JOB_PROGRESS_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.flush_images = max(1, settings.JOB_PROGRESS_FLUSH_IMAGES if flush_images is None else flush_images)
+        self.counters: Optional[JobCounters] = None
+        self._completed = 0
+        self._failed = 0
+        self._oldest_pending = None
+
+    @property
+    def pending(self) -> int:
+        return self._completed + self._failed
+
+    def record(self, succeeded: bool) -> None:
+        """Count one image's outcome (written on the next flush)."""
+        if succeeded:
+            self._completed += 1
+        else:
+            self._failed += 1
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+
+    def seconds_until_due(self) -> Optional[float]:
+        """Time left before the pending batch must be written; None if nothing is pending."""
+        if not self.pending:
+            return None
+        return max(0.0, self._oldest_pending + self.flush_seconds - time.monotonic())
+
+    def flush_if_due(self) -> Optional[JobCounters]:
+        """Flush if the batch is full or old enough; returns the counters if it flushed."""
+        if self.pending and (self.pending >= self.flush_images or self.seconds_until_due() == 0):
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[JobCounters]:
+        """Write the pending counters and image rows in one transaction."""
+        if self.pending:
+            self.counters = increment_job_counters(self.db, self.job_id, self._completed, self._failed)
+            self._completed = self._failed = 0
+            self._oldest_pending = None
+        self.db.commit()
+        return self.counters
@@ -0,0 +1,203 @@
+"""
+Cluster-wide Gemini rate limiter shared by all workers through Redis.
+
+Two limits are enforced in one atomic Lua script:
+- requests per minute, as a token bucket (GEMINI_RATE_LIMIT_RPM)
+- requests in flight, as a set of leases that expire if a worker dies
+  without releasing them (GEMINI_MAX_IN_FLIGHT)
+
+Callers wait for a slot instead of sending a burst that Gemini answers
+with 429s.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = bucket hash, KEYS[2] = in-flight lease zset
+# ARGV = rpm, burst, max_in_flight, lease_seconds, lease_id
+# Returns 0 when the slot was granted, otherwise milliseconds to wait.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rpm = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_in_flight = tonumber(ARGV[3])
+local lease_seconds = tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('ZCARD', KEYS[2]) >= max_in_flight then
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+    local wait = 100
+    if oldest[2] then
+        wait = math.min(1000, math.max(50, (tonumber(oldest[2]) - now) * 1000))
+    end
+    return math.floor(wait)
+end
+
+local rate = rpm / 60.0
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + (now - ts) * rate)
+
+if tokens < 1 then
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], 120)
+    return math.max(10, math.floor((1 - tokens) / rate * 1000))
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('ZADD', KEYS[2], now + lease_seconds, ARGV[5])
+redis.call('EXPIRE', KEYS[2], lease_seconds * 2)
+return 0
+"""
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised when no Gemini slot became free within the allowed wait."""
+
+
+class GeminiRateLimiter:
+    """Token bucket + in-flight limiter for Gemini calls."""
+
+    BUCKET_KEY = "gradgen:gemini:ratelimit:bucket"
+    IN_FLIGHT_KEY = "gradgen:gemini:ratelimit:inflight"
+
+    def __init__(self):
+        self._script = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.GEMINI_RATE_LIMIT_ENABLED
+
+    def _try_acquire(self, lease_id: str) -> Optional[float]:
+        """
+        Try to take a slot once.
+
+        Returns:
+            None if the slot was granted, otherwise seconds to wait
+        """
+        client = get_redis()
+        if self._script is None or self._script.registered_client is not client:
+            self._script = client.register_script(_ACQUIRE_SCRIPT)
+
+        wait_ms = self._script(
+            keys=[self.BUCKET_KEY, self.IN_FLIGHT_KEY],
+            args=[
+                settings.GEMINI_RATE_LIMIT_RPM,
+                max(1, settings.GEMINI_RATE_LIMIT_BURST),
+                settings.GEMINI_MAX_IN_FLIGHT,
+                settings.GEMINI_RATE_LIMIT_LEASE_SECONDS,
+                lease_id,
+            ],
+        )
+        return None if int(wait_ms) == 0 else int(wait_ms) / 1000
+
+    def acquire(self, max_wait: float = None) -> Optional[str]:
+        """
+        Block until a Gemini slot is available.
+
+        Returns:
+            Lease ID to pass to release(), or None if limiting is disabled
+            or Redis is unreachable (fail open)
+
+        Raises:
+            RateLimitTimeout: If no slot was free within max_wait seconds
+        """
+        if not self.enabled:
+            return None
+
+        max_wait = settings.GEMINI_RATE_LIMIT_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        lease_id = uuid.uuid4().hex
+
+        while True:
+            try:
+                wait = self._try_acquire(lease_id)
+            except Exception as e:
+                logger.warning(f"Gemini rate limiter unavailable, continuing without it: {e}")
+                return None
+
+            if wait is None:
+                return lease_id
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"No Gemini capacity within {max_wait:.0f}s")
+            time.sleep(wait)
+
+    async def acquire_async(self, max_wait: float = None) -> Optional[str]:
+        """Async version of acquire(); waits without blocking the event loop."""
+        if not self.enabled:
+            return None
+
+        max_wait = settings.GEMINI_RATE_LIMIT_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        lease_id = uuid.uuid4().hex
+
+        while True:
+            try:
+                wait = await asyncio.to_thread(self._try_acquire, lease_id)
+            except Exception as e:
+                logger.warning(f"Gemini rate limiter unavailable, continuing without it: {e}")
+                return None
+
+            if wait is None:
+                return lease_id
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"No Gemini capacity within {max_wait:.0f}s")
+            await asyncio.sleep(wait)
+
+    def release(self, lease_id: Optional[str]) -> None:
+        """Give an in-flight slot back."""
+        if lease_id is None:
+            return
+        try:
+            get_redis().zrem(self.IN_FLIGHT_KEY, lease_id)
+        except Exception as e:
+            # The lease expires on its own after GEMINI_RATE_LIMIT_LEASE_SECONDS
+            logger.warning(f"Failed to release Gemini slot {lease_id}: {e}")
+
+    @contextmanager
+    def slot(self):
+        """Hold a Gemini slot for the duration of the block."""
+        lease_id = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(lease_id)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Async version of slot()."""
+        lease_id = await self.acquire_async()
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.release, lease_id)
+
+    def stats(self) -> dict:
+        """Current bucket level and number of requests in flight."""
+        client = get_redis()
+        tokens = client.hget(self.BUCKET_KEY, "tokens")
+        return {
+            "enabled": self.enabled,
+            "rpm": settings.GEMINI_RATE_LIMIT_RPM,
+            "max_in_flight": settings.GEMINI_MAX_IN_FLIGHT,
+            "in_flight": client.zcount(self.IN_FLIGHT_KEY, time.time(), "+inf"),
+            "tokens": float(tokens) if tokens is not None else None,
+        }
+
+
+gemini_rate_limiter = GeminiRateLimiter()
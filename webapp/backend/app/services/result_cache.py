@@ -0,0 +1,184 @@
+"""
+Content-addressed cache of generation results.
+
+A result is keyed by sha256(selfie bytes, board bytes, prompt text, model,
+scope), so an identical request - a retry, a redelivered task, an admin
+replay - is answered from storage instead of a paid, multi-second Gemini
+call. Tier images are scoped to their image row: every new image is a new
+sample, even when another job sent the same selfie and prompt.
+
+Only results a rerun can reuse are written: the tier tasks put a generated
+image when storing it failed, since a stored image is never generated again.
+
+The image lives in storage under cache/<fingerprint>.png; Redis holds the
+pointer (with TTL), an LRU index, per-entry sizes and a running byte total
+used to keep the cache within RESULT_CACHE_MAX_BYTES. A put only does work
+proportional to what it evicts: expired entries and, while over budget,
+the least recently used ones are dropped in batches of EVICTION_BATCH_SIZE.
+Evicted entries have their storage object deleted.
+"""
+import hashlib
+import logging
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.services.storage_service import storage_service
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationResultCache:
+    """Redis-indexed, storage-backed result cache."""
+
+    KEY_PREFIX = "gradgen:resultcache"
+    OBJECT_PREFIX = "cache"
+    EVICTION_BATCH_SIZE = 16
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RESULT_CACHE_ENABLED
+
+    def _key(self, name: str) -> str:
+        return f"{self.KEY_PREFIX}:{name}"
+
+    @staticmethod
+    def fingerprint(selfie_bytes: bytes, board_bytes: bytes, prompt: str, model: str, scope: str = "") -> str:
+        """
+        Hash of everything that determines a generation request, plus an
+        optional scope limiting which requests may share a result.
+        """
+        parts = [selfie_bytes, board_bytes, prompt.encode("utf-8"), model.encode("utf-8")]
+        if scope:
+            parts.append(scope.encode("utf-8"))
+        digest = hashlib.sha256()
+        for part in parts:
+            # Length-prefix each part so boundaries can't be shifted
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, fingerprint: str) -> Optional[bytes]:
+        """Return cached image bytes, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            client = get_redis()
+            object_key = client.get(self._key(f"entry:{fingerprint}"))
+            if object_key is None:
+                client.hincrby(self._key("stats"), "misses", 1)
+                return None
+
+            image_bytes = self._read_object(object_key.decode())
+            client.zadd(self._key("lru"), {fingerprint: time.time()})
+            client.hincrby(self._key("stats"), "hits", 1)
+            return image_bytes
+
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed for {fingerprint[:12]}: {e}")
+            return None
+
+    def put(self, fingerprint: str, image_bytes: bytes) -> None:
+        """Store a result (best effort; failures are only logged)."""
+        if not self.enabled or len(image_bytes) > settings.RESULT_CACHE_MAX_BYTES:
+            return
+        try:
+            client = get_redis()
+            object_key = f"{self.OBJECT_PREFIX}/{fingerprint}.png"
+            self._write_object(object_key, image_bytes)
+
+            # Seeds the byte total before it is first incremented
+            self._total_bytes(client)
+            previous_size = int(client.hget(self._key("sizes"), fingerprint) or 0)
+            pipe = client.pipeline()
+            pipe.set(self._key(f"entry:{fingerprint}"), object_key, ex=settings.RESULT_CACHE_TTL_SECONDS)
+            pipe.zadd(self._key("lru"), {fingerprint: time.time()})
+            pipe.hset(self._key("sizes"), fingerprint, len(image_bytes))
+            pipe.incrby(self._key("bytes"), len(image_bytes) - previous_size)
+            total = pipe.execute()[-1]
+
+            self._evict(client, total)
+
+        except Exception as e:
+            logger.warning(f"Result cache store failed for {fingerprint[:12]}: {e}")
+
+    def _total_bytes(self, client) -> int:
+        """
+        Running size of the cache. Seeded once from the per-entry sizes when
+        the counter is missing (a cache filled before it existed).
+        """
+        total = client.get(self._key("bytes"))
+        if total is not None:
+            return int(total)
+        seeded = sum(int(size) for size in client.hvals(self._key("sizes")))
+        client.set(self._key("bytes"), seeded, nx=True)
+        return int(client.get(self._key("bytes")))
+
+    def _evict(self, client, total: int) -> None:
+        """Drop a batch of expired entries, then least recently used ones while over budget."""
+        expired_before = time.time() - settings.RESULT_CACHE_TTL_SECONDS
+        expired = client.zrangebyscore(self._key("lru"), "-inf", expired_before,
+                                       start=0, num=self.EVICTION_BATCH_SIZE)
+        if expired:
+            total = self._drop(client, [fp.decode() for fp in expired])
+
+        while total > settings.RESULT_CACHE_MAX_BYTES:
+            # ZPOPMIN hands each victim to exactly one of several concurrent evictors
+            popped = [(fp.decode(), score) for fp, score in
+                      client.zpopmin(self._key("lru"), self.EVICTION_BATCH_SIZE)]
+            if not popped:
+                break
+            sizes = client.hmget(self._key("sizes"), [fp for fp, _ in popped])
+            victims = []
+            for (fp, _), size in zip(popped, sizes):
+                if total <= settings.RESULT_CACHE_MAX_BYTES:
+                    break
+                victims.append(fp)
+                total -= int(size or 0)
+            # Popped but not needed to get within budget: back into the index as they were
+            kept = dict(popped[len(victims):])
+            if kept:
+                client.zadd(self._key("lru"), kept)
+            total = self._drop(client, victims)
+
+    def _drop(self, client, fingerprints: list) -> int:
+        """Remove entries and their storage objects; returns the new byte total."""
+        sizes = client.hmget(self._key("sizes"), fingerprints)
+        freed = sum(int(size) for size in sizes if size is not None)
+
+        pipe = client.pipeline()
+        for fp in fingerprints:
+            pipe.delete(self._key(f"entry:{fp}"))
+        pipe.zrem(self._key("lru"), *fingerprints)
+        pipe.hdel(self._key("sizes"), *fingerprints)
+        pipe.hincrby(self._key("stats"), "evictions", len(fingerprints))
+        pipe.incrby(self._key("bytes"), -freed)
+        total = pipe.execute()[-1]
+
+        for fp in fingerprints:
+            storage_service.delete_file(f"{self.OBJECT_PREFIX}/{fp}.png")
+        return total
+
+    def _write_object(self, object_key: str, image_bytes: bytes) -> None:
+        storage_service.upload_bytes(image_bytes, object_key, content_type="image/png")
+
+    def _read_object(self, object_key: str) -> bytes:
+        return storage_service.download_bytes(object_key)
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current size."""
+        client = get_redis()
+        counters = {k.decode(): int(v) for k, v in client.hgetall(self._key("stats")).items()}
+        return {
+            "enabled": self.enabled,
+            "entries": client.zcard(self._key("lru")),
+            "bytes": self._total_bytes(client),
+            "max_bytes": settings.RESULT_CACHE_MAX_BYTES,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+        }
+
+
+generation_result_cache = GenerationResultCache()
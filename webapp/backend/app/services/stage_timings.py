@@ -0,0 +1,181 @@
+"""
+Per-stage timings of the image pipeline.
+
+Every generated image is timed stage by stage (StageTimer): storage
+download, request build, Gemini call, watermark, PNG encode, upload and DB
+commit. The timings are kept in the image's generation_metadata
+("stage_seconds") and added to cluster-wide histograms in Redis, one per
+stage, model and tier, bucketed by hour so a report can cover a recent
+window. report() turns them into p50/p95/p99 for the admin endpoint.
+
+The DB commit is the write that stores generation_metadata, so its time
+only goes to the histograms.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("download", "build_request", "gemini", "watermark", "encode", "upload", "db_commit")
+
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+INF = "+Inf"
+
+SERIES_KEY = "gradgen:timings:{hour}:series"
+HISTOGRAM_KEY = "gradgen:timings:{hour}:{series}"
+SERIES_SEPARATOR = "|"
+
+PERCENTILES = (50, 95, 99)
+
+
+class StageTimer:
+    """
+    Stage durations of one image. A stage timed more than once (e.g. the
+    two uploads of a free tier image) accumulates. Used by one thread at a
+    time.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def metadata(self) -> dict:
+        """generation_metadata entry for these timings."""
+        return {"stage_seconds": {name: round(seconds, 4) for name, seconds in self.seconds.items()}}
+
+
+def timed(timer: Optional[StageTimer], name: str):
+    """timer.stage(name), or a no-op context when there is no timer."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def _bucket(seconds: float) -> str:
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return str(bound)
+    return INF
+
+
+def _hour(timestamp: float) -> int:
+    return int(timestamp // 3600)
+
+
+def record(seconds: Dict[str, float], model: str, tier: str) -> None:
+    """
+    Add stage durations to the histograms of their (stage, model, tier).
+    Never raises: losing a sample is better than failing an image.
+    """
+    if not seconds:
+        return
+
+    hour = _hour(time.time())
+    ttl = settings.STAGE_TIMINGS_RETENTION_HOURS * 3600 + 3600
+    series_key = SERIES_KEY.format(hour=hour)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for stage, value in seconds.items():
+            series = SERIES_SEPARATOR.join((stage, model, tier))
+            key = HISTOGRAM_KEY.format(hour=hour, series=series)
+            pipe.hincrby(key, _bucket(value), 1)
+            pipe.hincrby(key, "count", 1)
+            pipe.hincrbyfloat(key, "sum", value)
+            pipe.expire(key, ttl)
+            pipe.sadd(series_key, series)
+        pipe.expire(series_key, ttl)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not record stage timings: {e}")
+
+
+def _percentile(buckets: Dict[str, int], count: int, pct: float) -> Optional[float]:
+    """
+    Estimate a percentile from bucket counts, interpolating linearly within
+    the bucket it falls in (samples in +Inf report the largest bound).
+    """
+    if count == 0:
+        return None
+    rank = count * pct / 100
+    cumulative = 0
+    lower = 0.0
+    for bound in BUCKETS:
+        in_bucket = buckets.get(str(bound), 0)
+        if in_bucket and cumulative + in_bucket >= rank:
+            return round(lower + (bound - lower) * (rank - cumulative) / in_bucket, 4)
+        cumulative += in_bucket
+        lower = bound
+    return BUCKETS[-1]
+
+
+def _summary(histogram: dict) -> dict:
+    count = int(histogram.get("count", 0))
+    summary = {
+        "count": count,
+        "mean": round(histogram.get("sum", 0.0) / count, 4) if count else None,
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = _percentile(histogram["buckets"], count, pct)
+    return summary
+
+
+def report(hours: int = 1) -> dict:
+    """
+    Percentiles of each stage over the last `hours` hours (the current,
+    partial hour included): per stage, model and tier, and per stage
+    across all of them.
+    """
+    client = get_redis()
+    current = _hour(time.time())
+    histograms = defaultdict(lambda: {"count": 0, "sum": 0.0, "buckets": defaultdict(int)})
+
+    for hour in range(current - hours + 1, current + 1):
+        series_names = sorted(name.decode() for name in client.smembers(SERIES_KEY.format(hour=hour)))
+        pipe = client.pipeline(transaction=False)
+        for series in series_names:
+            pipe.hgetall(HISTOGRAM_KEY.format(hour=hour, series=series))
+
+        for series, fields in zip(series_names, pipe.execute()):
+            stage, model, tier = series.split(SERIES_SEPARATOR)
+            for rollup in ((stage, model, tier), (stage, None, None)):
+                histogram = histograms[rollup]
+                for field, value in fields.items():
+                    field = field.decode()
+                    if field == "count":
+                        histogram["count"] += int(value)
+                    elif field == "sum":
+                        histogram["sum"] += float(value)
+                    else:
+                        histogram["buckets"][field] += int(value)
+
+    def sort_key(rollup):
+        stage, model, tier = rollup
+        return (STAGES.index(stage) if stage in STAGES else len(STAGES), model or "", tier or "")
+
+    by_stage = {}
+    series = []
+    for rollup in sorted(histograms, key=sort_key):
+        stage, model, tier = rollup
+        if model is None:
+            by_stage[stage] = _summary(histograms[rollup])
+        else:
+            series.append({"stage": stage, "model": model, "tier": tier, **_summary(histograms[rollup])})
+
+    return {"window_hours": hours, "by_stage": by_stage, "series": series}
@@ -1,19 +1,87 @@
 """
 Storage service for handling file uploads to local storage or cloud (S3/R2).
 """
+import io
 import os
+import threading
+import time
+import logging
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 from app.core.config import settings
 
-# Only import boto3 if using cloud storage
-if settings.STORAGE_TYPE in ["s3", "r2"]:
-    try:
-        import boto3
-        from botocore.exceptions import ClientError
-    except ImportError:
-        boto3 = None
-        ClientError = None
+logger = logging.getLogger(__name__)
+
+
+class ObjectCache:
+    """
+    Process-wide LRU cache of downloaded storage objects.
+
+    Entries are keyed by (object key, ETag), so an overwritten object is
+    fetched again, and the cache is bounded by the total size of the cached
+    bytes. Safe to use from multiple threads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()  # (key, etag) -> data
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, object_key: str, etag: str) -> Optional[bytes]:
+        """Cached data for this version of the object, or None."""
+        key = (object_key, etag)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+            return None
+
+    def put(self, object_key: str, etag: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        key = (object_key, etag)
+        with self._lock:
+            if key in self._entries:
+                return
+
+            # Drop older versions of the same object
+            for stale in [k for k in self._entries if k[0] == object_key]:
+                self.total_bytes -= len(self._entries.pop(stale))
+
+            self._entries[key] = data
+            self.total_bytes += len(data)
+
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
 
 
 class StorageService:
@@ -22,32 +90,64 @@ class StorageService:
     def __init__(self):
         self.storage_type = settings.STORAGE_TYPE
 
-        if self.storage_type in ["s3", "r2"]:
-            if boto3 is None:
-                raise RuntimeError("boto3 not installed. Run: pip install boto3")
-
-            # Configure S3/R2 client
-            if self.storage_type == "r2":
-                # Cloudflare R2
-                self.s3_client = boto3.client(
-                    's3',
-                    endpoint_url=f'https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com',
-                    aws_access_key_id=settings.R2_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
-                    region_name='auto'
-                )
-                self.bucket = settings.R2_BUCKET
-                self.public_url_base = f"https://images.{settings.DOMAIN}"
-            else:
-                # AWS S3
-                self.s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    region_name=settings.AWS_REGION
-                )
-                self.bucket = settings.S3_BUCKET
-                self.public_url_base = f"https://{self.bucket}.s3.{settings.AWS_REGION}.amazonaws.com"
+        # The boto3 client is built on first use (or by warm_up()), once
+        # per process: importing boto3 is slow and its clients must not be
+        # shared across a fork
+        self._s3_client = None
+        self._s3_client_pid = None
+        self._s3_client_lock = threading.Lock()
+
+        # Downloads are cached per process: every image and retry of a job
+        # reads the same input photo
+        self.object_cache = ObjectCache(max_bytes=settings.STORAGE_OBJECT_CACHE_MAX_BYTES)
+
+        if self.storage_type == "r2":
+            # Cloudflare R2
+            self.bucket = settings.R2_BUCKET
+            self.public_url_base = f"https://images.{settings.DOMAIN}"
+        elif self.storage_type == "s3":
+            # AWS S3
+            self.bucket = settings.S3_BUCKET
+            self.public_url_base = f"https://{self.bucket}.s3.{settings.AWS_REGION}.amazonaws.com"
+
+    @property
+    def s3_client(self):
+        """This process's S3/R2 client."""
+        with self._s3_client_lock:
+            if self._s3_client is None or self._s3_client_pid != os.getpid():
+                self._s3_client = self._create_s3_client()
+                self._s3_client_pid = os.getpid()
+            return self._s3_client
+
+    def _create_s3_client(self):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("boto3 not installed. Run: pip install boto3")
+
+        # Configure S3/R2 client
+        if self.storage_type == "r2":
+            return boto3.client(
+                's3',
+                endpoint_url=f'https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com',
+                aws_access_key_id=settings.R2_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
+                region_name='auto'
+            )
+        return boto3.client(
+            's3',
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_REGION
+        )
+
+    def warm_up(self) -> None:
+        """Build the S3/R2 client now instead of on the first request."""
+        if self.storage_type not in ["s3", "r2"]:
+            return
+        started = time.monotonic()
+        self.s3_client
+        logger.info(f"Storage client ({self.storage_type}) built in {time.monotonic() - started:.2f}s")
 
     def upload_file(self, local_path: Path, object_key: str) -> str:
         """
@@ -79,6 +179,80 @@ class StorageService:
         except Exception as e:
             raise RuntimeError(f"Failed to upload file to {self.storage_type}: {str(e)}")
 
+    def upload_bytes(self, data: Union[bytes, BinaryIO], object_key: str,
+                     content_type: Optional[str] = None) -> str:
+        """
+        Upload in-memory data to storage, without a local file.
+
+        Args:
+            data: Bytes or a readable binary file-like object
+            object_key: Key/path in storage (e.g., "results/user123/image.png")
+            content_type: MIME type (default: from the key's extension)
+
+        Returns:
+            Public URL or local path to the file
+        """
+        content_type = content_type or self._get_content_type(Path(object_key))
+
+        if self.storage_type == "local":
+            # For local storage, object_key is the local path
+            local_path = Path(object_key)
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            local_path.write_bytes(data if isinstance(data, bytes) else data.read())
+            return str(local_path)
+
+        # Upload to S3/R2
+        try:
+            fileobj = io.BytesIO(data) if isinstance(data, bytes) else data
+            self.s3_client.upload_fileobj(
+                fileobj,
+                self.bucket,
+                object_key,
+                ExtraArgs={'ContentType': content_type}
+            )
+
+            return f"{self.public_url_base}/{object_key}"
+
+        except Exception as e:
+            raise RuntimeError(f"Failed to upload file to {self.storage_type}: {str(e)}")
+
+    def download_bytes(self, object_key: str) -> bytes:
+        """
+        Download a file from storage into memory.
+
+        For S3/R2 the object cache is checked first: a HEAD request gets the
+        current ETag, and the body is only downloaded if that version is not
+        cached yet.
+
+        Args:
+            object_key: Key/path in storage
+
+        Returns:
+            The file contents
+        """
+        if self.storage_type == "local":
+            # For local storage, object_key is already the local path
+            return Path(object_key).read_bytes()
+
+        # Download from S3/R2
+        try:
+            if not self.object_cache.enabled:
+                response = self.s3_client.get_object(Bucket=self.bucket, Key=object_key)
+                return response["Body"].read()
+
+            etag = self.s3_client.head_object(Bucket=self.bucket, Key=object_key)["ETag"]
+            data = self.object_cache.get(object_key, etag)
+            if data is not None:
+                return data
+
+            # IfMatch: fail rather than cache a newer body under the old ETag
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=object_key, IfMatch=etag)
+            data = response["Body"].read()
+            self.object_cache.put(object_key, etag, data)
+            return data
+        except Exception as e:
+            raise RuntimeError(f"Failed to download file from {self.storage_type}: {str(e)}")
+
     def download_file(self, object_key: str, destination: Path) -> None:
         """
         Download a file from storage.
@@ -92,12 +266,9 @@ class StorageService:
             # No need to download, file is already local
             return
 
-        # Download from S3/R2
-        try:
-            destination.parent.mkdir(parents=True, exist_ok=True)
-            self.s3_client.download_file(self.bucket, object_key, str(destination))
-        except Exception as e:
-            raise RuntimeError(f"Failed to download file from {self.storage_type}: {str(e)}")
+        # Download from S3/R2, through the object cache
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.write_bytes(self.download_bytes(object_key))
 
     def delete_file(self, object_key: str) -> None:
         """
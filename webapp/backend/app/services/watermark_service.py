@@ -4,7 +4,11 @@ Watermark service for adding GradGen.AI watermark to free tier photos
 
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
+from typing import Optional
 import logging
+import time
+
+from app.services.stage_timings import StageTimer, timed
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +28,7 @@ class WatermarkService:
         image_bytes: bytes,
         position: str = "bottom_right",
         opacity: float = None,
+        timer: Optional[StageTimer] = None,
     ) -> bytes:
         """
         Add watermark to an image
@@ -32,10 +37,12 @@ class WatermarkService:
             image_bytes: Original image bytes
             position: Where to place watermark ("bottom_right", "bottom_left", "center", "diagonal")
             opacity: Override default opacity (0.0 to 1.0)
+            timer: Times the watermark (decode and draw) and encode stages (optional)
 
         Returns:
             Watermarked image bytes
         """
+        started = time.perf_counter()
         try:
             # Load image
             image = Image.open(BytesIO(image_bytes))
@@ -141,9 +148,13 @@ class WatermarkService:
                 background.paste(watermarked, mask=watermarked.split()[3])  # Use alpha channel as mask
                 watermarked = background
 
+            if timer is not None:
+                timer.add("watermark", time.perf_counter() - started)
+
             # Save to bytes
             output = BytesIO()
-            watermarked.save(output, format="PNG", quality=95)
+            with timed(timer, "encode"):
+                watermarked.save(output, format="PNG", quality=95)
             output.seek(0)
 
             logger.info(f"Watermark added successfully at position: {position}")
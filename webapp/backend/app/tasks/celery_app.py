@@ -1,11 +1,18 @@
 from celery import Celery
 from app.core.config import settings
+from app.tasks.queues import (
+    FREE_QUEUE,
+    PRIORITY_SEPARATOR,
+    PRIORITY_STEPS,
+    TASK_QUEUES,
+    route_task,
+)
 
 celery_app = Celery(
     "gradgen",
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
-    include=["app.tasks.generation_tasks"]
+    include=["app.tasks.generation_tasks", "app.tasks.maintenance_tasks"]
 )
 
 celery_app.conf.update(
@@ -14,4 +21,35 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    # Long generation tasks: a worker only takes a new task when it is free,
+    # so bursts spread over the whole fleet instead of queueing behind one
+    worker_prefetch_multiplier=1,
+    # Generation tasks set acks_late themselves, so a worker that dies
+    # mid-task (crash, deploy) has them redelivered and they skip images
+    # already recorded. A task whose own process is killed (OOM, segfault)
+    # is not redelivered: it fails, and the stale-job reaper requeues the
+    # job at most STALE_JOB_MAX_REQUEUES times instead of crashing workers
+    # forever.
+    # Named queues with one worker pool each (app/tasks/queues.py)
+    task_queues=TASK_QUEUES,
+    task_default_queue=FREE_QUEUE,
+    task_default_priority=settings.celery_queue_config(FREE_QUEUE)["priority"],
+    task_routes=(route_task,),
+    # Periodic tasks, sent by `celery beat`
+    beat_schedule={
+        "reap-stale-jobs": {
+            "task": "app.tasks.maintenance_tasks.reap_stale_jobs",
+            "schedule": settings.STALE_JOB_REAPER_INTERVAL_SECONDS,
+            # A run still waiting when the next one is due is dropped
+            "options": {"expires": settings.STALE_JOB_REAPER_INTERVAL_SECONDS},
+        },
+    },
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "sep": PRIORITY_SEPARATOR,
+        "queue_order_strategy": "priority",
+        # Unacknowledged tasks are redelivered after this long, so it must
+        # exceed the longest task (including countdowns of parked tasks)
+        "visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT_SECONDS,
+    },
 )
@@ -0,0 +1,63 @@
+"""
+One asyncio event loop per Celery worker process.
+
+The loop runs in a daemon thread and is created lazily (after the prefork
+fork), so every worker process gets its own loop and its own google-genai
+async connections. Tasks submit coroutines to it and get back
+concurrent.futures.Future objects, which lets a single task keep many
+Gemini requests in flight while still handling results on the task thread.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Optional
+
+from app.core.config import settings
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """Return this process's event loop, starting it on first use."""
+    global _loop, _loop_pid, _semaphore
+
+    with _lock:
+        if _loop is not None and _loop_pid == os.getpid():
+            return _loop
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=loop.run_forever,
+            name="gemini-event-loop",
+            daemon=True
+        )
+        thread.start()
+
+        async def _make_semaphore():
+            return asyncio.Semaphore(max(1, settings.GEMINI_ASYNC_MAX_IN_FLIGHT))
+
+        _semaphore = asyncio.run_coroutine_threadsafe(_make_semaphore(), loop).result()
+        _loop = loop
+        _loop_pid = os.getpid()
+        return _loop
+
+
+async def _bounded(coro: Awaitable):
+    """Run a coroutine under the per-process in-flight limit."""
+    async with _semaphore:
+        return await coro
+
+
+def submit(coro: Awaitable) -> Future:
+    """Schedule a coroutine on the worker loop without waiting for it."""
+    loop = get_worker_loop()
+    return asyncio.run_coroutine_threadsafe(_bounded(coro), loop)
+
+
+def run(coro: Awaitable, timeout: Optional[float] = None):
+    """Run a coroutine on the worker loop and block until it finishes."""
+    return submit(coro).result(timeout=timeout)
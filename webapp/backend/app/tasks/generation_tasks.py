@@ -1,14 +1,155 @@
+import asyncio
+import json
+import logging
+import time
 from pathlib import Path
-from datetime import datetime
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from celery import chord
+from celery.exceptions import Retry
+from celery.signals import worker_process_init
+from sqlalchemy import func
+from app.core.config import settings
+from app.tasks import event_loop
 from app.tasks.celery_app import celery_app
+from app.tasks.queues import tier_queue_options
 from app.db.database import SessionLocal
+from app.engines import ImagePart, mime_for
 from app.models import GenerationJob, GeneratedImage, JobStatus
+from app.services.circuit_breaker import gemini_circuit_breaker
+from app.services.gemini_retry import JobRetryBudget, RetryBudget
 from app.services.generation_service import generation_service
+from app.services.job_events import job_events
+from app.services.result_cache import generation_result_cache
+from app.services.job_progress import (
+    JobProgressWriter,
+    claim_image_outcome,
+    finalize_job_status,
+    increment_job_counters,
+    touch_job,
+)
+from app.services import dead_letters, stage_timings
+from app.services.stage_timings import StageTimer
 from app.services.storage_service import storage_service
 from app.services.watermark_service import WatermarkService
 
+logger = logging.getLogger(__name__)
 
-@celery_app.task(bind=True)
+
+def _park_if_gemini_down(task) -> None:
+    """
+    Re-queue the task for later while the Gemini circuit breaker is open,
+    instead of making calls that are bound to fail. The job stays PENDING.
+    """
+    retry_after = gemini_circuit_breaker.retry_after()
+    if retry_after:
+        countdown = gemini_circuit_breaker.park_countdown(retry_after)
+        logger.warning(f"Gemini circuit open, parking task {task.request.id} for {countdown}s")
+        raise task.retry(countdown=countdown, max_retries=None)
+
+
+def _image_checkpointed(image: GeneratedImage) -> bool:
+    """
+    True if the image's outcome is already recorded, and counted in the
+    job's counters. Image rows are the tasks' checkpoints: a redelivered
+    task (acks_late) skips them instead of paying for the generation again.
+    """
+    if image.success is True:
+        return bool(image.output_image_path)
+    return image.success is False
+
+
+def _claim_outcome(db, image: GeneratedImage) -> bool:
+    """
+    Record the outcome set on the image row, unless another run of the same
+    image (a redelivered or requeued task) got there first - then its row
+    is kept and this run's changes are discarded. Only count the image in
+    the job's counters if this returns True.
+    """
+    if claim_image_outcome(db, image.id, image.success):
+        return True
+    db.refresh(image)
+    logger.info(f"Image {image.id} was already recorded by another run, discarding this result")
+    return False
+
+
+def _merge_generation_metadata(image: GeneratedImage, updates: dict) -> None:
+    """Merge keys into the image's generation_metadata JSON."""
+    try:
+        metadata = json.loads(image.generation_metadata) if image.generation_metadata else {}
+    except (TypeError, ValueError):
+        metadata = {}
+    metadata.update(updates)
+    image.generation_metadata = json.dumps(metadata)
+
+
+def _timing_labels(job: GenerationJob) -> tuple:
+    """(model, tier) labels of the stage timing histograms for a job's images."""
+    return generation_service.model, job.tier or job.job_type
+
+
+def _record_stage_timings(image: GeneratedImage, stats: dict, timer: StageTimer, labels: tuple) -> None:
+    """Store an image's stage timings with its generation stats, and add them to the histograms."""
+    _merge_generation_metadata(image, {**stats, **timer.metadata()})
+    stage_timings.record(timer.seconds, *labels)
+
+
+def _record_image_outcome(db, image: GeneratedImage, job: GenerationJob, error: Optional[Exception],
+                          stats: dict, timer: StageTimer, labels: tuple) -> None:
+    """
+    Bookkeeping after claiming an image's outcome: its stage timings, and
+    the dead-letter store (retryable failures are dead-lettered, successes
+    settle a dead letter the image had).
+    """
+    _record_stage_timings(image, stats, timer, labels)
+    dead_letters.record_image_outcome(db, image, job, error, stats, *labels)
+
+
+def _commit_timed(db, labels: tuple) -> None:
+    """Commit, recording the time in the db_commit histogram."""
+    started = time.perf_counter()
+    db.commit()
+    stage_timings.record({"db_commit": time.perf_counter() - started}, *labels)
+
+
+@worker_process_init.connect
+def warm_up_services(**kwargs):
+    """Build the generation engine and storage client when a worker process starts."""
+    for service in (generation_service, storage_service):
+        try:
+            service.warm_up()
+        except Exception as e:
+            # The first task will try again and report the error
+            logger.warning(f"{type(service).__name__} warm-up failed: {e}")
+
+
+@worker_process_init.connect
+def warm_board_cache(**kwargs):
+    """Preload the most-used design boards when a worker process starts."""
+    if settings.BOARD_CACHE_WARM_COUNT <= 0:
+        return
+
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(days=30)
+        uses = func.count(GeneratedImage.id)
+        rows = db.query(GeneratedImage.board_image_path, uses).filter(
+            GeneratedImage.board_image_path.isnot(None),
+            GeneratedImage.created_at >= since
+        ).group_by(GeneratedImage.board_image_path).order_by(uses.desc()).limit(
+            settings.BOARD_CACHE_WARM_COUNT
+        ).all()
+
+        loaded = generation_service.warm_board_cache(Path(path) for path, _ in rows)
+        logger.info(f"Board cache warmed with {loaded} boards: {generation_service.board_cache.stats()}")
+    except Exception as e:
+        logger.warning(f"Board cache warm-up skipped: {e}")
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, acks_late=True)
 def process_single_generation(self, job_id: int):
     """Process a single portrait generation job."""
     db = SessionLocal()
@@ -19,6 +160,7 @@ def process_single_generation(self, job_id: int):
 
         job.status = JobStatus.PROCESSING
         db.commit()
+        job_events.publish(job)
 
         # Get the image to process
         image = db.query(GeneratedImage).filter(GeneratedImage.job_id == job_id).first()
@@ -26,37 +168,35 @@ def process_single_generation(self, job_id: int):
             job.status = JobStatus.FAILED
             job.error_message = "No image found for job"
             db.commit()
+            job_events.publish(job)
             return {"error": "No image found"}
 
+        if _image_checkpointed(image):
+            logger.info(f"Job {job_id} already processed, skipping redelivered task")
+            return {"status": "completed", "job_id": job_id}
+
+        labels = _timing_labels(job)
+        timer = StageTimer()
         try:
             # Download input image from storage
-            temp_dir = Path("/tmp/generation") / str(job.id)
-            temp_dir.mkdir(parents=True, exist_ok=True)
-
-            input_temp_path = temp_dir / f"input_{image.id}.jpg"
-            storage_service.download_file(image.input_image_path, input_temp_path)
+            with timer.stage("download"):
+                selfie = _download_selfie(image.input_image_path)
 
             # Board path is still local (in templates/ directory)
             board_path = Path(image.board_image_path)
 
             # Generate portrait
             result_bytes = generation_service.generate_portrait(
-                selfie_path=input_temp_path,
+                selfie_path=selfie,
                 board_path=board_path,
-                prompt_id=job.prompt_id or "P2"
+                prompt_id=job.prompt_id or "P2",
+                timer=timer
             )
 
-            # Save result to temp file
-            output_temp_path = temp_dir / f"output_{job.id}_{image.id}.png"
-            output_temp_path.write_bytes(result_bytes)
-
             # Upload result to storage
             output_object_key = f"results/{job.user_id}/{job.id}_{image.id}.png"
-            storage_url = storage_service.upload_file(output_temp_path, output_object_key)
-
-            # Clean up temp files
-            input_temp_path.unlink(missing_ok=True)
-            output_temp_path.unlink(missing_ok=True)
+            with timer.stage("upload"):
+                storage_service.upload_bytes(result_bytes, output_object_key)
 
             # Update image record
             image.output_image_path = output_object_key
@@ -74,14 +214,16 @@ def process_single_generation(self, job_id: int):
             job.status = JobStatus.FAILED
             job.error_message = str(e)
 
-        db.commit()
+        _record_stage_timings(image, {}, timer, labels)
+        _commit_timed(db, labels)
+        job_events.publish(job, [image])
         return {"status": "completed", "job_id": job_id}
 
     finally:
         db.close()
 
 
-@celery_app.task(bind=True)
+@celery_app.task(bind=True, acks_late=True)
 def process_batch_generation(self, job_id: int):
     """Process a batch portrait generation job."""
     db = SessionLocal()
@@ -91,15 +233,20 @@ def process_batch_generation(self, job_id: int):
             return {"error": "Job not found"}
 
         job.status = JobStatus.PROCESSING
-        db.commit()
+        touch_job(db, job.id)
+        job_events.publish(job)
 
         # Get all images to process
         images = db.query(GeneratedImage).filter(GeneratedImage.job_id == job_id).all()
-
-        temp_dir = Path("/tmp/generation") / str(job.id)
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        labels = _timing_labels(job)
 
         for idx, image in enumerate(images):
+            if _image_checkpointed(image):
+                # Recorded before a worker crash, this is a redelivery
+                continue
+
+            timer = StageTimer()
+            error = None
             try:
                 # Update progress
                 self.update_state(
@@ -108,57 +255,50 @@ def process_batch_generation(self, job_id: int):
                 )
 
                 # Download input image from storage
-                input_temp_path = temp_dir / f"input_{image.id}.jpg"
-                storage_service.download_file(image.input_image_path, input_temp_path)
+                with timer.stage("download"):
+                    selfie = _download_selfie(image.input_image_path)
 
                 # Board path is still local (in templates/ directory)
                 board_path = Path(image.board_image_path)
 
                 # Generate portrait
                 result_bytes = generation_service.generate_portrait(
-                    selfie_path=input_temp_path,
+                    selfie_path=selfie,
                     board_path=board_path,
-                    prompt_id=job.prompt_id or "P2"
+                    prompt_id=job.prompt_id or "P2",
+                    timer=timer
                 )
 
-                # Save result to temp file
-                output_temp_path = temp_dir / f"output_{job.id}_{image.id}.png"
-                output_temp_path.write_bytes(result_bytes)
-
                 # Upload result to storage
                 output_object_key = f"results/{job.user_id}/{job.id}_{image.id}.png"
-                storage_url = storage_service.upload_file(output_temp_path, output_object_key)
-
-                # Clean up temp files
-                input_temp_path.unlink(missing_ok=True)
-                output_temp_path.unlink(missing_ok=True)
+                with timer.stage("upload"):
+                    storage_service.upload_bytes(result_bytes, output_object_key)
 
                 # Update image record
                 image.output_image_path = output_object_key
                 image.success = True
                 image.processed_at = datetime.utcnow()
 
-                job.completed_images += 1
-
             except Exception as e:
+                error = e
                 image.success = False
                 image.error_message = str(e)
-                job.failed_images += 1
 
-            db.commit()
+            # Images run one after the other, so each commits with its counter
+            if _claim_outcome(db, image):
+                _record_image_outcome(db, image, job, error, {}, timer, labels)
+                increment_job_counters(db, job.id, completed=int(image.success), failed=int(not image.success))
+                _commit_timed(db, labels)
+                job_events.publish(job, [image])
+            else:
+                db.commit()
 
-        # Update job status
-        if job.completed_images == job.total_images:
-            job.status = JobStatus.COMPLETED
-        elif job.completed_images > 0:
-            job.status = JobStatus.COMPLETED  # Partial success
-            job.error_message = f"{job.failed_images} images failed"
-        else:
-            job.status = JobStatus.FAILED
-            job.error_message = "All images failed to generate"
+        logger.info(f"Storage object cache after job {job_id}: {storage_service.object_cache.stats()}")
 
-        job.completed_at = datetime.utcnow()
+        # Update job status
+        finalize_job_status(db, job_id)
         db.commit()
+        job_events.publish(job)
 
         return {"status": "completed", "job_id": job_id}
 
@@ -166,129 +306,435 @@ def process_batch_generation(self, job_id: int):
         db.close()
 
 
-@celery_app.task(bind=True)
-def process_tier_generation(self, job_id: int):
+def _result_cache_scope(image_id: int) -> str:
     """
-    Process tier-based generation (free or premium).
-    Generates 5 photos with different prompts.
-    Applies watermarks for free tier.
+    Result-cache scope of an image: only later runs of the same image
+    (retries, redeliveries, replays) reuse its result, a new image is
+    always a new sample.
+    """
+    return f"image:{image_id}"
+
+
+def _keep_result_for_rerun(stats: dict, image_bytes: bytes) -> None:
     """
+    Cache a generated image that could not be stored, so the next run of the
+    image (retry, redelivery, replay) reuses it instead of paying for
+    another Gemini call. Results served from the cache are already there.
+    """
+    if stats.get("fingerprint") and "result_cache" not in stats:
+        generation_result_cache.put(stats["fingerprint"], image_bytes)
+
+
+def _download_selfie(object_key: str) -> ImagePart:
+    """Fetch an input photo from storage straight into memory."""
+    return ImagePart(data=storage_service.download_bytes(object_key), mime_type=mime_for(Path(object_key)))
+
+
+def _store_tier_image(job_id: int, user_id: int, image_id: int, is_watermarked: bool,
+                      unwatermarked_bytes: bytes, timer: StageTimer) -> dict:
+    """
+    Upload the unwatermarked (and, for free tier, watermarked) versions of a
+    generated tier image and return their object keys.
+    """
+    # ALWAYS save unwatermarked version first
+    unwatermarked_object_key = f"results/{user_id}/unwatermarked_{job_id}_{image_id}.png"
+    with timer.stage("upload"):
+        storage_service.upload_bytes(unwatermarked_bytes, unwatermarked_object_key)
+
+    # For free tier, ALSO save watermarked version for display
+    watermarked_object_key = None
+    if is_watermarked:
+        watermarked_bytes = WatermarkService.add_watermark(
+            unwatermarked_bytes,
+            position="bottom_right",
+            # Uses default opacity (0.7) for better visibility
+            timer=timer
+        )
+
+        watermarked_object_key = f"results/{user_id}/watermarked_{job_id}_{image_id}.png"
+        with timer.stage("upload"):
+            storage_service.upload_bytes(watermarked_bytes, watermarked_object_key)
+
+    return {
+        "unwatermarked_object_key": unwatermarked_object_key,
+        "watermarked_object_key": watermarked_object_key,
+    }
+
+
+def _generate_and_store_tier_image(job_id: int, user_id: int, image_id: int, prompt_text: str,
+                                   is_watermarked: bool, selfie: ImagePart, board_path: Path,
+                                   retry_budget: RetryBudget, stats: dict, timer: StageTimer) -> dict:
+    """
+    Generate one tier image and store it. Runs in a worker thread, so it takes
+    plain values instead of ORM objects and never touches the DB session - it
+    only returns the object keys for the caller to record.
+    """
+    # Generate portrait using custom prompt (unwatermarked version)
+    unwatermarked_bytes = generation_service.generate_portrait(
+        selfie_path=selfie,
+        board_path=board_path,
+        custom_prompt=prompt_text,
+        retry_budget=retry_budget,
+        stats=stats,
+        use_result_cache=True,
+        result_cache_scope=_result_cache_scope(image_id),
+        timer=timer
+    )
+    try:
+        return _store_tier_image(job_id, user_id, image_id, is_watermarked, unwatermarked_bytes, timer)
+    except Exception:
+        _keep_result_for_rerun(stats, unwatermarked_bytes)
+        raise
+
+
+async def _generate_and_store_tier_image_async(job_id: int, user_id: int, image_id: int, prompt_text: str,
+                                               is_watermarked: bool, selfie: ImagePart, board_path: Path,
+                                               retry_budget: RetryBudget, stats: dict,
+                                               timer: StageTimer) -> dict:
+    """Event-loop version of _generate_and_store_tier_image."""
+    unwatermarked_bytes = await generation_service.generate_portrait_async(
+        selfie_path=selfie,
+        board_path=board_path,
+        custom_prompt=prompt_text,
+        retry_budget=retry_budget,
+        stats=stats,
+        use_result_cache=True,
+        result_cache_scope=_result_cache_scope(image_id),
+        timer=timer
+    )
+    # Watermarking and upload are blocking, keep them off the loop
+    try:
+        return await asyncio.to_thread(
+            _store_tier_image, job_id, user_id, image_id, is_watermarked, unwatermarked_bytes, timer
+        )
+    except Exception:
+        await asyncio.to_thread(_keep_result_for_rerun, stats, unwatermarked_bytes)
+        raise
+
+
+def _record_tier_image_keys(image: GeneratedImage, keys: dict) -> None:
+    """Point a successfully generated image at its stored versions."""
+    if keys["watermarked_object_key"]:
+        # For free tier: show watermarked version
+        image.output_image_path = keys["watermarked_object_key"]
+    else:
+        # For premium tier: show unwatermarked version
+        image.output_image_path = keys["unwatermarked_object_key"]
+
+    # Update image record with BOTH paths
+    image.output_image_path_unwatermarked = keys["unwatermarked_object_key"]  # Always saved
+    image.success = True
+    image.error_message = None
+    image.processed_at = datetime.utcnow()
+
+
+def _run_tier_job(task, job_id: int, use_event_loop: bool):
+    """
+    Shared body of the tier generation tasks when TIER_JOB_CHORD_ENABLED is
+    off: the whole job runs inside one task.
+
+    All prompts of the job are started at once - either on a bounded thread
+    pool or on the worker process's event loop - and each image is recorded
+    (DB row, counters, progress) on the task thread as soon as its result
+    arrives.
+    """
+    _park_if_gemini_down(task)
+
     db = SessionLocal()
     try:
         job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
         if not job:
             return {"error": "Job not found"}
 
+        if job.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+            # Redelivered after the job already finished
+            return {"status": "completed", "job_id": job_id}
+
         job.status = JobStatus.PROCESSING
-        db.commit()
+        touch_job(db, job.id)
+        job_events.publish(job)
 
         # Get all images to process (one per prompt)
         images = db.query(GeneratedImage).filter(GeneratedImage.job_id == job_id).all()
 
-        temp_dir = Path("/tmp/generation") / str(job.id)
-        temp_dir.mkdir(parents=True, exist_ok=True)
-
         # Download input image once (same for all prompts)
         if not images:
             job.status = JobStatus.FAILED
             job.error_message = "No images found for job"
             db.commit()
+            job_events.publish(job)
             return {"error": "No images found"}
 
+        # Resume after a redelivery: images already recorded are not generated again
+        pending_images = [image for image in images if not _image_checkpointed(image)]
+        processed = len(images) - len(pending_images)
+        if processed:
+            logger.info(f"Resuming job {job_id}: {processed}/{len(images)} images already recorded")
+
+        labels = _timing_labels(job)
+        timers = {image.id: StageTimer() for image in pending_images}
+
         first_image = images[0]
-        input_temp_path = temp_dir / f"input_{first_image.id}.jpg"
-        storage_service.download_file(first_image.input_image_path, input_temp_path)
+        selfie = None
+        if pending_images:
+            # One download serves every image; it is charged to the first one
+            with timers[pending_images[0].id].stage("download"):
+                selfie = _download_selfie(first_image.input_image_path)
 
         # Board path is local
         board_path = Path(first_image.board_image_path)
 
-        # Process each prompt
-        for idx, image in enumerate(images):
-            try:
-                # Update progress
-                self.update_state(
-                    state='PROGRESS',
-                    meta={'current': idx, 'total': len(images)}
-                )
-
-                # Generate portrait using custom prompt (unwatermarked version)
-                unwatermarked_bytes = generation_service.generate_portrait(
-                    selfie_path=input_temp_path,
-                    board_path=board_path,
-                    custom_prompt=image.prompt_text
-                )
-
-                # ALWAYS save unwatermarked version first
-                unwatermarked_temp_path = temp_dir / f"unwatermarked_{job.id}_{image.id}.png"
-                unwatermarked_temp_path.write_bytes(unwatermarked_bytes)
+        max_workers = max(1, min(len(pending_images), settings.generation_concurrency_for_tier(job.tier)))
+        pool = None if use_event_loop else ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"job{job.id}"
+        )
 
-                unwatermarked_object_key = f"results/{job.user_id}/unwatermarked_{job.id}_{image.id}.png"
-                storage_service.upload_file(unwatermarked_temp_path, unwatermarked_object_key)
-                unwatermarked_temp_path.unlink(missing_ok=True)
+        # Transient Gemini errors are retried in place, within one budget per job
+        retry_budget = RetryBudget()
+        image_stats = {image.id: {} for image in pending_images}
 
-                # For free tier, ALSO save watermarked version for display
-                if job.is_watermarked:
-                    watermarked_bytes = WatermarkService.add_watermark(
-                        unwatermarked_bytes,
-                        position="bottom_right"
-                        # Uses default opacity (0.7) for better visibility
+        try:
+            futures = {}
+            for image in pending_images:
+                args = (job.id, job.user_id, image.id, image.prompt_text, job.is_watermarked,
+                        selfie, board_path, retry_budget, image_stats[image.id], timers[image.id])
+                if use_event_loop:
+                    future = event_loop.submit(_generate_and_store_tier_image_async(*args))
+                else:
+                    future = pool.submit(_generate_and_store_tier_image, *args)
+                futures[future] = image
+
+            # Record each image as soon as it finishes; images finishing
+            # close together share one transaction
+            progress = JobProgressWriter(db, job.id)
+            recorded = []  # Images written by the next flush
+            waiting = set(futures)
+            while waiting:
+                done, waiting = wait(waiting, timeout=progress.seconds_until_due(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    image = futures[future]
+                    error = None
+                    try:
+                        _record_tier_image_keys(image, future.result())
+
+                    except Exception as e:
+                        error = e
+                        image.success = False
+                        image.error_message = str(e)
+
+                    if _claim_outcome(db, image):
+                        _record_image_outcome(db, image, job, error, image_stats[image.id], timers[image.id], labels)
+                        progress.record(succeeded=image.success)
+                        recorded.append(image)
+
+                    # Update progress
+                    processed += 1
+                    task.update_state(
+                        state='PROGRESS',
+                        meta={'current': processed, 'total': len(images)}
                     )
+                started = time.perf_counter()
+                if progress.flush_if_due() is not None:
+                    stage_timings.record({"db_commit": time.perf_counter() - started}, *labels)
+                    job_events.publish(job, recorded)
+                    recorded = []
+            if progress.pending:
+                started = time.perf_counter()
+                progress.flush()
+                stage_timings.record({"db_commit": time.perf_counter() - started}, *labels)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+        finalize_job_status(db, job_id)
+        db.commit()
+        job_events.publish(job, recorded)
 
-                    watermarked_temp_path = temp_dir / f"watermarked_{job.id}_{image.id}.png"
-                    watermarked_temp_path.write_bytes(watermarked_bytes)
+        logger.info(f"Board cache after job {job_id}: {generation_service.board_cache.stats()}")
+        logger.info(f"Storage object cache after job {job_id}: {storage_service.object_cache.stats()}")
+        return {"status": "completed", "job_id": job_id}
 
-                    watermarked_object_key = f"results/{job.user_id}/watermarked_{job.id}_{image.id}.png"
-                    storage_service.upload_file(watermarked_temp_path, watermarked_object_key)
-                    watermarked_temp_path.unlink(missing_ok=True)
+    finally:
+        db.close()
 
-                    # For free tier: show watermarked version
-                    image.output_image_path = watermarked_object_key
-                else:
-                    # For premium tier: show unwatermarked version
-                    image.output_image_path = unwatermarked_object_key
 
-                # Update image record with BOTH paths
-                image.output_image_path_unwatermarked = unwatermarked_object_key  # Always saved
-                image.success = True
-                image.processed_at = datetime.utcnow()
+def _dispatch_tier_job(task, job_id: int):
+    """
+    Fan a tier job out as a chord: one generate_tier_image task per image,
+    which any worker can pick up, and finalize_tier_job once all are done.
+    """
+    _park_if_gemini_down(task)
 
-                job.completed_images += 1
+    db = SessionLocal()
+    try:
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if not job:
+            return {"error": "Job not found"}
 
-            except Exception as e:
-                image.success = False
-                image.error_message = str(e)
-                job.failed_images += 1
+        if job.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+            # Redelivered after the chord already finished
+            return {"status": "completed", "job_id": job_id}
 
+        images = db.query(GeneratedImage).filter(GeneratedImage.job_id == job_id).all()
+        if not images:
+            job.status = JobStatus.FAILED
+            job.error_message = "No images found for job"
             db.commit()
+            job_events.publish(job)
+            return {"error": "No images found"}
 
-        # Clean up input file
-        input_temp_path.unlink(missing_ok=True)
+        job.status = JobStatus.PROCESSING
+        touch_job(db, job.id)
+        job_events.publish(job)
 
-        # Update job status
-        if job.completed_images == job.total_images:
-            job.status = JobStatus.COMPLETED
-        elif job.completed_images > 0:
-            job.status = JobStatus.COMPLETED  # Partial success
-            job.error_message = f"{job.failed_images} images failed"
+        # Members and callback stay on the job's tier queue
+        options = tier_queue_options(job.tier)
+        image_ids = [image.id for image in images if not _image_checkpointed(image)]
+        if not image_ids:
+            finalize_tier_job.apply_async(([], job_id), **options)
+            return {"status": "dispatched", "job_id": job_id, "images": 0}
+
+        chord(
+            generate_tier_image.s(image_id).set(**options) for image_id in image_ids
+        )(finalize_tier_job.s(job_id).set(**options))
+
+        return {"status": "dispatched", "job_id": job_id, "images": len(image_ids)}
+
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, acks_late=True)
+def process_tier_generation(self, job_id: int):
+    """
+    Process tier-based generation (free or premium).
+    Generates 5 photos with different prompts.
+    Applies watermarks for free tier.
+
+    With TIER_JOB_CHORD_ENABLED each image is its own task, spread over the
+    whole worker fleet. Otherwise prompts are sent to Gemini concurrently
+    from this task (bounded by the tier's *_TIER_GENERATION_CONCURRENCY
+    setting), and each image is recorded as soon as its result arrives.
+    """
+    if settings.TIER_JOB_CHORD_ENABLED:
+        return _dispatch_tier_job(self, job_id)
+    return _run_tier_job(self, job_id, use_event_loop=False)
+
+
+@celery_app.task(bind=True, acks_late=True)
+def process_tier_generation_async(self, job_id: int):
+    """
+    Same as process_tier_generation, but drives the Gemini calls from the
+    worker process's event loop (google-genai async client) instead of a
+    thread pool. The loop is shared by every task in the process and capped
+    by GEMINI_ASYNC_MAX_IN_FLIGHT.
+
+    With TIER_JOB_CHORD_ENABLED the job is dispatched exactly like
+    process_tier_generation: a chord member holds a single image, and
+    running it on the loop would only block the worker on one coroutine.
+    """
+    if settings.TIER_JOB_CHORD_ENABLED:
+        return _dispatch_tier_job(self, job_id)
+    return _run_tier_job(self, job_id, use_event_loop=True)
+
+
+@celery_app.task(bind=True, acks_late=True)
+def generate_tier_image(self, image_id: int, use_event_loop: bool = False):
+    """
+    Chord member of a tier job: generate and store one image.
+
+    Job counters are incremented in SQL so concurrent members on different
+    workers never overwrite each other. Failures are recorded on the image
+    rather than raised, so the chord callback always runs.
+
+    Always runs on the task thread: with one image per task the event loop
+    adds no concurrency. use_event_loop is ignored; it is kept so members
+    queued by earlier releases still run.
+    """
+    _park_if_gemini_down(self)
+
+    db = SessionLocal()
+    try:
+        image = db.query(GeneratedImage).filter(GeneratedImage.id == image_id).first()
+        if not image:
+            return {"image_id": image_id, "success": False, "error": "Image not found"}
+
+        job = db.query(GenerationJob).filter(GenerationJob.id == image.job_id).first()
+        if not job:
+            return {"image_id": image_id, "success": False, "error": "Job not found"}
+
+        if _image_checkpointed(image):
+            # Redelivered after the outcome was recorded and counted
+            return {"image_id": image_id, "success": bool(image.success)}
+
+        # Heartbeat for the stale-job reaper
+        touch_job(db, job.id)
+
+        # The job's retry budget, shared through Redis with the other images
+        # (they may run on different workers)
+        retry_budget = JobRetryBudget(job.id)
+        stats = {}
+        labels = _timing_labels(job)
+        timer = StageTimer()
+        error = None
+
+        try:
+            with timer.stage("download"):
+                selfie = _download_selfie(image.input_image_path)
+
+            args = (job.id, job.user_id, image.id, image.prompt_text, job.is_watermarked,
+                    selfie, Path(image.board_image_path), retry_budget, stats, timer)
+            keys = _generate_and_store_tier_image(*args)
+
+            _record_tier_image_keys(image, keys)
+
+        except Exception as e:
+            error = e
+            image.success = False
+            image.error_message = str(e)
+
+        # Image row and counter commit together
+        if _claim_outcome(db, image):
+            _record_image_outcome(db, image, job, error, stats, timer, labels)
+            increment_job_counters(db, job.id, completed=int(image.success), failed=int(not image.success))
+            _commit_timed(db, labels)
+            job_events.publish(job, [image])
         else:
-            job.status = JobStatus.FAILED
-            job.error_message = "All images failed to generate"
+            db.commit()
+
+        return {"image_id": image_id, "success": bool(image.success)}
+
+    finally:
+        db.close()
+
 
-        job.completed_at = datetime.utcnow()
+@celery_app.task(bind=True, acks_late=True)
+def finalize_tier_job(self, results: list, job_id: int):
+    """Chord callback: set the job's final status from its counters."""
+    db = SessionLocal()
+    try:
+        status = finalize_job_status(db, job_id)
         db.commit()
+        if status is None:
+            return {"error": "Job not found"}
+        job_events.publish(db.get(GenerationJob, job_id))
 
+        succeeded = sum(1 for result in results or [] if result and result.get("success"))
+        logger.info(f"Tier job {job_id} finished: {succeeded}/{len(results or [])} images, status {status.value}")
         return {"status": "completed", "job_id": job_id}
 
     finally:
         db.close()
 
 
-@celery_app.task(bind=True)
+@celery_app.task(bind=True, acks_late=True)
 def retry_single_image(self, image_id: int):
     """
     Retry generation of a single failed image.
     Follows the same watermark/unwatermarked logic based on job tier.
     """
+    _park_if_gemini_down(self)
+
     db = SessionLocal()
     try:
         # Get the image
@@ -301,45 +747,55 @@ def retry_single_image(self, image_id: int):
         if not job:
             return {"error": "Job not found"}
 
-        temp_dir = Path("/tmp/retry") / str(job.id)
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        if _image_checkpointed(image):
+            # The /retry endpoint resets the image, so this is a redelivery
+            return {"status": "completed", "image_id": image_id}
+
+        # Heartbeat for the stale-job reaper
+        touch_job(db, job.id)
+
+        stats = {}
+        labels = _timing_labels(job)
+        timer = StageTimer()
+        error = None
+        unwatermarked_bytes = None
 
         try:
             # Download input image from storage
-            input_temp_path = temp_dir / f"input_{image.id}.jpg"
-            storage_service.download_file(image.input_image_path, input_temp_path)
+            with timer.stage("download"):
+                selfie = _download_selfie(image.input_image_path)
 
             # Board path is local
             board_path = Path(image.board_image_path)
 
             # Generate unwatermarked portrait using the custom prompt
             unwatermarked_bytes = generation_service.generate_portrait(
-                selfie_path=input_temp_path,
+                selfie_path=selfie,
                 board_path=board_path,
-                custom_prompt=image.prompt_text
+                custom_prompt=image.prompt_text,
+                retry_budget=RetryBudget(),
+                stats=stats,
+                use_result_cache=True,
+                result_cache_scope=_result_cache_scope(image.id),
+                timer=timer
             )
 
             # ALWAYS save unwatermarked version first
-            unwatermarked_temp_path = temp_dir / f"unwatermarked_{image.id}.png"
-            unwatermarked_temp_path.write_bytes(unwatermarked_bytes)
-
             unwatermarked_object_key = f"results/{job.user_id}/unwatermarked_{job.id}_{image.id}.png"
-            storage_service.upload_file(unwatermarked_temp_path, unwatermarked_object_key)
-            unwatermarked_temp_path.unlink(missing_ok=True)
+            with timer.stage("upload"):
+                storage_service.upload_bytes(unwatermarked_bytes, unwatermarked_object_key)
 
             # For free tier, ALSO save watermarked version for display
             if job.is_watermarked:
                 watermarked_bytes = WatermarkService.add_watermark(
                     unwatermarked_bytes,
-                    position="bottom_right"
+                    position="bottom_right",
+                    timer=timer
                 )
 
-                watermarked_temp_path = temp_dir / f"watermarked_{image.id}.png"
-                watermarked_temp_path.write_bytes(watermarked_bytes)
-
                 watermarked_object_key = f"results/{job.user_id}/watermarked_{job.id}_{image.id}.png"
-                storage_service.upload_file(watermarked_temp_path, watermarked_object_key)
-                watermarked_temp_path.unlink(missing_ok=True)
+                with timer.stage("upload"):
+                    storage_service.upload_bytes(watermarked_bytes, watermarked_object_key)
 
                 # For free tier: show watermarked version
                 image.output_image_path = watermarked_object_key
@@ -353,34 +809,70 @@ def retry_single_image(self, image_id: int):
             image.error_message = None
             image.processed_at = datetime.now(timezone.utc)
 
-            # Clean up input file
-            input_temp_path.unlink(missing_ok=True)
-
-            # Update job counters
-            job.completed_images += 1
-
-            # Update job status if needed
-            if job.completed_images == job.total_images:
-                job.status = JobStatus.COMPLETED
-                job.completed_at = datetime.now(timezone.utc)
-
         except Exception as e:
+            error = e
             image.success = False
             image.error_message = str(e)
-            job.failed_images += 1
-
-        db.commit()
+            if unwatermarked_bytes is not None:
+                _keep_result_for_rerun(stats, unwatermarked_bytes)
+
+        # Update job counters, and the job status once every image has an outcome
+        if _claim_outcome(db, image):
+            _record_image_outcome(db, image, job, error, stats, timer, labels)
+            increment_job_counters(db, job.id, completed=int(image.success), failed=int(not image.success))
+            finalize_job_status(db, job.id, only_if_finished=True)
+            _commit_timed(db, labels)
+            job_events.publish(job, [image])
+        else:
+            db.commit()
         return {"status": "completed", "image_id": image_id}
 
     finally:
         db.close()
 
 
-@celery_app.task(bind=True)
+def _regenerate_unwatermarked_image(job_id: int, user_id: int, image_id: int, input_image_path: str,
+                                    board_image_path: str, prompt_text: str, timer: StageTimer) -> str:
+    """
+    Regenerate a legacy image that was stored before unwatermarked originals
+    were kept, and upload it as the unwatermarked version. Runs in a worker
+    thread, so it takes plain values and returns the new object key.
+    """
+    with timer.stage("download"):
+        selfie = _download_selfie(input_image_path)
+
+    # Same prompt, served from the result cache if an earlier run could not store it
+    stats = {}
+    result_bytes = generation_service.generate_portrait(
+        selfie_path=selfie,
+        board_path=Path(board_image_path),
+        custom_prompt=prompt_text,
+        stats=stats,
+        use_result_cache=True,
+        result_cache_scope=_result_cache_scope(image_id),
+        timer=timer
+    )
+
+    # NO watermark this time!
+    try:
+        keys = _store_tier_image(job_id, user_id, image_id, False, result_bytes, timer)
+    except Exception:
+        _keep_result_for_rerun(stats, result_bytes)
+        raise
+    return keys["unwatermarked_object_key"]
+
+
+@celery_app.task(bind=True, acks_late=True)
 def regenerate_unwatermarked_photos(self, user_id: int):
     """
-    Regenerate all watermarked photos without watermarks after premium upgrade.
+    Remove watermarks from a user's photos after premium upgrade.
     This is called after a user purchases premium tier.
+
+    Tier generation already stores an unwatermarked original for every
+    image, so those images are promoted by pointing output_image_path at it
+    - a metadata update, no Gemini call. Only legacy rows without an
+    unwatermarked original are regenerated, in parallel batches of
+    UNWATERMARK_REGENERATION_BATCH_SIZE.
     """
     db = SessionLocal()
     try:
@@ -394,65 +886,100 @@ def regenerate_unwatermarked_photos(self, user_id: int):
         if not jobs:
             return {"status": "no_jobs", "message": "No watermarked photos to regenerate"}
 
-        total_regenerated = 0
-        temp_dir = Path("/tmp/regeneration") / str(user_id)
-        temp_dir.mkdir(parents=True, exist_ok=True)
-
-        for job in jobs:
-            # Get all successful images from this job
-            images = db.query(GeneratedImage).filter(
-                GeneratedImage.job_id == job.id,
-                GeneratedImage.success == True
-            ).all()
-
-            for image in images:
-                try:
-                    # Download input image from storage
-                    input_temp_path = temp_dir / f"input_{image.id}.jpg"
-                    storage_service.download_file(image.input_image_path, input_temp_path)
-
-                    # Board path is still local
-                    board_path = Path(image.board_image_path)
-
-                    # Generate unwatermarked version using the same prompt
-                    result_bytes = generation_service.generate_portrait(
-                        selfie_path=input_temp_path,
-                        board_path=board_path,
-                        custom_prompt=image.prompt_text
-                    )
-
-                    # NO watermark this time!
-
-                    # Save result to temp file
-                    output_temp_path = temp_dir / f"unwatermarked_{image.id}.png"
-                    output_temp_path.write_bytes(result_bytes)
-
-                    # Upload unwatermarked version to storage (replace watermarked version)
-                    storage_url = storage_service.upload_file(output_temp_path, image.output_image_path)
+        # Get all successful images from these jobs
+        images = db.query(GeneratedImage).filter(
+            GeneratedImage.job_id.in_([job.id for job in jobs]),
+            GeneratedImage.success == True
+        ).all()
 
-                    # Clean up temp files
-                    input_temp_path.unlink(missing_ok=True)
-                    output_temp_path.unlink(missing_ok=True)
+        # Watermarked objects that nothing points at once their image is promoted
+        stale_object_keys = []
+        legacy_images = []
+        total_promoted = 0
 
-                    total_regenerated += 1
+        for image in images:
+            if not image.output_image_path_unwatermarked:
+                legacy_images.append(image)
+                continue
+            if image.output_image_path and image.output_image_path != image.output_image_path_unwatermarked:
+                stale_object_keys.append(image.output_image_path)
+            image.output_image_path = image.output_image_path_unwatermarked
+            total_promoted += 1
 
-                except Exception as e:
-                    # Log error but continue with other images
-                    print(f"Failed to regenerate image {image.id}: {e}")
+        db.commit()
+        # Delete right away: a parked or retried run finds these images already
+        # promoted and would never see their watermarked objects again
+        for object_key in stale_object_keys:
+            storage_service.delete_file(object_key)
+        logger.info(f"Promoted {total_promoted} unwatermarked originals for user {user_id}, "
+                    f"{len(legacy_images)} legacy images to regenerate")
 
-        # Update all jobs to mark them as unwatermarked
+        total_regenerated = 0
+        failed_job_ids = set()
+
+        if legacy_images:
+            # Promotions are committed, so a parked retry only redoes the legacy rows
+            _park_if_gemini_down(self)
+
+            batch_size = max(1, settings.UNWATERMARK_REGENERATION_BATCH_SIZE)
+            # Watermarked jobs are all free tier, so their images share labels
+            labels = _timing_labels(jobs[0])
+            timers = {image.id: StageTimer() for image in legacy_images}
+
+            with ThreadPoolExecutor(max_workers=batch_size, thread_name_prefix=f"unwm{user_id}") as pool:
+                for start in range(0, len(legacy_images), batch_size):
+                    batch = legacy_images[start:start + batch_size]
+                    replaced_object_keys = []
+                    futures = {
+                        pool.submit(_regenerate_unwatermarked_image, image.job_id, user_id, image.id,
+                                    image.input_image_path, image.board_image_path, image.prompt_text,
+                                    timers[image.id]): image
+                        for image in batch
+                    }
+
+                    for future in as_completed(futures):
+                        image = futures[future]
+                        try:
+                            object_key = future.result()
+                        except Exception as e:
+                            # Log error but continue with other images
+                            logger.error(f"Failed to regenerate image {image.id}: {e}")
+                            failed_job_ids.add(image.job_id)
+                            continue
+
+                        if image.output_image_path and image.output_image_path != object_key:
+                            replaced_object_keys.append(image.output_image_path)
+                        image.output_image_path = object_key
+                        image.output_image_path_unwatermarked = object_key
+                        _record_stage_timings(image, {}, timers[image.id], labels)
+                        total_regenerated += 1
+
+                    _commit_timed(db, labels)
+                    for object_key in replaced_object_keys:
+                        storage_service.delete_file(object_key)
+
+            logger.info(f"Storage object cache after regenerating for user {user_id}: "
+                        f"{storage_service.object_cache.stats()}")
+
+        # Mark jobs as unwatermarked; jobs with a failed regeneration stay
+        # watermarked so running the task again picks them up
         for job in jobs:
-            job.is_watermarked = False
+            if job.id not in failed_job_ids:
+                job.is_watermarked = False
 
         db.commit()
 
         return {
             "status": "success",
             "user_id": user_id,
-            "jobs_updated": len(jobs),
-            "photos_regenerated": total_regenerated
+            "jobs_updated": len(jobs) - len(failed_job_ids),
+            "photos_promoted": total_promoted,
+            "photos_regenerated": total_regenerated,
+            "photos_failed": len(legacy_images) - total_regenerated
         }
 
+    except Retry:
+        raise
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
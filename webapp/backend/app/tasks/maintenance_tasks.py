@@ -0,0 +1,339 @@
+"""
+Periodic maintenance tasks, run by Celery beat on the maintenance queue.
+
+reap_stale_jobs recovers jobs lost to dead workers. A job that is still
+PROCESSING, has had no heartbeat (updated_at) for STALE_JOB_THRESHOLD_SECONDS
+and has no task on any worker or waiting in a queue is requeued; the generation tasks skip images
+whose outcome is already recorded, so only the unfinished images are
+generated again. A job requeued more than STALE_JOB_MAX_REQUEUES times
+(e.g. an image that keeps killing its worker) has its unfinished images
+failed instead.
+
+replay_dead_letters regenerates dead-lettered images in bulk (see
+app.services.dead_letters), keeping at most `concurrency` replays in flight
+and dispatching at most `rate_per_minute` of them. It backs the
+replay_dead_letters_task (admin endpoint) and scripts/replay_dead_letters.py.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.db.database import SessionLocal
+from app.models import DeadLetter, DeadLetterStatus, GenerationJob, GeneratedImage, JobStatus
+from app.services.circuit_breaker import gemini_circuit_breaker
+from app.services.job_events import job_events
+from app.services.job_progress import (
+    claim_image_outcome,
+    finalize_job_status,
+    increment_job_counters,
+    reset_image_outcome,
+    touch_job,
+)
+from app.tasks.celery_app import celery_app
+from app.tasks.generation_tasks import (
+    process_batch_generation,
+    process_single_generation,
+    process_tier_generation,
+    process_tier_generation_async,
+    retry_single_image,
+)
+from app.tasks.queues import tier_queue_options, waiting_tasks
+
+logger = logging.getLogger(__name__)
+
+REQUEUE_COUNT_KEY = "gradgen:reaper:requeues:{job_id}"
+REQUEUE_COUNT_TTL_SECONDS = 7 * 24 * 3600
+REAP_BATCH_SIZE = 100
+
+# How often the replay loop looks again while it waits for in-flight replays
+REPLAY_POLL_SECONDS = 2.0
+
+# Tasks whose last positional argument is a job id, and tasks whose first is an image id
+JOB_TASKS = {
+    "process_single_generation",
+    "process_batch_generation",
+    "process_tier_generation",
+    "process_tier_generation_async",
+    "finalize_tier_job",
+}
+IMAGE_TASKS = {"generate_tier_image", "retry_single_image"}
+
+
+def _busy_job_ids(db) -> Optional[set]:
+    """
+    Jobs with a task waiting in a queue, or that a worker is running, holds
+    in its prefetch buffer or has scheduled for later. None if no worker
+    answered.
+
+    Chord members of a job dispatched during a backlog can sit in the queue
+    longer than the stale threshold; they must not be mistaken for lost.
+    """
+    # Queues first: a message fetched by a worker in between then shows up
+    # in the inspection, instead of in neither
+    requests = [{"name": name, "args": args} for name, args in waiting_tasks()]
+
+    inspector = celery_app.control.inspect(timeout=settings.STALE_JOB_INSPECT_TIMEOUT_SECONDS)
+    answered = False
+    for method in (inspector.active, inspector.reserved, inspector.scheduled):
+        replies = method()
+        if replies is None:
+            continue
+        answered = True
+        for tasks in replies.values():
+            # Scheduled entries wrap the task request
+            requests.extend(task.get("request", task) for task in tasks)
+
+    if not answered:
+        return None
+
+    job_ids = set()
+    image_ids = set()
+    for request in requests:
+        name = (request.get("name") or "").rsplit(".", 1)[-1]
+        args = request.get("args")
+        if not isinstance(args, (list, tuple)) or not args:
+            continue
+        if name in JOB_TASKS:
+            job_ids.add(int(args[-1]))
+        elif name in IMAGE_TASKS:
+            image_ids.add(int(args[0]))
+
+    if image_ids:
+        rows = db.query(GeneratedImage.job_id).filter(GeneratedImage.id.in_(image_ids)).distinct()
+        job_ids.update(row.job_id for row in rows)
+    return job_ids
+
+
+def _requeue_job(db, job: GenerationJob) -> str:
+    """Send the job's task again; returns the new task id."""
+    if job.job_type == "single":
+        task = process_single_generation.apply_async((job.id,))
+    elif job.job_type == "batch":
+        task = process_batch_generation.apply_async((job.id,))
+    else:
+        task_function = process_tier_generation_async if settings.GENERATION_ASYNC_ENABLED else process_tier_generation
+        task = task_function.apply_async((job.id,), **tier_queue_options(job.tier))
+
+    job.celery_task_id = task.id
+    # Fresh heartbeat: the requeued task gets a full threshold to start
+    touch_job(db, job.id)
+    return task.id
+
+
+def _fail_unfinished_images(db, job: GenerationJob) -> int:
+    """Give up on a job's unfinished images and finalize it; returns how many failed."""
+    unfinished = db.query(GeneratedImage.id).filter(
+        GeneratedImage.job_id == job.id,
+        GeneratedImage.success.is_(None)
+    ).all()
+
+    failed = 0
+    for row in unfinished:
+        if claim_image_outcome(db, row.id, False):
+            failed += 1
+    db.query(GeneratedImage).filter(
+        GeneratedImage.id.in_([row.id for row in unfinished]),
+        GeneratedImage.error_message.is_(None)
+    ).update({GeneratedImage.error_message: "Generation was interrupted too many times"},
+             synchronize_session=False)
+
+    increment_job_counters(db, job.id, failed=failed)
+    finalize_job_status(db, job.id)
+    db.commit()
+    job_events.publish(job)
+    return failed
+
+
+@celery_app.task(bind=True)
+def reap_stale_jobs(self):
+    """Requeue the unfinished images of jobs whose worker died (see module docstring)."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.STALE_JOB_THRESHOLD_SECONDS)
+
+    db = SessionLocal()
+    try:
+        heartbeat = func.coalesce(GenerationJob.updated_at, GenerationJob.created_at)
+        stale_jobs = db.query(GenerationJob).filter(
+            GenerationJob.status == JobStatus.PROCESSING,
+            heartbeat < cutoff
+        ).order_by(heartbeat).limit(REAP_BATCH_SIZE).all()
+
+        if not stale_jobs:
+            return {"stale": 0, "requeued": [], "failed": []}
+
+        busy_job_ids = _busy_job_ids(db)
+        if busy_job_ids is None:
+            # Without an answer a slow worker looks dead; try again next run
+            logger.warning(f"{len(stale_jobs)} stale jobs, but no worker answered the inspection; skipping")
+            return {"stale": len(stale_jobs), "requeued": [], "failed": [], "skipped": True}
+
+        requeued = []
+        failed = []
+        client = get_redis()
+        for job in stale_jobs:
+            if job.id in busy_job_ids:
+                continue
+
+            count_key = REQUEUE_COUNT_KEY.format(job_id=job.id)
+            requeues = client.incr(count_key)
+            client.expire(count_key, REQUEUE_COUNT_TTL_SECONDS)
+
+            if requeues > settings.STALE_JOB_MAX_REQUEUES:
+                images_failed = _fail_unfinished_images(db, job)
+                logger.error(f"Job {job.id} lost its worker {requeues} times, "
+                             f"failed {images_failed} unfinished images")
+                failed.append(job.id)
+            else:
+                last_heartbeat = job.updated_at or job.created_at
+                task_id = _requeue_job(db, job)
+                logger.warning(f"Job {job.id} stale since {last_heartbeat}, "
+                               f"requeued as task {task_id} (requeue {requeues}/{settings.STALE_JOB_MAX_REQUEUES})")
+                requeued.append(job.id)
+
+        return {"stale": len(stale_jobs), "requeued": requeued, "failed": failed}
+
+    finally:
+        db.close()
+
+
+def _replays_in_flight(db) -> int:
+    """Replays queued or running; ones older than the visibility timeout are presumed lost."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.CELERY_VISIBILITY_TIMEOUT_SECONDS)
+    return db.query(DeadLetter).filter(
+        DeadLetter.status == DeadLetterStatus.REPLAYING,
+        DeadLetter.updated_at >= cutoff
+    ).count()
+
+
+def _replayable_letters(db, error_type: Optional[str], letter_ids: Optional[Iterable[int]]):
+    """Query of the dead letters a replay may pick, oldest first."""
+    query = db.query(DeadLetter).filter(
+        DeadLetter.status == DeadLetterStatus.PENDING,
+        DeadLetter.replay_count < settings.DEAD_LETTER_MAX_REPLAYS
+    )
+    if error_type:
+        query = query.filter(DeadLetter.error_type == error_type)
+    if letter_ids:
+        query = query.filter(DeadLetter.id.in_(list(letter_ids)))
+    return query.order_by(DeadLetter.created_at, DeadLetter.id)
+
+
+def _replay_letter(db, letter: DeadLetter) -> Optional[str]:
+    """
+    Reset the letter's image and queue retry_single_image for it; returns
+    the task id, or None if the image no longer needs it.
+    """
+    image = letter.image
+    job = db.query(GenerationJob).filter(GenerationJob.id == letter.job_id).first()
+    if image is None or job is None:
+        letter.status = DeadLetterStatus.EXHAUSTED
+        db.commit()
+        return None
+    if image.success is not False:
+        # Retried by its user in the meantime: done, or still running (its
+        # outcome settles the letter)
+        letter.status = DeadLetterStatus.REPLAYED if image.success else DeadLetterStatus.REPLAYING
+        db.commit()
+        return None
+
+    reset_image_outcome(db, image, job)
+    letter.status = DeadLetterStatus.REPLAYING
+    letter.replay_count += 1
+    letter.replayed_at = datetime.now(timezone.utc)
+    db.commit()
+    job_events.publish(job)
+
+    return retry_single_image.delay(image.id).id
+
+
+def replay_dead_letters(db, limit: int, concurrency: int = None, rate_per_minute: float = None,
+                        error_type: Optional[str] = None, letter_ids: Optional[Iterable[int]] = None,
+                        max_seconds: Optional[float] = None, dry_run: bool = False,
+                        on_replay: Optional[Callable[[DeadLetter, str], None]] = None) -> dict:
+    """
+    Replay pending dead letters, oldest first.
+
+    Waits while `concurrency` replays are in flight or the Gemini circuit
+    breaker is open, and spaces dispatches 60 / rate_per_minute seconds
+    apart. Each letter is replayed at most once per call.
+
+    Args:
+        db: Session
+        limit: Most letters to replay
+        concurrency: Most replays in flight (default DEAD_LETTER_REPLAY_CONCURRENCY)
+        rate_per_minute: Most dispatches per minute (default DEAD_LETTER_REPLAY_RATE_PER_MINUTE)
+        error_type: Only letters that failed with this exception class (optional)
+        letter_ids: Only these letters (optional)
+        max_seconds: Stop after this long, leaving the rest pending (optional)
+        dry_run: Only count the letters that would be replayed
+        on_replay: Called with (letter, task id) after each dispatch (optional)
+
+    Returns:
+        Replayed letter ids, letters still pending and why the loop stopped
+    """
+    concurrency = max(1, concurrency or settings.DEAD_LETTER_REPLAY_CONCURRENCY)
+    interval = 60.0 / (rate_per_minute or settings.DEAD_LETTER_REPLAY_RATE_PER_MINUTE)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+
+    if dry_run:
+        matching = _replayable_letters(db, error_type, letter_ids).count()
+        return {"replayed": [], "pending": matching, "stopped": "dry_run", "would_replay": min(limit, matching)}
+
+    replayed = []
+    stopped = "limit"
+    while len(replayed) < limit:
+        if deadline is not None and time.monotonic() >= deadline:
+            stopped = "max_seconds"
+            break
+
+        retry_after = gemini_circuit_breaker.retry_after()
+        if retry_after:
+            logger.info(f"Gemini circuit open, dead-letter replay waits {retry_after}s")
+            time.sleep(min(retry_after, REPLAY_POLL_SECONDS * 5))
+            continue
+
+        if _replays_in_flight(db) >= concurrency:
+            time.sleep(REPLAY_POLL_SECONDS)
+            continue
+
+        letter = _replayable_letters(db, error_type, letter_ids).filter(
+            DeadLetter.id.notin_(replayed or [0])
+        ).first()
+        if letter is None:
+            stopped = "drained"
+            break
+
+        task_id = _replay_letter(db, letter)
+        if task_id is None:
+            continue
+        replayed.append(letter.id)
+        if on_replay is not None:
+            on_replay(letter, task_id)
+        if len(replayed) < limit:
+            time.sleep(interval)
+
+    pending = _replayable_letters(db, error_type, letter_ids).count()
+    logger.info(f"Dead-letter replay dispatched {len(replayed)} images, {pending} pending ({stopped})")
+    return {"replayed": replayed, "pending": pending, "stopped": stopped}
+
+
+@celery_app.task(bind=True)
+def replay_dead_letters_task(self, limit: int, concurrency: int = None, rate_per_minute: float = None,
+                             error_type: str = None, letter_ids: list = None):
+    """
+    replay_dead_letters on a maintenance worker, for the admin endpoint.
+    Stops after DEAD_LETTER_REPLAY_MAX_SECONDS (below the visibility
+    timeout, so the broker never redelivers a running replay).
+    """
+    db = SessionLocal()
+    try:
+        return replay_dead_letters(
+            db, limit, concurrency, rate_per_minute, error_type, letter_ids,
+            max_seconds=settings.DEAD_LETTER_REPLAY_MAX_SECONDS
+        )
+    finally:
+        db.close()
@@ -0,0 +1,128 @@
+"""
+Celery queues and task routing.
+
+Work is split over four queues so each can get its own worker pool:
+premium and free tier generations, retries of single images, and
+maintenance (bulk unwatermark regeneration). A flood of free-tier jobs then
+only delays the free pool, and paying users are served by theirs.
+
+Priorities, pool sizes and prefetch come from Settings (CELERY_<QUEUE>_*).
+Priorities only order messages waiting in the same queue, or - for a
+worker consuming several queues (python -m app.tasks.worker all) - let it
+drain the queues in QUEUE_NAMES order.
+"""
+import base64
+import json
+from typing import Iterator, Optional, Tuple
+
+from kombu import Queue
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+PREMIUM_QUEUE = "premium"
+FREE_QUEUE = "free"
+RETRY_QUEUE = "retry"
+MAINTENANCE_QUEUE = "maintenance"
+
+# Most urgent first
+QUEUE_NAMES = (PREMIUM_QUEUE, RETRY_QUEUE, FREE_QUEUE, MAINTENANCE_QUEUE)
+
+# Redis priority emulation: one list per priority step, named <queue><sep><priority>
+PRIORITY_STEPS = list(range(10))
+PRIORITY_SEPARATOR = ":"
+
+TASK_QUEUES = [Queue(name, routing_key=name) for name in QUEUE_NAMES]
+
+# Tasks with a fixed queue; tier generation tasks are routed per job tier
+# at dispatch time (see tier_queue_options)
+TASK_ROUTES = {
+    "app.tasks.generation_tasks.retry_single_image": RETRY_QUEUE,
+    "app.tasks.generation_tasks.regenerate_unwatermarked_photos": MAINTENANCE_QUEUE,
+    "app.tasks.maintenance_tasks.reap_stale_jobs": MAINTENANCE_QUEUE,
+    "app.tasks.maintenance_tasks.replay_dead_letters_task": MAINTENANCE_QUEUE,
+    "app.tasks.generation_tasks.process_single_generation": FREE_QUEUE,
+    "app.tasks.generation_tasks.process_batch_generation": FREE_QUEUE,
+}
+
+
+def queue_options(queue: str) -> dict:
+    """apply_async / signature options that send a task to a queue."""
+    return {"queue": queue, "priority": settings.celery_queue_config(queue)["priority"]}
+
+
+def tier_queue_options(tier: str) -> dict:
+    """Options for the generation tasks of a tier job."""
+    return queue_options(PREMIUM_QUEUE if tier == "premium" else FREE_QUEUE)
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery router for TASK_ROUTES; other tasks keep their own options."""
+    queue = TASK_ROUTES.get(name)
+    if queue is None:
+        return None
+    return queue_options(queue)
+
+
+def _queue_keys(name: str) -> list:
+    """Redis lists holding a queue's waiting messages, one per priority step."""
+    return [name if priority == 0 else f"{name}{PRIORITY_SEPARATOR}{priority}" for priority in PRIORITY_STEPS]
+
+
+def _decode_task_message(payload: bytes) -> Optional[Tuple[str, list]]:
+    """(task name, positional args) of a broker message, or None if it is not a task."""
+    try:
+        message = json.loads(payload)
+        body = message["body"]
+        if message.get("properties", {}).get("body_encoding") == "base64":
+            body = base64.b64decode(body)
+        args = json.loads(body)[0]
+        return message["headers"]["task"], args
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+
+
+def waiting_tasks(page_size: int = 500) -> Iterator[Tuple[str, list]]:
+    """
+    (task name, positional args) of every message waiting in the queues:
+    sent, but not yet fetched by a worker. Lists being consumed while they
+    are read may yield a message twice, never skip one still waiting.
+    """
+    client = get_redis()
+    for name in QUEUE_NAMES:
+        for key in _queue_keys(name):
+            start = 0
+            while True:
+                payloads = client.lrange(key, start, start + page_size - 1)
+                if not payloads:
+                    break
+                start += len(payloads)
+                for payload in payloads:
+                    task = _decode_task_message(payload)
+                    if task is not None:
+                        yield task
+
+
+def queue_depths() -> dict:
+    """
+    Messages waiting in each queue (not counting those already prefetched
+    by a worker), with the pool settings to compare against.
+    """
+    client = get_redis()
+    pipe = client.pipeline()
+    for name in QUEUE_NAMES:
+        for key in _queue_keys(name):
+            pipe.llen(key)
+    lengths = pipe.execute()
+
+    depths = {}
+    for index, name in enumerate(QUEUE_NAMES):
+        config = settings.celery_queue_config(name)
+        waiting = sum(lengths[index * len(PRIORITY_STEPS):(index + 1) * len(PRIORITY_STEPS)])
+        depths[name] = {
+            "waiting": waiting,
+            # Tasks per worker process before the backlog clears
+            "waiting_per_worker": round(waiting / config["concurrency"], 2),
+            **config,
+        }
+    return depths
@@ -0,0 +1,47 @@
+"""
+Start a Celery worker pool for one queue, sized from Settings.
+
+Usage: python -m app.tasks.worker <premium|free|retry|maintenance|all> [celery worker options]
+
+"all" consumes every queue in priority order (premium, retry, free,
+maintenance) with the premium pool settings, for deployments that run a
+single worker. Extra options are passed on to `celery worker` and override
+the ones derived from Settings.
+"""
+import sys
+
+from app.core.config import settings
+from app.tasks.celery_app import celery_app
+from app.tasks.queues import PREMIUM_QUEUE, QUEUE_NAMES
+
+
+def worker_argv(pool: str, extra: list) -> list:
+    """`celery worker` arguments for a pool."""
+    if pool == "all":
+        queues = ",".join(QUEUE_NAMES)
+        config = settings.celery_queue_config(PREMIUM_QUEUE)
+    elif pool in QUEUE_NAMES:
+        queues = pool
+        config = settings.celery_queue_config(pool)
+    else:
+        raise SystemExit(f"Unknown queue: {pool} (expected one of {', '.join(QUEUE_NAMES)} or all)")
+
+    return [
+        "worker",
+        f"--queues={queues}",
+        f"--hostname={pool}@%h",
+        f"--concurrency={config['concurrency']}",
+        f"--prefetch-multiplier={config['prefetch']}",
+        "--loglevel=info",
+        *extra,
+    ]
+
+
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    celery_app.worker_main(worker_argv(sys.argv[1], sys.argv[2:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Build compact WebP/JPEG variants of every design board.
+
+For each templates/<University>/<Level>/board.png this writes board.webp and
+board.jpg next to it, records them in templates/board_variants.csv, and prints
+a report of bytes saved per board and the aggregate request-size reduction.
+GenerationService.get_board_path serves the compact variant when it exists
+and falls back to board.png.
+
+Usage: python scripts/build_compact_boards.py [--templates_root templates] [--max_edge 1024]
+"""
+import argparse
+import csv
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+MANIFEST_NAME = "board_variants.csv"
+
+
+def encode_variant(image: Image.Image, fmt: str, quality: int) -> bytes:
+    """Encode a board in the given format."""
+    output = BytesIO()
+    if fmt == "WEBP":
+        image.save(output, format="WEBP", quality=quality, method=6)
+    else:
+        image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def build_variants(board_png: Path, max_edge: int, webp_quality: int, jpeg_quality: int) -> list[dict]:
+    """Write the compact variants for one board and return their manifest rows."""
+    image = Image.open(board_png)
+    image.load()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    original_bytes = board_png.stat().st_size
+    rows = []
+    for fmt, ext, quality in (("WEBP", ".webp", webp_quality), ("JPEG", ".jpg", jpeg_quality)):
+        data = encode_variant(image, fmt, quality)
+        out_path = board_png.with_suffix(ext)
+        out_path.write_bytes(data)
+        rows.append({
+            "university": board_png.parent.parent.name,
+            "level": board_png.parent.name,
+            "variant": out_path.name,
+            "format": fmt.lower(),
+            "quality": quality,
+            "width": image.width,
+            "height": image.height,
+            "bytes": len(data),
+            "original_bytes": original_bytes,
+        })
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--templates_root", default="templates", help="Folder with <University>/<Level>/board.png")
+    ap.add_argument("--max_edge", type=int, default=1024, help="Downscale boards to this long edge (pixels)")
+    ap.add_argument("--webp_quality", type=int, default=82)
+    ap.add_argument("--jpeg_quality", type=int, default=85)
+    ap.add_argument("--selfie_bytes", type=int, default=300_000,
+                    help="Typical normalised selfie size, used for the request-size estimate")
+    args = ap.parse_args()
+
+    root = Path(args.templates_root)
+    boards = sorted(root.glob("*/*/board.png"))
+    if not boards:
+        raise SystemExit(f"No boards found under {root}")
+
+    rows = []
+    for board_png in boards:
+        try:
+            rows.extend(build_variants(board_png, args.max_edge, args.webp_quality, args.jpeg_quality))
+        except Exception as e:
+            print(f"[warn] {board_png} failed: {e}")
+
+    manifest = root / MANIFEST_NAME
+    with open(manifest, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        w.writeheader()
+        w.writerows(rows)
+
+    # Report: best variant per board vs the original PNG
+    best = {}
+    for row in rows:
+        key = (row["university"], row["level"])
+        if key not in best or row["bytes"] < best[key]["bytes"]:
+            best[key] = row
+
+    print(f"{'Board':<60} {'PNG':>10} {'Best':>10} {'Saved':>7}")
+    for (uni, level), row in sorted(best.items()):
+        saved = 1 - row["bytes"] / row["original_bytes"]
+        print(f"{uni + ' / ' + level:<60} {row['original_bytes']:>10,} {row['bytes']:>10,} {saved:>6.1%}  {row['variant']}")
+
+    total_png = sum(r["original_bytes"] for r in best.values())
+    total_best = sum(r["bytes"] for r in best.values())
+    n = len(best)
+    avg_request_before = args.selfie_bytes + total_png / n
+    avg_request_after = args.selfie_bytes + total_best / n
+    print(f"\nBoards: {n}")
+    print(f"Board bytes: {total_png:,} -> {total_best:,} ({1 - total_best / total_png:.1%} saved)")
+    print(f"Avg request payload (selfie {args.selfie_bytes:,} B + board): "
+          f"{avg_request_before:,.0f} -> {avg_request_after:,.0f} B "
+          f"({1 - avg_request_after / avg_request_before:.1%} smaller)")
+    print(f"Manifest: {manifest}")
+
+
+if __name__ == "__main__":
+    main()
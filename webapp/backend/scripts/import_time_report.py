@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Report where startup time goes when importing the web app and the worker.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+each entry point (app.main for the API, app.tasks.celery_app for Celery) and
+prints the total import time, the slowest modules by cumulative time, and
+the time per top-level package. Run it from webapp/backend with the same
+environment as the service (settings are read at import).
+
+Usage: python scripts/import_time_report.py [--top 25] [module ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+DEFAULT_MODULES = ["app.main", "app.tasks.celery_app"]
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure(module: str) -> list[dict]:
+    """Import a module in a fresh interpreter and parse the -X importtime output."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise SystemExit(f"Importing {module} failed:\n{tail}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return rows
+
+
+def report(module: str, rows: list[dict], top: int) -> None:
+    """Print the breakdown for one entry point."""
+    root = next((r for r in rows if r["module"] == module), None)
+    total_us = root["cumulative_us"] if root else sum(r["self_us"] for r in rows)
+    print(f"\n=== {module}: {total_us / 1e6:.2f}s, {len(rows)} modules ===")
+
+    print(f"\nSlowest modules (cumulative, includes what they import):")
+    print(f"{'Module':<60} {'Cumulative':>11} {'Self':>9}")
+    for row in sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)[:top]:
+        name = "  " * row["depth"] + row["module"]
+        print(f"{name[:60]:<60} {row['cumulative_us'] / 1000:>9.1f}ms {row['self_us'] / 1000:>7.1f}ms")
+
+    # Self time summed per top-level package adds up to the total
+    packages = defaultdict(int)
+    for row in rows:
+        packages[row["module"].split(".")[0]] += row["self_us"]
+
+    print(f"\nBy top-level package (self time):")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        share = self_us / total_us if total_us else 0
+        print(f"{package:<60} {self_us / 1000:>9.1f}ms {share:>7.1%}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    ap.add_argument("--top", type=int, default=25, help="Rows per table")
+    args = ap.parse_args()
+
+    for module in args.modules:
+        report(module, measure(module), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Replay dead-lettered images in bulk, e.g. after a Gemini outage.
+
+Lists the dead-letter store, or regenerates its pending letters (oldest
+first) through retry_single_image on the retry queue, with at most
+--concurrency replays in flight and --rate dispatches per minute. The loop
+waits while the Gemini circuit breaker is open. Run it from webapp/backend
+with the same environment as the workers (it needs the database and the
+broker).
+
+Usage:
+    python scripts/replay_dead_letters.py --list
+    python scripts/replay_dead_letters.py [--limit 500] [--concurrency 10] [--rate 30]
+                                          [--error-type ServerError] [--id 12 --id 13] [--dry-run]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings  # noqa: E402
+from app.db.database import SessionLocal  # noqa: E402
+from app.services import dead_letters  # noqa: E402
+
+
+def print_summary(db) -> None:
+    """Print dead letters per status and error type."""
+    counts = dead_letters.summary(db)
+    if not counts:
+        print("No dead letters.")
+        return
+    for status, entry in sorted(counts.items()):
+        print(f"{status:<10} {entry['total']:>6}")
+        for error_type, count in sorted(entry["by_error_type"].items(), key=lambda item: -item[1]):
+            print(f"    {error_type:<40} {count:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay dead-lettered images in bulk")
+    parser.add_argument("--list", action="store_true", help="Only print the dead-letter counts")
+    parser.add_argument("--limit", type=int, default=100, help="Most letters to replay (default 100)")
+    parser.add_argument("--concurrency", type=int, default=settings.DEAD_LETTER_REPLAY_CONCURRENCY,
+                        help="Most replays in flight (default %(default)s)")
+    parser.add_argument("--rate", type=float, default=settings.DEAD_LETTER_REPLAY_RATE_PER_MINUTE,
+                        help="Most dispatches per minute (default %(default)s)")
+    parser.add_argument("--error-type", help="Only letters that failed with this exception class")
+    parser.add_argument("--id", type=int, action="append", dest="letter_ids", help="Only this letter (repeatable)")
+    parser.add_argument("--max-minutes", type=float, help="Stop after this long, leaving the rest pending")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the letters that would be replayed")
+    args = parser.parse_args()
+
+    if args.limit < 1 or args.concurrency < 1 or args.rate <= 0:
+        parser.error("--limit, --concurrency and --rate must be positive")
+
+    # Imported here: loading the tasks pulls in the generation stack
+    from app.tasks.maintenance_tasks import replay_dead_letters
+
+    db = SessionLocal()
+    try:
+        if args.list:
+            print_summary(db)
+            return
+
+        def on_replay(letter, task_id):
+            print(f"Replaying letter {letter.id} (image {letter.image_id}, {letter.error_type}) as task {task_id}",
+                  flush=True)
+
+        result = replay_dead_letters(
+            db, args.limit, args.concurrency, args.rate,
+            error_type=args.error_type,
+            letter_ids=args.letter_ids,
+            max_seconds=args.max_minutes * 60 if args.max_minutes else None,
+            dry_run=args.dry_run,
+            on_replay=on_replay
+        )
+
+        if args.dry_run:
+            print(f"Would replay {result['would_replay']} of {result['pending']} matching letters.")
+        else:
+            print(f"Replayed {len(result['replayed'])} letters, {result['pending']} still pending "
+                  f"(stopped: {result['stopped']}).")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Test setup: SQLite instead of Postgres, an in-process fake Redis (shared by
+the app's clients and the Celery broker) and the stub generation engine.
+Each test runs in its own directory, where local storage writes.
+"""
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="gradgen-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TMP_DIR}/test.db",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "SECRET_KEY": "test-secret",
+    "STRIPE_SECRET_KEY": "sk_test",
+    "STRIPE_PUBLISHABLE_KEY": "pk_test",
+    "STRIPE_WEBHOOK_SECRET": "whsec_test",
+    "STORAGE_TYPE": "local",
+    "STORAGE_OBJECT_CACHE_MAX_BYTES": "0",
+    "GENERATION_ENGINE": "stub",
+    "STUB_ENGINE_LATENCY_DISTRIBUTION": "fixed",
+    "STUB_ENGINE_LATENCY_SECONDS": "0",
+    "STUB_ENGINE_IMAGE_SIZE": "64x64",
+})
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+from kombu.transport import redis as kombu_redis  # noqa: E402
+
+REDIS_SERVER = fakeredis.FakeServer()
+
+_broker_connparams = kombu_redis.Channel._connparams
+
+
+def _fake_broker_connparams(self, asynchronous=False):
+    params = _broker_connparams(self, asynchronous)
+    params.update(connection_class=fakeredis.FakeRedisConnection, server=REDIS_SERVER)
+    return params
+
+
+# The Celery broker talks to the same fake Redis as the app
+kombu_redis.Channel._connparams = _fake_broker_connparams
+
+from PIL import Image  # noqa: E402
+
+from app.core import redis_client  # noqa: E402
+from app.db.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import GeneratedImage, GenerationJob, JobStatus, User  # noqa: E402
+from app.tasks.celery_app import celery_app  # noqa: E402
+
+celery_app.conf.result_backend = "cache+memory://"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    client = fakeredis.FakeRedis(server=REDIS_SERVER)
+    client.flushall()
+    monkeypatch.setattr(redis_client, "_client", client)
+    monkeypatch.setattr(redis_client, "_client_pid", os.getpid())
+    monkeypatch.setattr(redis_client, "_async_client", fakeredis.FakeAsyncRedis(server=REDIS_SERVER))
+    return client
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+    with engine.begin() as connection:
+        # SQLite does not enforce foreign keys here, so any order works
+        for table in Base.metadata.tables.values():
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def user(db):
+    user = User(email="student@example.com", full_name="Test Student")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def selfie(workdir, user):
+    """Object key of a stored selfie."""
+    object_key = f"uploads/{user.id}/selfie.jpg"
+    path = workdir / object_key
+    path.parent.mkdir(parents=True)
+    Image.new("RGB", (64, 64), "green").save(path, "JPEG")
+    return object_key
+
+
+@pytest.fixture
+def board(workdir):
+    path = workdir / "board.png"
+    Image.new("RGB", (64, 64), "navy").save(path, "PNG")
+    return path
+
+
+@pytest.fixture
+def make_tier_job(db, user, selfie, board):
+    """Factory of tier jobs with one image per prompt."""
+
+    def make(tier: str = "free", prompts: int = 3, status: JobStatus = JobStatus.PENDING, **fields) -> GenerationJob:
+        fields = {"completed_images": 0, "failed_images": 0, **fields}
+        job = GenerationJob(user_id=user.id, job_type="tier", tier=tier, is_watermarked=tier == "free",
+                            total_images=prompts, status=status, **fields)
+        db.add(job)
+        db.commit()
+        for index in range(prompts):
+            db.add(GeneratedImage(job_id=job.id, original_filename="selfie.jpg", input_image_path=selfie,
+                                  board_image_path=str(board), prompt_text=f"Prompt {index}"))
+        db.commit()
+        return job
+
+    return make
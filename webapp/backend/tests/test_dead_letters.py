@@ -0,0 +1,37 @@
+import pytest
+
+from app.models import DeadLetterStatus, GeneratedImage
+from app.services import dead_letters
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.gemini_retry import RetryableGenerationError, SafetyBlockedError
+from app.services.rate_limiter import RateLimitTimeout
+
+
+@pytest.mark.parametrize("error", [
+    RateLimitTimeout("No Gemini capacity within 300s"),
+    CircuitOpenError(retry_after=60),
+    RetryableGenerationError("503 overloaded"),
+])
+def test_overload_failures_are_replayable(error):
+    assert dead_letters.is_replayable(error)
+
+
+@pytest.mark.parametrize("error", [None, SafetyBlockedError("blocked"), ValueError("bad request")])
+def test_other_outcomes_are_not_replayable(error):
+    assert not dead_letters.is_replayable(error)
+
+
+def test_rate_limit_timeout_is_dead_lettered(db, make_tier_job):
+    job = make_tier_job(prompts=1)
+    image = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).one()
+    error = RateLimitTimeout("No Gemini capacity within 300s")
+    image.success = False
+    image.error_message = str(error)
+
+    letter = dead_letters.record_image_outcome(db, image, job, error, {"fingerprint": "f" * 64, "attempts": 1},
+                                               "stub", job.tier)
+    db.commit()
+
+    assert letter.status == DeadLetterStatus.PENDING
+    assert letter.error_type == "RateLimitTimeout"
+    assert dead_letters.summary(db)["pending"]["by_error_type"] == {"RateLimitTimeout": 1}
@@ -0,0 +1,47 @@
+import asyncio
+import contextlib
+import time
+
+import pytest
+
+from app.services.circuit_breaker import gemini_circuit_breaker
+from app.services.generation_service import generation_service
+from app.services.rate_limiter import RateLimitTimeout, gemini_rate_limiter
+
+
+@pytest.fixture
+def half_open(redis):
+    redis.set(gemini_circuit_breaker._key("open_until"), time.time() - 1)
+
+
+@pytest.fixture
+def no_capacity(monkeypatch):
+    @contextlib.contextmanager
+    def slot():
+        raise RateLimitTimeout("No Gemini capacity within 0s")
+        yield
+
+    @contextlib.asynccontextmanager
+    async def slot_async():
+        raise RateLimitTimeout("No Gemini capacity within 0s")
+        yield
+
+    monkeypatch.setattr(gemini_rate_limiter, "slot", slot)
+    monkeypatch.setattr(gemini_rate_limiter, "slot_async", slot_async)
+
+
+def test_probe_without_a_slot_is_released(redis, half_open, no_capacity):
+    with pytest.raises(RateLimitTimeout):
+        generation_service._call_gemini([])
+
+    assert redis.get(gemini_circuit_breaker._key("probe")) is None
+    # The next caller gets to probe, and the breaker was not re-opened
+    assert gemini_circuit_breaker.before_call() is True
+
+
+def test_async_probe_without_a_slot_is_released(redis, half_open, no_capacity):
+    with pytest.raises(RateLimitTimeout):
+        asyncio.run(generation_service._call_gemini_async([]))
+
+    assert redis.get(gemini_circuit_breaker._key("probe")) is None
+    assert gemini_circuit_breaker.before_call() is True
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+from celery.exceptions import Retry
+from PIL import Image
+
+from app.core.config import settings
+from app.models import GeneratedImage, GenerationJob, JobStatus
+from app.services.job_progress import reset_image_outcome
+from app.services.result_cache import generation_result_cache
+from app.services.storage_service import storage_service
+from app.tasks import generation_tasks
+from app.tasks.generation_tasks import (
+    process_tier_generation_async,
+    regenerate_unwatermarked_photos,
+    retry_single_image,
+)
+from app.tasks.queues import waiting_tasks
+
+
+def test_upgrade_regenerates_legacy_images_without_watermark(db, workdir, user, make_tier_job):
+    # Stored before unwatermarked originals were kept: only a watermarked output
+    job = make_tier_job(tier="free", prompts=2, status=JobStatus.COMPLETED, completed_images=2)
+    images = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).order_by(GeneratedImage.id).all()
+    for image in images:
+        image.success = True
+        image.output_image_path = f"results/{user.id}/legacy_{image.id}.png"
+        (workdir / image.output_image_path).parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (64, 64), "white").save(workdir / image.output_image_path)
+    db.commit()
+
+    result = regenerate_unwatermarked_photos(user.id)
+
+    assert result["photos_regenerated"] == 2
+    assert result["photos_failed"] == 0
+    assert result["jobs_updated"] == 1
+
+    db.expire_all()
+    assert db.get(GenerationJob, job.id).is_watermarked is False
+    for image in db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id):
+        assert image.output_image_path == f"results/{user.id}/unwatermarked_{job.id}_{image.id}.png"
+        assert image.output_image_path_unwatermarked == image.output_image_path
+        assert (workdir / image.output_image_path).exists()
+        # The watermarked original is deleted once nothing points at it
+        assert not (workdir / f"results/{user.id}/legacy_{image.id}.png").exists()
+
+        stage_seconds = json.loads(image.generation_metadata)["stage_seconds"]
+        assert {"download", "build_request", "gemini", "upload"} <= set(stage_seconds)
+
+
+def test_upgrade_promotes_stored_originals_without_generating(db, user, make_tier_job):
+    job = make_tier_job(tier="free", prompts=1, status=JobStatus.COMPLETED, completed_images=1)
+    image = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).one()
+    image.success = True
+    image.output_image_path = f"results/{user.id}/watermarked_{job.id}_{image.id}.png"
+    image.output_image_path_unwatermarked = f"results/{user.id}/unwatermarked_{job.id}_{image.id}.png"
+    db.commit()
+
+    result = regenerate_unwatermarked_photos(user.id)
+
+    assert result["photos_promoted"] == 1
+    assert result["photos_regenerated"] == 0
+    db.expire_all()
+    image = db.get(GeneratedImage, image.id)
+    assert image.output_image_path == image.output_image_path_unwatermarked
+    assert image.generation_metadata is None
+
+
+def test_retry_reuses_a_result_whose_upload_failed(db, monkeypatch, make_tier_job):
+    job = make_tier_job(tier="premium", prompts=1, status=JobStatus.PROCESSING)
+    image = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).one()
+    upload_bytes = storage_service.upload_bytes
+
+    def failing_upload(data, object_key, *args, **kwargs):
+        if object_key.startswith("results/"):
+            raise OSError("storage unavailable")
+        return upload_bytes(data, object_key, *args, **kwargs)
+
+    monkeypatch.setattr(storage_service, "upload_bytes", failing_upload)
+    retry_single_image(image.id)
+    assert generation_result_cache.stats()["entries"] == 1
+
+    # What the /retry endpoint does before queueing the retry
+    db.expire_all()
+    reset_image_outcome(db, db.get(GeneratedImage, image.id), db.get(GenerationJob, job.id))
+    db.commit()
+    monkeypatch.setattr(storage_service, "upload_bytes", upload_bytes)
+    retry_single_image(image.id)
+
+    assert generation_result_cache.stats()["hits"] == 1
+    db.expire_all()
+    assert db.get(GeneratedImage, image.id).success is True
+
+
+def test_stored_results_are_not_cached(db, make_tier_job):
+    job = make_tier_job(tier="premium", prompts=1, status=JobStatus.PROCESSING)
+    image = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).one()
+
+    retry_single_image(image.id)
+
+    assert generation_result_cache.stats()["entries"] == 0
+
+
+def test_promoted_watermarked_objects_are_deleted_before_parking(db, workdir, monkeypatch, user, make_tier_job):
+    job = make_tier_job(tier="free", prompts=2, status=JobStatus.COMPLETED, completed_images=2)
+    promoted, legacy = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).order_by(GeneratedImage.id)
+    for image in (promoted, legacy):
+        image.success = True
+        image.output_image_path = f"results/{user.id}/watermarked_{job.id}_{image.id}.png"
+        (workdir / image.output_image_path).parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (64, 64), "white").save(workdir / image.output_image_path)
+    promoted.output_image_path_unwatermarked = f"results/{user.id}/unwatermarked_{job.id}_{promoted.id}.png"
+    db.commit()
+    watermarked_path = workdir / promoted.output_image_path
+
+    def park(task):
+        raise Retry()
+
+    monkeypatch.setattr(generation_tasks, "_park_if_gemini_down", park)
+    with pytest.raises(Retry):
+        regenerate_unwatermarked_photos(user.id)
+
+    assert not watermarked_path.exists()
+
+
+def test_async_chord_members_run_on_the_task_thread(db, monkeypatch, make_tier_job):
+    monkeypatch.setattr(settings, "TIER_JOB_CHORD_ENABLED", True)
+    job = make_tier_job(tier="premium", prompts=2)
+    image_ids = sorted(image.id for image in db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id))
+
+    process_tier_generation_async(job.id)
+
+    members = [args for name, args in waiting_tasks() if name.endswith("generate_tier_image")]
+    assert sorted(members) == [[image_id] for image_id in image_ids]
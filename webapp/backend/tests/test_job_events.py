@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.security import create_access_token, create_stream_token
+from app.main import app
+from app.models import GenerationJob, JobStatus, User
+
+EVENTS_URL = "/api/generation/jobs/{job_id}/events"
+TOKEN_URL = "/api/generation/jobs/{job_id}/events/token"
+
+
+@pytest.fixture
+def client():
+    # Without the context manager: no lifespan, the board catalog is not needed
+    return TestClient(app)
+
+
+@pytest.fixture
+def auth(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+
+@pytest.fixture
+def job(make_tier_job):
+    return make_tier_job(status=JobStatus.COMPLETED, completed_images=3)
+
+
+def first_event(response) -> dict:
+    for line in response.iter_lines():
+        if line.startswith("data: "):
+            return json.loads(line.removeprefix("data: "))
+    raise AssertionError("no event in the stream")
+
+
+def test_stream_token_opens_the_job_stream(client, auth, job):
+    response = client.post(TOKEN_URL.format(job_id=job.id), headers=auth)
+    assert response.status_code == 200
+    stream_token = response.json()["stream_token"]
+
+    with client.stream("GET", EVENTS_URL.format(job_id=job.id), params={"stream_token": stream_token}) as stream:
+        assert stream.status_code == 200
+        event = first_event(stream)
+
+    assert event["job_id"] == job.id
+    assert event["status"] == JobStatus.COMPLETED.value
+    assert "user_id" not in event
+
+
+def test_stream_token_is_scoped_to_its_job(client, auth, user, job, make_tier_job):
+    other_job = make_tier_job(status=JobStatus.COMPLETED)
+    stream_token = create_stream_token(user.id, other_job.id)
+
+    response = client.get(EVENTS_URL.format(job_id=job.id), params={"stream_token": stream_token})
+
+    assert response.status_code == 401
+
+
+def test_stream_token_is_not_an_access_token(client, user, job):
+    stream_token = create_stream_token(user.id, job.id)
+
+    response = client.get(f"/api/generation/jobs/{job.id}/status",
+                          headers={"Authorization": f"Bearer {stream_token}"})
+
+    assert response.status_code == 401
+
+
+def test_access_token_is_not_accepted_in_the_url(client, user, job):
+    access_token = create_access_token({"sub": str(user.id)})
+
+    for params in ({"access_token": access_token}, {"stream_token": access_token}):
+        response = client.get(EVENTS_URL.format(job_id=job.id), params=params)
+        assert response.status_code == 401
+
+
+def test_no_stream_token_for_another_users_job(client, db, job):
+    stranger = User(email="stranger@example.com")
+    db.add(stranger)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(stranger.id)})}"}
+
+    response = client.post(TOKEN_URL.format(job_id=job.id), headers=headers)
+
+    assert response.status_code == 404
+
+
+def test_stream_token_for_a_missing_job_is_refused(client, auth):
+    response = client.post(TOKEN_URL.format(job_id=999999), headers=auth)
+
+    assert response.status_code == 404
+
+
+def test_stream_still_accepts_the_authorization_header(client, auth, job, db):
+    with client.stream("GET", EVENTS_URL.format(job_id=job.id), headers=auth) as stream:
+        assert stream.status_code == 200
+        assert first_event(stream)["completed_images"] == db.get(GenerationJob, job.id).completed_images
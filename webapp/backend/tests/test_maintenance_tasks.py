@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models import GeneratedImage, GenerationJob, JobStatus
+from app.tasks import maintenance_tasks
+from app.tasks.celery_app import celery_app
+from app.tasks.generation_tasks import generate_tier_image
+from app.tasks.queues import tier_queue_options, waiting_tasks
+
+
+class IdleWorkers:
+    """Inspector of a worker fleet that answers, with nothing running or prefetched."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def active(self):
+        return {"worker@host": []}
+
+    reserved = scheduled = active
+
+
+@pytest.fixture(autouse=True)
+def idle_workers(monkeypatch):
+    monkeypatch.setattr(celery_app.control, "inspect", IdleWorkers)
+
+
+def make_stale(db, job: GenerationJob) -> None:
+    db.query(GenerationJob).filter(GenerationJob.id == job.id).update(
+        {GenerationJob.updated_at: datetime.now(timezone.utc) - timedelta(hours=2)}
+    )
+    db.commit()
+
+
+def test_reaper_leaves_job_with_queued_chord_members_alone(db, make_tier_job):
+    # Dispatched at peak load: PROCESSING, members still waiting in the queue
+    job = make_tier_job(status=JobStatus.PROCESSING)
+    images = db.query(GeneratedImage).filter(GeneratedImage.job_id == job.id).all()
+    for image in images:
+        generate_tier_image.apply_async((image.id,), **tier_queue_options(job.tier))
+    make_stale(db, job)
+
+    result = maintenance_tasks.reap_stale_jobs()
+
+    assert result["stale"] == 1
+    assert result["requeued"] == [] and result["failed"] == []
+    db.expire_all()
+    assert db.get(GenerationJob, job.id).status == JobStatus.PROCESSING
+    assert sorted(args[0] for name, args in waiting_tasks()) == sorted(image.id for image in images)
+
+
+def test_reaper_requeues_job_with_no_task_anywhere(db, redis, make_tier_job):
+    job = make_tier_job(status=JobStatus.PROCESSING)
+    make_stale(db, job)
+
+    result = maintenance_tasks.reap_stale_jobs()
+
+    assert result["requeued"] == [job.id]
+    assert int(redis.get(maintenance_tasks.REQUEUE_COUNT_KEY.format(job_id=job.id))) == 1
+    assert [(name.rsplit(".", 1)[-1], args) for name, args in waiting_tasks()] == [
+        ("process_tier_generation", [job.id])
+    ]
+
+
+def test_reaper_skips_when_no_worker_answers(db, monkeypatch, make_tier_job):
+    monkeypatch.setattr(IdleWorkers, "active", lambda self: None)
+    monkeypatch.setattr(IdleWorkers, "reserved", lambda self: None)
+    monkeypatch.setattr(IdleWorkers, "scheduled", lambda self: None)
+    job = make_tier_job(status=JobStatus.PROCESSING)
+    make_stale(db, job)
+
+    result = maintenance_tasks.reap_stale_jobs()
+
+    assert result["skipped"] is True
+    assert result["requeued"] == []
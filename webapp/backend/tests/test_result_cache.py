@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.result_cache import generation_result_cache as cache
+
+
+@pytest.fixture(autouse=True)
+def small_budget(monkeypatch):
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_BYTES", 100)
+
+
+def test_put_evicts_least_recently_used_until_within_budget(workdir):
+    for name in ("a", "b", "c"):
+        cache.put(name, b"x" * 40)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == cache.get("c") == b"x" * 40
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 80, 1)
+    assert not (workdir / "cache/a.png").exists()
+
+
+def test_replacing_an_entry_counts_its_bytes_once():
+    cache.put("a", b"x" * 40)
+    cache.put("a", b"x" * 60)
+
+    assert cache.stats()["bytes"] == 60
+
+
+def test_expired_entries_are_dropped(monkeypatch, redis):
+    cache.put("old", b"x" * 10)
+    redis.zadd(cache._key("lru"), {"old": time.time() - settings.RESULT_CACHE_TTL_SECONDS - 1})
+
+    cache.put("new", b"x" * 10)
+
+    assert redis.zscore(cache._key("lru"), "old") is None
+    assert cache.stats()["bytes"] == 10
+
+
+def test_byte_total_is_seeded_from_existing_entries(redis):
+    cache.put("a", b"x" * 40)
+    redis.delete(cache._key("bytes"))
+
+    cache.put("b", b"x" * 30)
+
+    assert cache.stats()["bytes"] == 70